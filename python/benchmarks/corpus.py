@@ -0,0 +1,121 @@
+"""Markdown corpora of a given size for the benchmark suite, see suite.py.
+
+A corpus repeats its blocks up to the size and cuts at a line end, the same
+size gives the same bytes on every run.
+"""
+
+from typing import Callable, Dict, Iterator, List
+import pathlib
+
+ROOT = pathlib.Path(__file__).absolute().parent.parent
+
+SIZES = {
+    "1KB": 1024,
+    "10KB": 10 * 1024,
+    "100KB": 100 * 1024,
+    "1MB": 1024 * 1024,
+    "10MB": 10 * 1024 * 1024,
+}
+
+MIXED = """# part {i}
+
+Some *emphasis*, **strong** and `code` with [a link](other.md#part-{i}),
+an autolink <https://example.com/{i}> and a [reference][ref-{i}].
+
+## chapter {i}
+
+- item {i}
+- [ ] task
+  1. ordered
+  2. `inline`
+
+> a quote
+> with **more**
+
+```json
+{{"key": {i}, "list": [1, 2, 3]}}
+```
+
+```python
+def f(x):
+    return x + {i}
+```
+
+| a | b |
+|---|---|
+| {i} | *x* |
+
+[ref-{i}]: https://example.com/ref/{i}
+
+"""
+
+NON_ASCII = """# 第{i}章 マークダウンの構文 🎉
+
+日本語の段落です。*強調*と**太字**、`コード`と[リンク](他の文書.md#第{i}章)を含む。
+絵文字 😀👍🏽 はサロゲートペアになる。Ελληνικά, русский, 한국어, العربية.
+
+## 節{i}：見出し
+
+- 項目{i}：説明文
+- 𠮷野家（サロゲートペア）
+  - 入れ子の項目 ✅
+
+> 引用文の**強調** {i}
+
+| 列 | 値 |
+|---|---|
+| 名前 | 値{i} |
+
+"""
+
+
+def _nested(i: int) -> str:
+    depth = 10 + i % 40
+    lines = [f"# nested {i}", ""]
+    lines += ["  " * level + f"- level {level} *x*" for level in range(depth)]
+    lines.append("")
+    lines += ["> " * level + f"quote {level}" for level in range(1, depth)]
+    lines.append("")
+    lines.append("*" * 4 + "__" * 8 + f"deep {i}" + "__" * 8 + "*" * 4)
+    lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+def _repeat(block: Callable[[int], str]) -> Iterator[str]:
+    i = 0
+    while True:
+        yield block(i)
+        i += 1
+
+
+def _docs() -> List[str]:
+    """The markdown files of the repository, real-world text in Japanese."""
+    paths = sorted((ROOT / "docs").glob("**/*.md")) + [ROOT.parent / "README.md"]
+    return [path.read_text(encoding="utf-8") + "\n" for path in paths]
+
+
+def _cycle(texts: List[str]) -> Callable[[int], str]:
+    return lambda i: texts[i % len(texts)]
+
+
+CORPORA: Dict[str, Callable[[], Callable[[int], str]]] = {
+    "mixed": lambda: lambda i: MIXED.format(i=i),
+    "nested": lambda: _nested,
+    "non_ascii": lambda: lambda i: NON_ASCII.format(i=i),
+    "docs": lambda: _cycle(_docs()),
+}
+
+
+def corpus(name: str, size: int) -> bytes:
+    """About size bytes of the corpus, whole lines."""
+    chunks = []
+    total = 0
+    for block in _repeat(CORPORA[name]()):
+        encoded = block.encode("utf-8")
+        chunks.append(encoded)
+        total += len(encoded)
+        if total >= size:
+            break
+    src = b"".join(chunks)[:size]
+    end = src.rfind(b"\n") + 1
+    return src[:end] if end else src.decode("utf-8", "ignore").encode("utf-8")
@@ -0,0 +1,75 @@
+"""Outline of a large document: all sections vs with the cached sections of
+the previous version, after an edit in a line of one section and after
+inserting a line, which moves the sections below it.
+
+> python -m benchmarks.outline
+"""
+
+import timeit
+from tentiris.documents import DocumentTree
+from tentiris.outline import Outliner
+from tentiris.parser_pool import treesitter_parse
+
+NUMBER = 3
+REPEAT = 3
+
+SECTIONS = """# part {i}
+
+text {i}
+
+## chapter {i}
+
+- a
+- b
+
+```
+code {i}
+```
+
+### section {i}
+
+> quote
+
+"""
+
+
+def best(f) -> float:
+    """Best time per call in milliseconds."""
+    return min(timeit.repeat(f, number=NUMBER, repeat=REPEAT)) / NUMBER * 1e3
+
+
+def main():
+    src = "".join(SECTIONS.format(i=i) for i in range(3000)).encode()
+    document = DocumentTree("file:///bench.md", 1, src, treesitter_parse)
+    edited = DocumentTree(
+        "file:///bench.md",
+        2,
+        src.replace(b"text 1500\n", b"text 1500 edited\n"),
+        treesitter_parse,
+    )
+    inserted = DocumentTree(
+        "file:///bench.md",
+        3,
+        src.replace(b"text 1500\n", b"text 1500\ninserted\n"),
+        treesitter_parse,
+    )
+    outliner = Outliner()
+    outline = outliner.outline(document)
+    all_sections = best(lambda: Outliner().outline(document))
+
+    def edit(edited: DocumentTree):
+        outliner.outline(document)
+        outliner.outline(edited)
+
+    after_edit = best(lambda: edit(edited)) / 2
+    after_insert = best(lambda: edit(inserted)) / 2
+    print(
+        f"outline({len(document.line_offsets)} lines, "
+        f"{len(outline.folding_ranges)} folding ranges): "
+        f"all sections {all_sections:.1f}ms, after an edit {after_edit:.1f}ms, "
+        f"after inserting a line {after_insert:.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Per-call overhead of a new tree_sitter.Parser per parse vs ParserPool.
+
+> python -m benchmarks.parser_pool
+"""
+
+import timeit
+import tree_sitter
+from tentiris.parser_pool import ParserPool, load_language
+
+NUMBER = 5000
+REPEAT = 5
+
+SOURCES = {
+    "tiny": b"# title\n",
+    "small": b"# title\n\nsome *text*\n\n- a\n- b\n" * 10,
+}
+
+
+def parse_new_parser(utf8_bytes: bytes) -> tree_sitter.Tree:
+    parser = tree_sitter.Parser()
+    parser.set_language(load_language("markdown"))
+    return parser.parse(utf8_bytes)
+
+
+def best(f) -> float:
+    """Best time per call in microseconds."""
+    return min(timeit.repeat(f, number=NUMBER, repeat=REPEAT)) / NUMBER * 1e6
+
+
+def main():
+    pool = ParserPool("markdown")
+    for name, src in SOURCES.items():
+        new_parser = best(lambda: parse_new_parser(src))
+        pooled = best(lambda: pool.parse(src))
+        with_timeout = best(lambda: pool.parse(src, timeout=10.0))
+        print(
+            f"{name:>6}({len(src)} bytes): "
+            f"new parser {new_parser:.2f}us, "
+            f"pooled {pooled:.2f}us ({new_parser - pooled:.2f}us saved per call), "
+            f"pooled with timeout {with_timeout:.2f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
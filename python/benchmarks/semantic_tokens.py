@@ -0,0 +1,108 @@
+"""Encoding 100k semantic tokens: the former list encoder vs SemanticTokensEncoder,
+and highlighting a large document: all blocks vs with the cached blocks of the
+previous version, after an edit of one block.
+
+> python -m benchmarks.semantic_tokens
+"""
+
+from typing import List, Optional
+import timeit
+from tentiris.documents import DocumentTree
+from tentiris.parser_pool import treesitter_parse
+from tentiris.semantic_tokens import Highlighter, SemanticToken, SemanticTokensEncoder
+
+NUMBER = 3
+REPEAT = 3
+
+TOKEN_TYPES = ["namespace", "type", "struct", "property", "keyword"]
+LINES = 50000
+BLOCKS = """# title *{i}*
+
+some *text* {i} with `code` and [a link](http://example.com)
+> quote **{i}**
+> more
+
+- [ ] {i}
+- b
+
+| a | b |
+|---|---|
+| 1 | {i} |
+
+```
+code {i}
+```
+
+"""
+
+
+def list_encoder(tokens: List[SemanticToken], token_types: List[str]) -> List[int]:
+    """The former to_relative, with byte columns."""
+    data = []
+    last: Optional[SemanticToken] = None
+    for token in tokens:
+        deltaLine = token.start[0]
+        deltaStart = token.start[1]
+        if last:
+            deltaLine -= last.start[0]
+            if deltaLine == 0:
+                deltaStart -= last.start[1]
+        data += [
+            deltaLine,
+            deltaStart,
+            token.byte_len,
+            token_types.index(token.type),
+            0,
+        ]
+        last = token
+    return data
+
+
+def best(f) -> float:
+    """Best time per call in milliseconds."""
+    return min(timeit.repeat(f, number=NUMBER, repeat=REPEAT)) / NUMBER * 1e3
+
+
+def main():
+    for name, line in (
+        ("ascii", "- item *em* text"),
+        ("japanese", "- 項目 *強調* 本文"),
+    ):
+        src = "".join(f"{line}\n" for _ in range(LINES)).encode()
+        document = DocumentTree("file:///bench.md", 1, src, treesitter_parse)
+        width = len(line.encode()) - 4
+        tokens = []
+        for row in range(LINES):
+            tokens.append(SemanticToken((row, 0), 1, "keyword", []))
+            tokens.append(SemanticToken((row, 2), width, "property", []))
+        encoder = SemanticTokensEncoder(TOKEN_TYPES)
+        before = best(lambda: list_encoder(tokens, TOKEN_TYPES))
+        after = best(lambda: encoder.encode(tokens, document))
+        print(
+            f"{name:>8}({len(tokens)} tokens): "
+            f"list encoder {before:.1f}ms, "
+            f"SemanticTokensEncoder {after:.1f}ms"
+        )
+
+    src = "".join(BLOCKS.format(i=i) for i in range(2000)).encode()
+    document = DocumentTree("file:///bench.md", 1, src, treesitter_parse)
+    edited = DocumentTree(
+        "file:///bench.md", 2, src.replace(b"*0*", b"*edited*"), treesitter_parse
+    )
+    highlighter = Highlighter()
+    tokens = highlighter.tokens(document)
+    all_blocks = best(lambda: Highlighter().tokens(document))
+
+    def edit():
+        highlighter.tokens(document)
+        highlighter.tokens(edited)
+
+    after_edit = best(edit) / 2
+    print(
+        f"highlight({len(document.line_offsets)} lines, {len(tokens)} tokens): "
+        f"all blocks {all_blocks:.1f}ms, after an edit {after_edit:.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
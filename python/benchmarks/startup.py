@@ -0,0 +1,118 @@
+"""Server startup: process spawn -> initialize response, and -> the first
+semantic tokens of a document, which loads the grammars.
+
+The server runs in a temporary working directory, the grammars are found
+next to the package.
+
+> python -m benchmarks.startup
+"""
+
+from typing import Any, Dict, IO, List
+import json
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPEAT = 5
+
+ROOT = pathlib.Path(__file__).absolute().parent.parent
+URI = "file:///startup.md"
+TEXT = "# title\n\nsome *text* and `code`\n\n```json\n{}\n```\n"
+
+
+def send(stdin: IO[bytes], message: Dict[str, Any]):
+    body = json.dumps({"jsonrpc": "2.0", **message}).encode()
+    stdin.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+    stdin.flush()
+
+
+def receive(stdout: IO[bytes], id: int) -> Dict[str, Any]:
+    """Skip notifications and requests until the response of id."""
+    while True:
+        length = 0
+        while True:
+            line = stdout.readline()
+            if not line:
+                raise EOFError("server exited")
+            line = line.strip()
+            if not line:
+                break
+            name, value = line.split(b":", 1)
+            if name.lower() == b"content-length":
+                length = int(value)
+        message = json.loads(stdout.read(length))
+        if message.get("id") == id and "method" not in message:
+            return message
+
+
+def startup(cwd: str) -> List[float]:
+    """Seconds from spawn to the initialize response and to the first tokens."""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-W", "ignore", "-m", "tentiris"],
+        cwd=cwd,
+        env={**os.environ, "PYTHONPATH": str(ROOT)},
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    assert process.stdin and process.stdout
+    try:
+        send(
+            process.stdin,
+            {
+                "id": 1,
+                "method": "initialize",
+                "params": {"processId": None, "rootUri": None, "capabilities": {}},
+            },
+        )
+        receive(process.stdout, 1)
+        initialized = time.perf_counter() - start
+
+        send(process.stdin, {"method": "initialized", "params": {}})
+        send(
+            process.stdin,
+            {
+                "method": "textDocument/didOpen",
+                "params": {
+                    "textDocument": {
+                        "uri": URI,
+                        "languageId": "markdown",
+                        "version": 1,
+                        "text": TEXT,
+                    }
+                },
+            },
+        )
+        send(
+            process.stdin,
+            {
+                "id": 2,
+                "method": "textDocument/semanticTokens/full",
+                "params": {"textDocument": {"uri": URI}},
+            },
+        )
+        receive(process.stdout, 2)
+        tokens = time.perf_counter() - start
+    finally:
+        process.kill()
+        process.wait()
+    return [initialized, tokens]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as cwd:
+        runs = [startup(cwd) for _ in range(REPEAT)]
+    for i, name in enumerate(("initialize", "first semantic tokens")):
+        times = [run[i] * 1e3 for run in runs]
+        print(
+            f"{name:>21}: min {min(times):.0f}ms, median {statistics.median(times):.0f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""The hot paths on corpora from 1KB to 10MB, results as JSON to diff
+between commits.
+
+Times treesitter_parse, semantic_tokens_from_utf8bytes, to_relative, the
+node lookup of completions and _validate on each corpus of corpus.py, then
+replays an editing session of a fake client through the handlers:
+keystrokes as incremental didChange, semantic tokens after each of them,
+a completion in a link and the outline now and then. validation_settled
+is the wait for the diagnostics after the last keystroke, the debounce of
+ValidationScheduler included.
+
+> python -m benchmarks.suite --quick
+> python -m benchmarks.suite --compare benchmarks/results/BASE.json
+
+The results go to benchmarks/results/<git describe>.json unless --out.
+"""
+
+from typing import Any, Callable, Dict, List
+import argparse
+import asyncio
+import json
+import pathlib
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import lsprotocol.types as lsp_types
+from tentiris import features
+from tentiris.completion import completion_context, line_prefix
+from tentiris.documents import DocumentTree, iter_ancestors
+from tentiris.parser_pool import treesitter_parse
+from tentiris.semantic_tokens import (
+    TOKEN_MODIFIERS,
+    TOKEN_TYPES,
+    Highlighter,
+    semantic_tokens_from_utf8bytes,
+    to_relative,
+)
+from tests.fake_server import FakeServer
+from .corpus import CORPORA, ROOT, SIZES, corpus
+
+# runs of a benchmark, fewer once they took this long
+REPEAT = 5
+MAX_SECONDS = 3.0
+# node lookups per run of the completion benchmark
+LOOKUPS = 200
+# characters typed in an editing session
+KEYSTROKES = 60
+SESSION_SIZES = ["10KB", "100KB", "1MB"]
+QUICK_SIZES = ["1KB", "10KB", "100KB"]
+
+# a slower median than the base by this factor is a regression
+THRESHOLD = 1.2
+
+Result = Dict[str, Any]
+
+
+def measure(f: Callable[[], Any]) -> Result:
+    """Milliseconds of REPEAT runs, or of the runs within MAX_SECONDS."""
+    times: List[float] = []
+    while len(times) < REPEAT and (not times or sum(times) < MAX_SECONDS):
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    return {
+        "runs": len(times),
+        "min_ms": min(times) * 1e3,
+        "median_ms": statistics.median(times) * 1e3,
+    }
+
+
+def latencies(times: List[float]) -> Result:
+    ordered = sorted(times)
+    return {
+        "runs": len(ordered),
+        "median_ms": statistics.median(ordered) * 1e3,
+        "p95_ms": ordered[min(len(ordered) - 1, len(ordered) * 95 // 100)] * 1e3,
+        "max_ms": ordered[-1] * 1e3,
+    }
+
+
+def _document(src: bytes, uri: str = "untitled:bench.md") -> DocumentTree:
+    document = DocumentTree(uri, 1, src, treesitter_parse)
+    # parsed before timing
+    assert document.tree
+    return document
+
+
+def hot_paths(name: str, size: str) -> Dict[str, Result]:
+    src = corpus(name, SIZES[size])
+    document = _document(src)
+    tokens = Highlighter().tokens(document)
+    rng = random.Random(0)
+    positions = [
+        lsp_types.Position(
+            line=rng.randrange(len(document.line_offsets)),
+            character=rng.randrange(40),
+        )
+        for _ in range(LOOKUPS)
+    ]
+
+    def lookup():
+        for position in positions:
+            for node in iter_ancestors(document.node_at(position)):
+                pass
+            completion_context(line_prefix(document, position))
+
+    def validate():
+        # the block cache of the previous run would make it an edit
+        features.MARKDOWN_DIAGNOSTICS.release(document.key)
+        features._validate(document, lambda: False)
+
+    benchmarks = {
+        "parse": lambda: treesitter_parse(src),
+        "semantic_tokens": lambda: semantic_tokens_from_utf8bytes(src),
+        "to_relative": lambda: to_relative(
+            tokens, TOKEN_TYPES, document, TOKEN_MODIFIERS
+        ),
+        "completion_lookup": lookup,
+        "validate": validate,
+    }
+    results = {}
+    for benchmark, f in benchmarks.items():
+        result = measure(f)
+        result["bytes"] = len(src)
+        if benchmark == "completion_lookup":
+            result["lookups"] = LOOKUPS
+        results[f"{benchmark}/{name}/{size}"] = result
+    features.MARKDOWN_DIAGNOSTICS.release(document.key)
+    return results
+
+
+class FakeClient:
+    """Sends what an editor sends while typing, timing each handler."""
+
+    def __init__(self, ls: FakeServer, uri: str):
+        self.ls = ls
+        self.uri = uri
+        self.version = 0
+        self.times: Dict[str, List[float]] = {}
+
+    def _time(self, method: str, f: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        result = f()
+        self.times.setdefault(method, []).append(time.perf_counter() - start)
+        return result
+
+    def open(self, text: str) -> None:
+        self.version = 1
+        item = lsp_types.TextDocumentItem(
+            uri=self.uri, language_id="markdown", version=1, text=text
+        )
+        self.ls.workspace.put_document(item)
+        self._time(
+            "didOpen",
+            lambda: features.did_open(
+                self.ls, lsp_types.DidOpenTextDocumentParams(text_document=item)
+            ),
+        )
+
+    def type(self, position: lsp_types.Position, text: str) -> None:
+        self.version += 1
+        text_document = lsp_types.VersionedTextDocumentIdentifier(
+            uri=self.uri, version=self.version
+        )
+        change = lsp_types.TextDocumentContentChangeEvent_Type1(
+            range=lsp_types.Range(start=position, end=position), text=text
+        )
+        self.ls.workspace.update_document(text_document, change)
+        self._time(
+            "didChange",
+            lambda: features.did_change(
+                self.ls,
+                lsp_types.DidChangeTextDocumentParams(
+                    text_document=text_document, content_changes=[change]
+                ),
+            ),
+        )
+
+    def request(self, method: str, handler, params) -> Any:
+        return self._time(method, lambda: handler(self.ls, params))
+
+    def close(self) -> None:
+        features.did_close(
+            self.ls,
+            lsp_types.DidCloseTextDocumentParams(
+                text_document=lsp_types.TextDocumentIdentifier(uri=self.uri)
+            ),
+        )
+
+
+async def _edit_session(src: bytes, executor: ThreadPoolExecutor) -> Dict[str, Any]:
+    ls = FakeServer(executor=executor)
+    client = FakeClient(ls, "untitled:session.md")
+    text = src.decode("utf-8")
+    client.open(text)
+    document = client.ls.workspace.get_document(client.uri)
+    text_document = lsp_types.TextDocumentIdentifier(uri=client.uri)
+    # a new paragraph in the middle of the document
+    line = len(document.lines) // 2
+    client.type(lsp_types.Position(line=line, character=0), "\n\n")
+    line += 1
+    typed = ("see [the part](#part-1) " * (KEYSTROKES // 24 + 1))[:KEYSTROKES]
+    result_id = client.request(
+        "semanticTokens/full",
+        features.semantic_tokens,
+        lsp_types.SemanticTokensParams(text_document=text_document),
+    ).result_id
+    for character, c in enumerate(typed):
+        client.type(lsp_types.Position(line=line, character=character), c)
+        position = lsp_types.Position(line=line, character=character + 1)
+        result_id = client.request(
+            "semanticTokens/full/delta",
+            features.semantic_tokens_delta,
+            lsp_types.SemanticTokensDeltaParams(
+                text_document=text_document, previous_result_id=result_id
+            ),
+        ).result_id
+        if c == "#":
+            client.request(
+                "completion",
+                features.completions,
+                lsp_types.CompletionParams(
+                    text_document=text_document, position=position
+                ),
+            )
+        if character % 10 == 9:
+            client.request(
+                "documentSymbol",
+                features.document_symbol,
+                lsp_types.DocumentSymbolParams(text_document=text_document),
+            )
+            client.request(
+                "foldingRange",
+                features.folding_range,
+                lsp_types.FoldingRangeParams(text_document=text_document),
+            )
+    # the debounced validation of the last version
+    start = time.perf_counter()
+    task = features.VALIDATION.tasks.get(client.uri)
+    if task:
+        await asyncio.gather(task, return_exceptions=True)
+    settled = time.perf_counter() - start
+    client.close()
+    return {
+        **{method: latencies(times) for method, times in client.times.items()},
+        "validation_settled": {"runs": 1, "median_ms": settled * 1e3},
+        "published": len(ls.published),
+    }
+
+
+def edit_session(name: str, size: str) -> Dict[str, Result]:
+    src = corpus(name, SIZES[size])
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        session = asyncio.run(_edit_session(src, executor))
+    published = session.pop("published")
+    results = {}
+    for method, result in session.items():
+        result["bytes"] = len(src)
+        results[f"session/{name}/{size}/{method}"] = result
+    results[f"session/{name}/{size}/validation_settled"]["published"] = published
+    return results
+
+
+def describe() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(base: Dict[str, Any], results: Dict[str, Any], threshold: float) -> int:
+    """Print the ratio of the medians, return the number of regressions."""
+    regressions = 0
+    base_results = base["results"]
+    for key, result in results["results"].items():
+        previous = base_results.get(key)
+        if not previous or not previous.get("median_ms"):
+            continue
+        ratio = result["median_ms"] / previous["median_ms"]
+        mark = ""
+        if ratio > threshold:
+            mark = "  REGRESSION"
+            regressions += 1
+        elif ratio < 1 / threshold:
+            mark = "  faster"
+        print(
+            f"{key:<48} {previous['median_ms']:>10.2f} -> "
+            f"{result['median_ms']:>10.2f}ms  x{ratio:.2f}{mark}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument(
+        "--corpora", nargs="+", choices=list(CORPORA), default=list(CORPORA)
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help=f"sizes {', '.join(QUICK_SIZES)} only"
+    )
+    parser.add_argument("--no-sessions", action="store_true")
+    parser.add_argument("--out", type=pathlib.Path)
+    parser.add_argument(
+        "--compare", type=pathlib.Path, help="the JSON results of another commit"
+    )
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+    sizes = [size for size in args.sizes if not args.quick or size in QUICK_SIZES]
+
+    commit = describe()
+    results: Dict[str, Any] = {
+        "meta": {
+            "commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "results": {},
+    }
+    for name in args.corpora:
+        for size in sizes:
+            for key, result in hot_paths(name, size).items():
+                print(f"{key:<48} {result['median_ms']:>10.2f}ms", flush=True)
+                results["results"][key] = result
+    if not args.no_sessions:
+        for name in args.corpora:
+            for size in sizes:
+                if size not in SESSION_SIZES:
+                    continue
+                for key, result in edit_session(name, size).items():
+                    print(f"{key:<48} {result['median_ms']:>10.2f}ms", flush=True)
+                    results["results"][key] = result
+
+    out = args.out or ROOT / "benchmarks" / "results" / f"{commit}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    print(f"results: {out}")
+    if args.compare:
+        base = json.loads(args.compare.read_text(encoding="utf-8"))
+        print(f"\ncompared to {base['meta']['commit']}:")
+        if compare(base, results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
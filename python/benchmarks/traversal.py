@@ -0,0 +1,78 @@
+"""Full tree traversal: the former recursive generators vs traversal.Preorder.
+
+> python -m benchmarks.traversal
+"""
+
+from typing import List, Iterable
+import timeit
+import tree_sitter
+from tentiris.parser_pool import treesitter_parse
+from tentiris.traversal import Preorder, postorder
+
+NUMBER = 20
+REPEAT = 5
+
+SOURCES = {
+    "flat": b"# title\n\nsome *text*\n\n- a\n- b\n\n```\ncode\n```\n" * 500,
+    "nested": "".join("  " * i + "- x\n" for i in range(200)).encode(),
+}
+
+
+def iter_node(
+    node: tree_sitter.Node, parent: List[tree_sitter.Node]
+) -> Iterable[List[tree_sitter.Node]]:
+    """The nested generators completions used before node_at."""
+    path = [node] + parent
+    yield path
+
+    cursor = node.walk()
+    if cursor.goto_first_child():
+        while True:
+            for child in iter_node(cursor.node, path):
+                yield child
+            if not cursor.goto_next_sibling():
+                break
+
+
+def recursive_closure(root: tree_sitter.Node) -> int:
+    """The recursive closure semantic tokens used before Preorder."""
+    count = 0
+
+    def traverse(node: tree_sitter.Node):
+        nonlocal count
+        count += 1
+        cursor = node.walk()
+        if cursor.goto_first_child():
+            while True:
+                traverse(cursor.node)
+                if not cursor.goto_next_sibling():
+                    break
+
+    traverse(root)
+    return count
+
+
+def best(f) -> float:
+    """Best time per call in milliseconds."""
+    return min(timeit.repeat(f, number=NUMBER, repeat=REPEAT)) / NUMBER * 1e3
+
+
+def main():
+    for name, src in SOURCES.items():
+        root = treesitter_parse(src).root_node
+        nodes = sum(1 for _ in Preorder(root))
+        generators = best(lambda: sum(1 for _ in iter_node(root, [])))
+        closure = best(lambda: recursive_closure(root))
+        preorder = best(lambda: sum(1 for _ in Preorder(root)))
+        post = best(lambda: sum(1 for _ in postorder(root)))
+        print(
+            f"{name:>6}({nodes} nodes): "
+            f"nested generators {generators:.2f}ms, "
+            f"recursive closure {closure:.2f}ms, "
+            f"Preorder {preorder:.2f}ms, "
+            f"postorder {post:.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
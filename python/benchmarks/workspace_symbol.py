@@ -0,0 +1,63 @@
+"""workspace/symbol on 500k headings: building the table of SymbolIndex and
+the query latency, with words of a Zipf distribution like real headings.
+
+> python -m benchmarks.workspace_symbol
+"""
+
+import itertools
+import random
+import statistics
+import string
+import time
+from tentiris.symbol_index import SymbolIndex
+
+FILES = 10000
+HEADINGS = 50
+WORDS = 30000
+LIMIT = 100
+
+QUERIES = ["a", "in", "ins", "install", "instal gide", "getting started", "zzzz"]
+
+
+def word(rng: random.Random) -> str:
+    return "".join(
+        rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 10))
+    )
+
+
+def main():
+    rng = random.Random(0)
+    vocabulary = [word(rng) for _ in range(WORDS)]
+    vocabulary[:4] = ["install", "guide", "getting", "started"]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(WORDS)))
+    index: SymbolIndex = SymbolIndex()
+    for f in range(FILES):
+        titles = [
+            " ".join(
+                rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(1, 6))
+            )
+            for _ in range(HEADINGS)
+        ]
+        index.put(f"/workspace/{f}.md", ((title, i) for i, title in enumerate(titles)))
+
+    start = time.perf_counter()
+    index.build()
+    built = time.perf_counter() - start
+    print(
+        f"build({FILES * HEADINGS} headings, {len(index.table.keys)} keys, "
+        f"{len(index.table.words)} words): {built * 1e3:.0f}ms"
+    )
+    for query in QUERIES:
+        times = []
+        for _ in range(5):
+            start = time.perf_counter()
+            found = index.search(query, LIMIT)
+            times.append((time.perf_counter() - start) * 1e3)
+        print(
+            f"{query!r:>17}: {len(found)} found, "
+            f"min {min(times):.1f}ms, median {statistics.median(times):.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -7,5 +7,14 @@ Language.build_library(
     [
         # https://github.com/MDeiml/tree-sitter-markdown
         "vendor/tree-sitter-markdown/tree-sitter-markdown",
+        "vendor/tree-sitter-markdown/tree-sitter-markdown-inline",
+        # fenced code blocks, see injections.EMBEDDED_GRAMMARS. The blocks of
+        # a grammar left out are highlighted as plain code.
+        # https://github.com/tree-sitter/tree-sitter-json
+        "vendor/tree-sitter-json",
+        # https://github.com/tree-sitter/tree-sitter-python
+        "vendor/tree-sitter-python",
+        # https://github.com/tree-sitter-grammars/tree-sitter-yaml
+        "vendor/tree-sitter-yaml",
     ],
 )
@@ -1,40 +1,95 @@
-from typing import Optional, Any
+from typing import Optional, Any, Callable
 import argparse
+import asyncio
+import functools
 import logging
+import sys
+import time
 import lsprotocol.types as lsp_types
 from pygls.server import LanguageServer
 import logging
-from . import commands, features
+from . import batch, commands, execution, features
 from .colorful_log_handler import ColorfulHandler
+from .parser_pool import LANGUAGE_LIBRARY_ENV, set_language_library
+from .sessions import MAX_WORKERS, SessionServer
+from .stats import STATS
 
 
 LOGGER = logging.getLogger(__name__)
 
 
-def init_language_server() -> LanguageServer:
-    language_server = LanguageServer("tentiris", "v0.1")
+def init_language_server(
+    create: Callable[..., LanguageServer] = LanguageServer
+) -> LanguageServer:
+    """create is a session of a SessionServer for TCP and WebSocket."""
+    language_server = create("tentiris", "v0.1")
 
-    def register_feature(
-        tentiris_server, feature_name: str, f, options: Optional[Any] = None
-    ):
-        @tentiris_server.feature(feature_name, options)
-        def wrapper(*args, **keys):
-            return f(tentiris_server, *args, **keys)
+    def bind(tentiris_server, name: str, f):
+        """f(tentiris_server, ...) with its latency in STATS under name, in the
+        thread pool if the execution policy says so."""
+        threaded = execution.mode(name) == execution.THREAD
+        if threaded and not asyncio.iscoroutinefunction(f):
+            handler = f
 
-        return wrapper
+            async def f(server, params):
+                return await execution.run_in_thread(
+                    server, handler, params, lock=features.document_lock(server, params)
+                )
+
+        # pygls awaits a handler only if it is a coroutine function itself,
+        # only then $/cancelRequest cancels it
+        if asyncio.iscoroutinefunction(f):
+
+            async def async_wrapper(*args, **keys):
+                start = time.perf_counter()
+                try:
+                    return await f(tentiris_server, *args, **keys)
+                except asyncio.CancelledError:
+                    STATS.count(f"{name}.cancelled")
+                    raise
+                except execution.RequestCancelled:
+                    # superseded by the next version, answered as cancelled
+                    STATS.count(f"{name}.cancelled")
+                    raise asyncio.CancelledError()
+                except Exception:
+                    STATS.count(f"{name}.error")
+                    raise
+                finally:
+                    STATS.record(name, time.perf_counter() - start)
+
+            return async_wrapper
 
-    def register_command(tentiris_server, command_name: str, f):
-        @tentiris_server.command(command_name)
         def wrapper(*args, **keys):
-            return f(tentiris_server, *args, **keys)
+            start = time.perf_counter()
+            try:
+                return f(tentiris_server, *args, **keys)
+            except Exception:
+                STATS.count(f"{name}.error")
+                raise
+            finally:
+                STATS.record(name, time.perf_counter() - start)
 
         return wrapper
 
+    def register_feature(
+        tentiris_server, feature_name: str, f, options: Optional[Any] = None
+    ):
+        return tentiris_server.feature(feature_name, options)(
+            bind(tentiris_server, feature_name, f)
+        )
+
+    def register_command(tentiris_server, command_name: str, f):
+        return tentiris_server.command(command_name)(
+            bind(tentiris_server, command_name, f)
+        )
+
     def register_thread_command(tentiris_server, command_name: str, f):
+        bound = bind(tentiris_server, command_name, f)
+
         @tentiris_server.thread()
         @tentiris_server.command(command_name)
         def wrapper(*args, **keys):
-            return f(tentiris_server, *args, **keys)
+            return bound(*args, **keys)
 
         return wrapper
 
@@ -42,7 +97,7 @@ def init_language_server() -> LanguageServer:
         language_server,
         lsp_types.TEXT_DOCUMENT_COMPLETION,
         features.completions,
-        lsp_types.CompletionOptions(trigger_characters=[","]),
+        lsp_types.CompletionOptions(trigger_characters=["(", "/", "#", "["]),
     )
     register_command(
         language_server,
@@ -63,13 +118,72 @@ def init_language_server() -> LanguageServer:
     register_feature(
         language_server, lsp_types.TEXT_DOCUMENT_DID_OPEN, features.did_open
     )
+    register_feature(
+        language_server, lsp_types.TEXT_DOCUMENT_DEFINITION, features.definition
+    )
+    register_feature(
+        language_server, lsp_types.TEXT_DOCUMENT_REFERENCES, features.references
+    )
+    register_feature(
+        language_server,
+        lsp_types.TEXT_DOCUMENT_PREPARE_RENAME,
+        features.prepare_rename,
+    )
+    register_feature(
+        language_server,
+        lsp_types.TEXT_DOCUMENT_RENAME,
+        features.rename,
+        lsp_types.RenameOptions(prepare_provider=True),
+    )
+    register_feature(
+        language_server,
+        lsp_types.WORKSPACE_SYMBOL,
+        features.workspace_symbol,
+    )
+    register_feature(
+        language_server,
+        lsp_types.WORKSPACE_DID_CHANGE_WATCHED_FILES,
+        features.did_change_watched_files,
+    )
+    semantic_tokens_legend = features.SEMANTIC_TOKENS_LEGEND
     register_feature(
         language_server,
         lsp_types.TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL,
         features.semantic_tokens,
-        lsp_types.SemanticTokensLegend(token_types=["operator"], token_modifiers=[]),
+        semantic_tokens_legend,
+    )
+    register_feature(
+        language_server,
+        lsp_types.TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL_DELTA,
+        features.semantic_tokens_delta,
+        semantic_tokens_legend,
+    )
+    register_feature(
+        language_server,
+        lsp_types.TEXT_DOCUMENT_SEMANTIC_TOKENS_RANGE,
+        features.semantic_tokens_range,
+        semantic_tokens_legend,
+    )
+    register_feature(
+        language_server,
+        lsp_types.TEXT_DOCUMENT_DOCUMENT_SYMBOL,
+        features.document_symbol,
     )
+    register_feature(
+        language_server,
+        lsp_types.TEXT_DOCUMENT_FOLDING_RANGE,
+        features.folding_range,
+    )
+    register_feature(language_server, lsp_types.INITIALIZED, commands.initialized)
+    register_feature(
+        language_server,
+        lsp_types.WORKSPACE_DID_CHANGE_CONFIGURATION,
+        commands.load_settings,
+    )
+    register_command(language_server, "indexWorkspace", commands.index_workspace)
     register_command(language_server, "progress", commands.progress)
+    register_command(language_server, "tentiris.stats", commands.stats)
+    register_command(language_server, "tentiris.profile", commands.profile)
     register_command(
         language_server,
         "registerCompletions",
@@ -103,19 +217,72 @@ def main():
     # args
     parser = argparse.ArgumentParser()
     parser.description = "simple json server example"
-    parser.add_argument("--tcp", action="store_true", help="Use TCP server")
-    parser.add_argument("--ws", action="store_true", help="Use WebSocket server")
+    parser.add_argument(
+        "--tcp", action="store_true", help="Use TCP server, for many clients"
+    )
+    parser.add_argument(
+        "--ws", action="store_true", help="Use WebSocket server, for many clients"
+    )
     parser.add_argument("--host", default="127.0.0.1", help="Bind to this address")
     parser.add_argument("--port", type=int, default=32123, help="Bind to this port")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=MAX_WORKERS,
+        help="threads of the handlers and the validation",
+    )
+    parser.add_argument(
+        "--execution",
+        action="append",
+        default=[],
+        metavar="METHOD=MODE",
+        help="run a request or a command on the event loop or in the thread pool, "
+        f"{'|'.join(execution.EXECUTION_MODES)} (repeatable)",
+    )
+    parser.add_argument(
+        "--index-processes",
+        type=int,
+        help="processes indexing the workspace (default: cpu count, 0: a thread)",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=0,
+        help="log request latencies and loop lag every this many seconds",
+    )
+    parser.add_argument(
+        "--language-library",
+        help="tree-sitter grammars built by build_treesitter.py "
+        f"(default: ${LANGUAGE_LIBRARY_ENV} or build/my-languages.dll next to the package)",
+    )
+    batch.add_commands(parser)
     args = parser.parse_args()
+    set_language_library(args.language_library)
+    if args.command:
+        sys.exit(batch.run_command(args))
 
     # language server
-    language_server = init_language_server()
-    if args.tcp:
-        language_server.start_tcp(args.host, args.port)
-    elif args.ws:
-        language_server.start_ws(args.host, args.port)
+    try:
+        execution.set_policy(execution.parse_policy(args.execution))
+    except ValueError as e:
+        parser.error(str(e))
+    features.WORKSPACE_INDEX.max_processes = args.index_processes
+    if args.tcp or args.ws:
+        # one process for every editor connecting, the workspace index and
+        # the caches are shared
+        server = SessionServer(
+            init_language_server, features.end_session, max_workers=args.workers
+        )
+        STATS.watch_loop(server.loop, log_interval=args.stats_interval)
+        if args.tcp:
+            server.start_tcp(args.host, args.port)
+        else:
+            server.start_ws(args.host, args.port)
     else:
+        language_server = init_language_server(
+            functools.partial(LanguageServer, max_workers=args.workers)
+        )
+        STATS.watch_loop(language_server.loop, log_interval=args.stats_interval)
         language_server.start_io()
 
 
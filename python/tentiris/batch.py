@@ -0,0 +1,317 @@
+from typing import Optional, List, Dict, Any, NamedTuple, Iterable, Iterator, TextIO
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import pathlib
+import sys
+import lsprotocol.types as lsp_types
+from .diagnostics import MarkdownDiagnostics, NAME
+from .documents import DocumentTree
+from .parser_pool import ParseCancelled, set_language_library, treesitter_parse
+from .workspace_index import (
+    CHUNK_SIZE,
+    FileJob,
+    FileSymbols,
+    MARKDOWN_SUFFIXES,
+    find_markdown_files,
+    index_files,
+)
+
+SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+
+SEVERITY_NAMES = {
+    lsp_types.DiagnosticSeverity.Error: "error",
+    lsp_types.DiagnosticSeverity.Warning: "warning",
+    lsp_types.DiagnosticSeverity.Information: "information",
+    lsp_types.DiagnosticSeverity.Hint: "hint",
+}
+SARIF_LEVELS = {
+    lsp_types.DiagnosticSeverity.Error: "error",
+    lsp_types.DiagnosticSeverity.Warning: "warning",
+    lsp_types.DiagnosticSeverity.Information: "note",
+    lsp_types.DiagnosticSeverity.Hint: "note",
+}
+# --fail-on: the lowest severity that makes the exit status 1
+FAIL_ON = {
+    "error": lsp_types.DiagnosticSeverity.Error,
+    "warning": lsp_types.DiagnosticSeverity.Warning,
+    "never": None,
+}
+
+
+class FileReport(NamedTuple):
+    path: str
+    diagnostics: List[lsp_types.Diagnostic]
+    # the file could not be read or parsed
+    error: Optional[str] = None
+
+
+def check_files(paths: List[str]) -> List[FileReport]:
+    """Runs in a worker process, like index_files."""
+    reports = []
+    for path in paths:
+        try:
+            utf8_bytes = pathlib.Path(path).read_bytes()
+            document = DocumentTree(path, None, utf8_bytes, treesitter_parse)
+            diagnostics = MarkdownDiagnostics().validate(document) or []
+        except (OSError, ParseCancelled) as e:
+            reports.append(FileReport(path, [], str(e) or type(e).__name__))
+            continue
+        reports.append(FileReport(path, diagnostics))
+    return reports
+
+
+def collect_files(paths: Iterable[str]) -> List[str]:
+    """Markdown files under the folders and the files given, sorted."""
+    found = set()
+    for path in paths:
+        if os.path.isdir(path):
+            found.update(path for path, _, _ in find_markdown_files([path]))
+        else:
+            found.add(path)
+    return sorted(found)
+
+
+def _chunks(items: List, size: int) -> List[List]:
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def run_chunks(
+    f, items: List, jobs: Optional[int], language_library: Optional[str]
+) -> Iterator[Any]:
+    """The results of f(chunk) for every CHUNK_SIZE items in order, from a
+    process pool if there is more than one chunk."""
+    chunks = _chunks(items, CHUNK_SIZE)
+    if len(chunks) <= 1 or jobs == 1:
+        # not worth starting processes
+        for chunk in chunks:
+            yield from f(chunk)
+        return
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=set_language_library,
+        initargs=(language_library,),
+    ) as executor:
+        for results in executor.map(f, chunks):
+            yield from results
+
+
+def _range_json(r: lsp_types.Range) -> Dict[str, Any]:
+    return {
+        "start": {"line": r.start.line, "character": r.start.character},
+        "end": {"line": r.end.line, "character": r.end.character},
+    }
+
+
+class JsonLinesWriter:
+    """A JSON object per diagnostic, ranges like LSP: 0 based, utf-16."""
+
+    def __init__(self, out: TextIO):
+        self.out = out
+
+    def write(self, report: FileReport) -> None:
+        if report.error:
+            self._line(
+                {"path": report.path, "severity": "error", "message": report.error}
+            )
+        for d in report.diagnostics:
+            self._line(
+                {
+                    "path": report.path,
+                    "range": _range_json(d.range),
+                    "severity": SEVERITY_NAMES.get(d.severity, "error"),
+                    "message": d.message,
+                    "source": d.source,
+                }
+            )
+        self.out.flush()
+
+    def _line(self, value: Dict[str, Any]) -> None:
+        self.out.write(json.dumps(value, ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        pass
+
+
+class SarifWriter:
+    """A SARIF 2.1.0 log, written at the end since it is a single object."""
+
+    def __init__(self, out: TextIO):
+        self.out = out
+        self.results: List[Dict[str, Any]] = []
+
+    def write(self, report: FileReport) -> None:
+        uri = pathlib.PurePath(os.path.relpath(report.path)).as_posix()
+        if report.error:
+            self.results.append(
+                {
+                    "level": "error",
+                    "message": {"text": report.error},
+                    "locations": [
+                        {"physicalLocation": {"artifactLocation": {"uri": uri}}}
+                    ],
+                }
+            )
+        for d in report.diagnostics:
+            self.results.append(
+                {
+                    "level": SARIF_LEVELS.get(d.severity, "error"),
+                    "message": {"text": d.message},
+                    "locations": [
+                        {
+                            "physicalLocation": {
+                                "artifactLocation": {"uri": uri},
+                                # 1 based
+                                "region": {
+                                    "startLine": d.range.start.line + 1,
+                                    "startColumn": d.range.start.character + 1,
+                                    "endLine": d.range.end.line + 1,
+                                    "endColumn": d.range.end.character + 1,
+                                },
+                            }
+                        }
+                    ],
+                }
+            )
+
+    def close(self) -> None:
+        log = {
+            "$schema": SARIF_SCHEMA,
+            "version": "2.1.0",
+            "runs": [
+                {
+                    "tool": {"driver": {"name": NAME}},
+                    # the same columns as LSP
+                    "columnKind": "utf16CodeUnits",
+                    "results": self.results,
+                }
+            ],
+        }
+        json.dump(log, self.out, ensure_ascii=False, indent=2)
+        self.out.write("\n")
+        self.out.flush()
+
+
+WRITERS = {"jsonl": JsonLinesWriter, "sarif": SarifWriter}
+
+
+def check(
+    paths: List[str],
+    out: TextIO,
+    format: str = "jsonl",
+    jobs: Optional[int] = None,
+    fail_on: str = "warning",
+    language_library: Optional[str] = None,
+) -> int:
+    """Write the diagnostics of the files, return the exit status."""
+    fail_severity = FAIL_ON[fail_on]
+    writer = WRITERS[format](out)
+    failed = False
+    for report in run_chunks(check_files, collect_files(paths), jobs, language_library):
+        writer.write(report)
+        if report.error:
+            failed = True
+        elif fail_severity is not None and any(
+            d.severity is not None and d.severity <= fail_severity
+            for d in report.diagnostics
+        ):
+            failed = True
+    writer.close()
+    return 1 if failed else 0
+
+
+def _symbols_json(symbols: FileSymbols) -> Dict[str, Any]:
+    return {
+        "path": symbols.path,
+        "digest": symbols.digest,
+        "headings": [
+            {
+                "level": h.level,
+                "title": h.title,
+                "anchor": h.anchor,
+                "line": h.span[0],
+            }
+            for h in symbols.headings
+        ],
+        "links": [
+            {"path": link.path, "anchor": link.anchor, "line": link.span[0]}
+            for link in symbols.links
+        ],
+        "references": [
+            {"label": r.label, "destination": r.destination, "line": r.span[0]}
+            for r in symbols.references
+        ],
+        "frontMatter": symbols.front_matter,
+    }
+
+
+def index(
+    paths: List[str],
+    out: TextIO,
+    jobs: Optional[int] = None,
+    language_library: Optional[str] = None,
+) -> int:
+    """Write the symbols of the files as JSON lines, like the workspace index."""
+    file_jobs = [FileJob(path, 0, 0, None) for path in collect_files(paths)]
+    status = 0
+    for symbols in run_chunks(index_files, file_jobs, jobs, language_library):
+        if not symbols:
+            # logged by index_files
+            status = 1
+            continue
+        out.write(json.dumps(_symbols_json(symbols), ensure_ascii=False) + "\n")
+        out.flush()
+    return status
+
+
+def add_commands(parser: argparse.ArgumentParser) -> None:
+    """tentiris check|index, without one tentiris starts the language server."""
+    subparsers = parser.add_subparsers(
+        dest="command", title="batch mode, without a language server"
+    )
+
+    def add_common(command: argparse.ArgumentParser):
+        command.add_argument(
+            "paths",
+            nargs="*",
+            default=["."],
+            help=f"files and folders, searched for {'/'.join(MARKDOWN_SUFFIXES)}",
+        )
+        command.add_argument(
+            "--jobs",
+            "-j",
+            type=int,
+            help="worker processes (default: the cpu count)",
+        )
+
+    check_parser = subparsers.add_parser(
+        "check", help="write diagnostics as JSON lines or SARIF"
+    )
+    add_common(check_parser)
+    check_parser.add_argument("--format", choices=sorted(WRITERS), default="jsonl")
+    check_parser.add_argument(
+        "--fail-on",
+        choices=list(FAIL_ON),
+        default="warning",
+        help="exit with 1 for a diagnostic of this severity or higher",
+    )
+    index_parser = subparsers.add_parser(
+        "index", help="write headings, links and front matter as JSON lines"
+    )
+    add_common(index_parser)
+
+
+def run_command(args: argparse.Namespace) -> int:
+    if args.command == "check":
+        return check(
+            args.paths,
+            sys.stdout,
+            args.format,
+            args.jobs,
+            args.fail_on,
+            args.language_library,
+        )
+    return index(args.paths, sys.stdout, args.jobs, args.language_library)
@@ -1,14 +1,25 @@
 import time
 import uuid
 import asyncio
+import logging
+import tempfile
 import lsprotocol.types as lsp_types
 from pygls.server import LanguageServer
+from pygls.uris import to_fs_path
+from . import features, profiling
+from .large_documents import SETTINGS
+from .stats import STATS
+from .workspace_index import default_cache_path
+
+LOGGER = logging.getLogger(__name__)
 
 COUNT_DOWN_START_IN_SECONDS = 10
 COUNT_DOWN_SLEEP_IN_SECONDS = 1
 
 CONFIGURATION_SECTION = "Tentiris"
 
+PROFILE_SECONDS = 10
+
 
 def count_down_10_seconds_blocking(ls: LanguageServer, *args):
     """Starts counting down and showing message synchronously.
@@ -50,6 +61,91 @@ async def progress(ls: LanguageServer, *args):
     ls.progress.end(token, lsp_types.WorkDoneProgressEnd(message="Finished"))
 
 
+def stats(ls: LanguageServer, *args):
+    """Request latency histograms, parse times, cache hits and loop lag of
+    the process."""
+    return STATS.snapshot()
+
+
+async def profile(ls: LanguageServer, *args):
+    """Profile the server for [seconds, "cprofile" | "sampling"], the dump is
+    written to the temporary folder."""
+    params = args[0] if args and args[0] else []
+    seconds = float(params[0]) if params else PROFILE_SECONDS
+    mode = params[1] if len(params) > 1 else "cprofile"
+    ls.show_message(f"Profiling ({mode}) for {seconds:g} seconds")
+    result = await profiling.profile(mode, seconds, tempfile.gettempdir())
+    ls.show_message(f"Profile: {result['path']}")
+    return result
+
+
+def workspace_folders(ls: LanguageServer):
+    folders = [to_fs_path(f.uri) for f in ls.workspace.folders.values()]
+    if not folders and ls.workspace.root_path:
+        folders = [ls.workspace.root_path]
+    return folders
+
+
+async def initialized(ls: LanguageServer, *args):
+    """Read the settings and index the workspace."""
+    await asyncio.gather(load_settings(ls), index_workspace(ls))
+
+
+async def load_settings(ls: LanguageServer, *args):
+    """Read the thresholds of the large document mode from the Tentiris
+    section, on initialized and when the client configuration changed."""
+    workspace = ls.client_capabilities.workspace
+    if not workspace or not workspace.configuration:
+        return
+    try:
+        config = await ls.get_configuration_async(
+            lsp_types.ConfigurationParams(
+                # the settings of the window, not of a resource
+                items=[lsp_types.ConfigurationItem(section=CONFIGURATION_SECTION)]
+            )
+        )
+    except Exception as e:
+        LOGGER.warning(f"no settings: {e}")
+        return
+    if config and isinstance(config[0], dict):
+        SETTINGS.update(config[0])
+    LOGGER.info(f"settings: {SETTINGS.snapshot()}")
+
+
+async def index_workspace(ls: LanguageServer, *args):
+    """Index every markdown file in the workspace folders with progress."""
+    folders = workspace_folders(ls)
+    if not folders:
+        return
+    token = str(uuid.uuid4())
+    try:
+        await ls.progress.create_async(token)
+    except Exception as e:
+        LOGGER.warning(f"no progress: {e}")
+        token = None
+
+    if token:
+        ls.progress.begin(
+            token, lsp_types.WorkDoneProgressBegin(title="Indexing", percentage=0)
+        )
+
+    def report(done: int, total: int):
+        if token:
+            ls.progress.report(
+                token,
+                lsp_types.WorkDoneProgressReport(
+                    message=f"{done}/{total}", percentage=done * 100 // total
+                ),
+            )
+
+    index = features.WORKSPACE_INDEX
+    await index.scan(folders, report, default_cache_path(folders))
+    if token:
+        ls.progress.end(
+            token, lsp_types.WorkDoneProgressEnd(message=f"{len(index.files)} files")
+        )
+
+
 async def register_completions(ls: LanguageServer, *args):
     """Register completions method on the client."""
     params = lsp_types.RegistrationParams(
@@ -0,0 +1,194 @@
+from typing import Optional, Callable, NamedTuple, Iterable, Iterator, Tuple
+import os
+import re
+import urllib.parse
+import lsprotocol.types as lsp_types
+from .documents import DocumentTree
+from .outline import OutlineHeading
+from .path_trie import PrefixIndex
+from .workspace_index import (
+    WorkspaceIndex,
+    FileSymbols,
+    ReferenceDefinition,
+)
+
+# inline link destination or reference definition destination, up to the cursor
+LINK_DESTINATION = re.compile(
+    r"(?:\]\(\s*<?|^ {0,3}\[[^\]]+\]:[ \t]*<?)([^\s()<>#]*)(?:#([^\s()<>]*))?$"
+)
+# [text][label
+REFERENCE_LABEL = re.compile(r"\]\[([^\]]*)$")
+
+# nodes without links
+NO_COMPLETION_TYPES = (
+    "fenced_code_block",
+    "indented_code_block",
+    "code_fence_content",
+    "html_block",
+    "minus_metadata",
+)
+
+
+class CompletionContext(NamedTuple):
+    """What the text before the cursor is."""
+
+    kind: str  # "path", "anchor" or "reference"
+    path: str  # the link path typed so far
+    text: str  # the part being completed: last path segment, anchor or label
+
+
+def line_prefix(document: DocumentTree, position: lsp_types.Position) -> str:
+    offset, row, _ = document.position_to_point(position)
+    start = document.line_offsets[row]
+    return document.utf8_bytes[start:offset].decode("utf-8", "replace")
+
+
+def completion_context(prefix: str) -> Optional[CompletionContext]:
+    m = LINK_DESTINATION.search(prefix)
+    if m:
+        path, anchor = m.group(1), m.group(2)
+        if anchor is not None:
+            return CompletionContext("anchor", path, anchor)
+        return CompletionContext("path", path, path.rpartition("/")[2])
+    m = REFERENCE_LABEL.search(prefix)
+    if m:
+        return CompletionContext("reference", "", m.group(1))
+    return None
+
+
+# (anchor, heading) of the document by anchor
+LocalAnchors = PrefixIndex[Tuple[str, OutlineHeading]]
+# reference definitions of the document by lower case label
+LocalReferences = PrefixIndex[ReferenceDefinition]
+
+
+def local_references(symbols: FileSymbols) -> LocalReferences:
+    return PrefixIndex((r.label.lower(), r) for r in symbols.references)
+
+
+def _utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+class Completer:
+    """Candidates for one completion request, produced lazily.
+
+    Paths come from the folder trie of the workspace index and the headings
+    of another file from its sorted anchors, a keystroke bisects for its
+    prefix and does not scan the workspace. The anchors and the reference
+    labels of the document itself are asked for only when they are completed,
+    once per version.
+    """
+
+    def __init__(
+        self,
+        index: WorkspaceIndex,
+        anchors: Callable[[], LocalAnchors],
+        references: Callable[[], LocalReferences],
+        source: Optional[str],
+        position: lsp_types.Position,
+        limit: int,
+    ):
+        self.index = index
+        self.anchors = anchors
+        self.references = references
+        # file system path of the document, None if it is untitled
+        self.source = source
+        self.position = position
+        # candidates the caller takes at most, the index copies no more
+        self.limit = limit
+
+    def _resolve(self, path: str) -> str:
+        assert self.source
+        return os.path.normpath(
+            os.path.join(os.path.dirname(self.source), urllib.parse.unquote(path))
+        )
+
+    def _edit(self, text: str, new_text: str) -> lsp_types.TextEdit:
+        return lsp_types.TextEdit(
+            range=lsp_types.Range(
+                start=lsp_types.Position(
+                    line=self.position.line,
+                    character=self.position.character - _utf16_len(text),
+                ),
+                end=self.position,
+            ),
+            new_text=new_text,
+        )
+
+    def complete(
+        self, context: CompletionContext
+    ) -> Iterator[lsp_types.CompletionItem]:
+        match context.kind:
+            case "path":
+                return self._paths(context)
+            case "anchor":
+                return self._anchors(context)
+            case "reference":
+                return self._references(context)
+        return iter(())
+
+    def _paths(self, context: CompletionContext) -> Iterator[lsp_types.CompletionItem]:
+        if not self.source:
+            return
+        typed_folder = context.path[: len(context.path) - len(context.text)]
+        folder = self._resolve(typed_folder)
+        for name, is_folder in self.index.complete_path(
+            folder, urllib.parse.unquote(context.text), self.limit
+        ):
+            # a link destination can not contain a space
+            new_text = name.replace(" ", "%20")
+            if is_folder:
+                yield lsp_types.CompletionItem(
+                    label=name + "/",
+                    kind=lsp_types.CompletionItemKind.Folder,
+                    text_edit=self._edit(context.text, new_text + "/"),
+                    command=lsp_types.Command(
+                        title="", command="editor.action.triggerSuggest"
+                    ),
+                )
+            else:
+                yield lsp_types.CompletionItem(
+                    label=name,
+                    kind=lsp_types.CompletionItemKind.File,
+                    text_edit=self._edit(context.text, new_text),
+                )
+
+    def _anchors(
+        self, context: CompletionContext
+    ) -> Iterator[lsp_types.CompletionItem]:
+        # (anchor, level, title)
+        headings: Iterable[Tuple[str, int, str]]
+        if not context.path:
+            headings = (
+                (anchor, heading.level, heading.title)
+                for anchor, heading in self.anchors().complete(context.text)
+            )
+        elif self.source:
+            headings = (
+                (heading.anchor, heading.level, heading.title)
+                for heading in self.index.complete_anchor(
+                    self._resolve(context.path), context.text, self.limit
+                )
+            )
+        else:
+            return
+        for anchor, level, title in headings:
+            yield lsp_types.CompletionItem(
+                label=anchor,
+                kind=lsp_types.CompletionItemKind.Reference,
+                detail="#" * level + " " + title,
+                text_edit=self._edit(context.text, anchor),
+            )
+
+    def _references(
+        self, context: CompletionContext
+    ) -> Iterator[lsp_types.CompletionItem]:
+        # labels are case insensitive
+        for reference in self.references().complete(context.text.lower()):
+            yield lsp_types.CompletionItem(
+                label=reference.label,
+                kind=lsp_types.CompletionItemKind.Reference,
+                detail=reference.destination,
+                text_edit=self._edit(context.text, reference.label),
+            )
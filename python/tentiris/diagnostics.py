@@ -0,0 +1,362 @@
+from typing import (
+    Hashable,
+    Optional,
+    List,
+    Dict,
+    NamedTuple,
+    Tuple,
+    Callable,
+    Sequence,
+    Set,
+    Iterator,
+)
+import json
+import re
+import urllib.parse
+import logging
+import lsprotocol.types as lsp_types
+import tree_sitter
+from .documents import DocumentTree
+from .headings import slugify, heading_level, heading_title, SlugCounter
+from .injections import (
+    EMBEDDED_GRAMMARS,
+    content_ranges,
+    fence_language,
+    inline_links,
+)
+from .large_documents import Rows, intersects
+from .stats import STATS
+from .traversal import Preorder
+
+LOGGER = logging.getLogger(__name__)
+
+NAME = "tentiris"
+
+Point = Tuple[int, int]
+
+# nodes that only contain blocks, every other child is a block
+CONTAINER_TYPES = ("document", "section")
+
+# an inline node that may link to a heading, parsed with the inline grammar
+ANCHOR_LINK = re.compile(rb"\]\(\s*<?#")
+
+# check for staleness every N blocks
+STALE_CHECK_INTERVAL = 256
+
+
+class Problem(NamedTuple):
+    """A diagnostic with rows relative to the block that contains it."""
+
+    start: Point
+    end: Point
+    message: str
+    severity: lsp_types.DiagnosticSeverity
+
+
+class Heading(NamedTuple):
+    level: int
+    title: str
+    slug: str
+    start: Point
+    end: Point
+
+
+class AnchorLink(NamedTuple):
+    anchor: str
+    start: Point
+    end: Point
+
+
+class BlockFacts(NamedTuple):
+    """What the rules found in one top level block."""
+
+    problems: List[Problem]
+    headings: List[Heading]
+    anchor_links: List[AnchorLink]
+
+
+BlockKey = Tuple[str, int, int, int]
+
+
+def _relative(point: Point, row: int) -> Point:
+    return (point[0] - row, point[1])
+
+
+def _offset_to_point(utf8_bytes: bytes, start: Point, offset: int) -> Point:
+    """Point of a byte offset in a node that starts at start."""
+    newlines = utf8_bytes.count(b"\n", 0, offset)
+    if newlines:
+        return (start[0] + newlines, offset - utf8_bytes.rfind(b"\n", 0, offset) - 1)
+    return (start[0], start[1] + offset)
+
+
+def check_json(content: tree_sitter.Node, utf8_bytes: bytes, row: int) -> List[Problem]:
+    """Validate the code_fence_content of a json block."""
+    ranges = content_ranges(content, utf8_bytes)
+    chunks = [utf8_bytes[r.start_byte : r.end_byte] for r in ranges]
+    source = b"".join(chunks).decode("utf-8", errors="replace")
+    if not source.strip():
+        return []
+    try:
+        json.loads(source)
+    except json.JSONDecodeError as err:
+        # the error offset in the document, skipping the block continuations
+        offset = len(source[: err.pos].encode("utf-8"))
+        for r, chunk in zip(ranges, chunks):
+            if offset < len(chunk) or r is ranges[-1]:
+                offset = min(r.start_byte + offset, r.end_byte)
+                break
+            offset -= len(chunk)
+        text = utf8_bytes[content.start_byte : content.end_byte]
+        start = _offset_to_point(text, content.start_point, offset - content.start_byte)
+        end = (start[0], start[1] + 1)
+        return [
+            Problem(
+                _relative(start, row),
+                _relative(end, row),
+                err.msg,
+                lsp_types.DiagnosticSeverity.Error,
+            )
+        ]
+    return []
+
+
+def inline_anchor_links(
+    inline: tree_sitter.Node, utf8_bytes: bytes
+) -> Iterator[Tuple[str, tree_sitter.Node]]:
+    """(anchor, link_destination) of the links to a heading in an inline node."""
+    for link in inline_links(inline, utf8_bytes):
+        if link.destination.startswith(b"#"):
+            anchor = link.destination[1:].decode("utf-8", "replace")
+            yield urllib.parse.unquote(anchor), link.node
+
+
+def check_block(node: tree_sitter.Node, utf8_bytes: bytes) -> BlockFacts:
+    """Apply the local rules to a block in a single cursor traversal."""
+    row = node.start_point[0]
+    facts = BlockFacts([], [], [])
+
+    walk = Preorder(node, skip_types=("inline",))
+    for current in walk:
+        if current.is_error:
+            facts.problems.append(
+                Problem(
+                    _relative(current.start_point, row),
+                    _relative(current.end_point, row),
+                    "Syntax error",
+                    lsp_types.DiagnosticSeverity.Error,
+                )
+            )
+            walk.skip()
+        elif current.is_missing:
+            facts.problems.append(
+                Problem(
+                    _relative(current.start_point, row),
+                    _relative(current.end_point, row),
+                    f"Missing {current.type}",
+                    lsp_types.DiagnosticSeverity.Error,
+                )
+            )
+
+        match current.type:
+            case "atx_heading" | "setext_heading":
+                title = heading_title(current, utf8_bytes)
+                content = current.child_by_field_name("heading_content")
+                facts.headings.append(
+                    Heading(
+                        heading_level(current),
+                        title,
+                        slugify(title),
+                        _relative(current.start_point, row),
+                        _relative((content or current).end_point, row),
+                    )
+                )
+            case "fenced_code_block":
+                delimiters = [
+                    child
+                    for child in current.children
+                    if child.type == "fenced_code_block_delimiter"
+                ]
+                if len(delimiters) < 2:
+                    opening = delimiters[0] if delimiters else current
+                    facts.problems.append(
+                        Problem(
+                            _relative(opening.start_point, row),
+                            _relative(opening.end_point, row),
+                            "Unclosed code block",
+                            lsp_types.DiagnosticSeverity.Warning,
+                        )
+                    )
+                language = fence_language(current, utf8_bytes)
+                if language and EMBEDDED_GRAMMARS.get(language.lower()) == "json":
+                    for child in current.children:
+                        if child.type == "code_fence_content":
+                            facts.problems.extend(check_json(child, utf8_bytes, row))
+            case "inline":
+                if not ANCHOR_LINK.search(
+                    utf8_bytes, current.start_byte, current.end_byte
+                ):
+                    continue
+                for anchor, destination in inline_anchor_links(current, utf8_bytes):
+                    facts.anchor_links.append(
+                        AnchorLink(
+                            anchor,
+                            _relative(destination.start_point, row),
+                            _relative(destination.end_point, row),
+                        )
+                    )
+            case "link_destination":
+                text = utf8_bytes[current.start_byte : current.end_byte]
+                if text.startswith(b"#"):
+                    facts.anchor_links.append(
+                        AnchorLink(
+                            urllib.parse.unquote(text[1:].decode("utf-8", "replace")),
+                            _relative(current.start_point, row),
+                            _relative(current.end_point, row),
+                        )
+                    )
+    return facts
+
+
+class MarkdownDiagnostics:
+    """Rule based markdown diagnostics.
+
+    The rules run in one cursor traversal of the tree. Results are cached per
+    top level block, keyed by its type, column and content, so after an edit
+    only the changed blocks are checked again. Rules that need the whole
+    document (anchors, heading levels, duplicates) run on the cached facts.
+    """
+
+    def __init__(self):
+        self.caches: Dict[Hashable, Dict[BlockKey, BlockFacts]] = {}
+
+    def release(self, key: Hashable) -> None:
+        self.caches.pop(key, None)
+
+    def validate(
+        self,
+        document: DocumentTree,
+        is_stale: Optional[Callable[[], bool]] = None,
+        rows: Optional[Sequence[Rows]] = None,
+        anchors: Optional[Set[str]] = None,
+    ) -> Optional[List[lsp_types.Diagnostic]]:
+        """Return None if is_stale() became true during validation.
+
+        With rows, the regions of a large document, only the blocks
+        intersecting them are checked and cached, and the heading rules that
+        need every heading are skipped. anchors are those of every heading,
+        for the anchor links in the regions.
+        """
+        src = document.utf8_bytes
+        previous = self.caches.get(document.key, {})
+        cache: Dict[BlockKey, BlockFacts] = {}
+        blocks: List[Tuple[int, BlockFacts]] = []
+        misses = 0
+
+        walk = Preorder(document.tree.root_node)
+        for node in walk:
+            if rows is not None and not intersects(
+                rows, node.start_point[0], node.end_point[0]
+            ):
+                walk.skip()
+                continue
+            if node.type not in CONTAINER_TYPES:
+                walk.skip()
+                key = (
+                    node.type,
+                    node.start_point[1],
+                    node.end_byte - node.start_byte,
+                    hash(src[node.start_byte : node.end_byte]),
+                )
+                facts = cache.get(key) or previous.get(key)
+                if not facts:
+                    facts = check_block(node, src)
+                    misses += 1
+                cache[key] = facts
+                blocks.append((node.start_point[0], facts))
+                if is_stale and len(blocks) % STALE_CHECK_INTERVAL == 0 and is_stale():
+                    return None
+
+        self.caches[document.key] = cache
+        STATS.cache("diagnostics", len(blocks) - misses, misses)
+        return self._diagnostics(document, blocks, rows is None, anchors)
+
+    def _diagnostics(
+        self,
+        document: DocumentTree,
+        blocks: List[Tuple[int, BlockFacts]],
+        heading_rules: bool = True,
+        anchors: Optional[Set[str]] = None,
+    ) -> List[lsp_types.Diagnostic]:
+        problems: List[Problem] = []
+
+        def absolute(point: Point, row: int) -> Point:
+            return (point[0] + row, point[1])
+
+        # document rules
+        slugs = SlugCounter()
+        last_level = 0
+        for row, facts in blocks:
+            for p in facts.problems:
+                problems.append(
+                    p._replace(start=absolute(p.start, row), end=absolute(p.end, row))
+                )
+            for heading in facts.headings:
+                if not heading_rules:
+                    slugs.add(heading.slug)
+                    continue
+                start = absolute(heading.start, row)
+                end = absolute(heading.end, row)
+                duplicate = heading.slug in slugs.counts
+                anchor = slugs.add(heading.slug)
+                if duplicate:
+                    # numbered like GitHub, a link can still reach it
+                    problems.append(
+                        Problem(
+                            start,
+                            end,
+                            f"Duplicate heading: {heading.title}, linked as #{anchor}",
+                            lsp_types.DiagnosticSeverity.Hint,
+                        )
+                    )
+                if last_level and heading.level > last_level + 1:
+                    problems.append(
+                        Problem(
+                            start,
+                            end,
+                            f"Heading level skips from h{last_level} to h{heading.level}",
+                            lsp_types.DiagnosticSeverity.Warning,
+                        )
+                    )
+                last_level = heading.level
+
+        if anchors is None:
+            anchors = set()
+            for slug, count in slugs.counts.items():
+                anchors.add(slug)
+                for i in range(1, count):
+                    anchors.add(f"{slug}-{i}")
+        for row, facts in blocks:
+            for link in facts.anchor_links:
+                if link.anchor and link.anchor not in anchors:
+                    problems.append(
+                        Problem(
+                            absolute(link.start, row),
+                            absolute(link.end, row),
+                            f"No heading found for anchor: #{link.anchor}",
+                            lsp_types.DiagnosticSeverity.Warning,
+                        )
+                    )
+
+        return [
+            lsp_types.Diagnostic(
+                range=lsp_types.Range(
+                    start=document.point_to_position(p.start),
+                    end=document.point_to_position(p.end),
+                ),
+                message=p.message,
+                severity=p.severity,
+                source=NAME,
+            )
+            for p in problems
+        ]
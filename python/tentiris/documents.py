@@ -0,0 +1,400 @@
+from typing import (
+    Optional,
+    List,
+    Dict,
+    Tuple,
+    Callable,
+    Sequence,
+    Any,
+    TypeVar,
+    Iterator,
+    Hashable,
+    Set,
+)
+from array import array
+from collections import OrderedDict
+import bisect
+import threading
+import time
+import logging
+import lsprotocol.types as lsp_types
+import tree_sitter
+from .stats import STATS
+
+LOGGER = logging.getLogger(__name__)
+
+ParseFunc = Callable[[bytes, Optional[tree_sitter.Tree]], tree_sitter.Tree]
+# keyword arguments of tree_sitter.Tree.edit
+EditArgs = Dict[str, Any]
+T = TypeVar("T")
+
+# upper bound of the utf-8 source held by the cache across open documents
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def utf16_to_byte_column(line: bytes, character: int) -> int:
+    """Convert an LSP (utf-16) column to a byte column in a utf-8 line."""
+    if line.isascii():
+        return min(character, len(line))
+    units = 0
+    text = line.decode("utf-8", errors="replace")
+    for i, c in enumerate(text):
+        if units >= character:
+            return len(text[:i].encode("utf-8"))
+        units += 2 if ord(c) > 0xFFFF else 1
+    return len(line)
+
+
+def byte_to_utf16_column(line: bytes, column: int) -> int:
+    """Convert a byte column in a utf-8 line to an LSP (utf-16) column."""
+    prefix = line[:column]
+    if prefix.isascii():
+        return column
+    return len(prefix.decode("utf-8", errors="replace").encode("utf-16-le")) // 2
+
+
+def document_key(uri: str, session: Optional[int] = None) -> Hashable:
+    """The uri, or (session, uri) in a session of a shared server, see sessions."""
+    return uri if session is None else (session, uri)
+
+
+def iter_ancestors(node: Optional[tree_sitter.Node]) -> Iterator[tree_sitter.Node]:
+    """The node, its parent and so on up to the root."""
+    while node:
+        yield node
+        node = node.parent
+
+
+class DocumentTree:
+    """Snapshot of a document version: utf-8 source, tree and derived data.
+
+    Feature handlers share one snapshot per (uri, version), so the source is
+    encoded and parsed once and derived results are computed once.
+
+    The tree is parsed on first access, reusing the tree of the previous
+    version edited in place. didChange only records the edits, the parse of
+    the next version takes the tree over and applies them. ``lock`` is shared
+    by all versions of a uri and must be held while a tree is used off the
+    event loop, the parse takes it before editing the tree, the event loop
+    never waits for it on didChange.
+
+    ``session`` is the client connection of a shared server the snapshot
+    belongs to, None for the single client of a stdio server.
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        version: Optional[int],
+        utf8_bytes: bytes,
+        parse: ParseFunc,
+        lock: Optional[threading.RLock] = None,
+        session: Optional[int] = None,
+        base: Optional["DocumentTree"] = None,
+    ):
+        """base is the previous version to take the tree from, see
+        apply_change."""
+        self.uri = uri
+        self.version = version
+        self.session = session
+        self.utf8_bytes = utf8_bytes
+        self.lock = lock or threading.RLock()
+        self.derived: Dict[str, Any] = {}
+        self._parse = parse
+        self._tree: Optional[tree_sitter.Tree] = None
+        # the version whose tree is reused and the edits from it to this one,
+        # read and replaced as a whole while the parse may clear it
+        self._pending: Optional[Tuple["DocumentTree", Tuple[EditArgs, ...]]] = None
+        if base is not None:
+            # an unparsed base hands over the pending edits of its own, the
+            # versions in between are not kept alive
+            self._pending = base._pending or (base, ())
+        self._line_offsets: Optional["array[int]"] = None
+
+    @property
+    def key(self) -> Hashable:
+        return document_key(self.uri, self.session)
+
+    @property
+    def tree(self) -> tree_sitter.Tree:
+        tree = self._tree
+        if tree is None:
+            with self.lock:
+                if self._tree is None:
+                    old_tree = self._take_tree()
+                    start = time.perf_counter()
+                    self._tree = self._parse(self.utf8_bytes, old_tree)
+                    STATS.record_parse(
+                        time.perf_counter() - start, old_tree is not None
+                    )
+                tree = self._tree
+        return tree
+
+    def _take_tree(self) -> Optional[tree_sitter.Tree]:
+        """The tree of this version, or of its base with the pending edits
+        applied, handed over to be edited. Call with the lock held.
+
+        This snapshot is parsed again from scratch if it is used afterwards.
+        """
+        tree = self._tree
+        pending = self._pending
+        self._tree = None
+        self._pending = None
+        if tree is None and pending:
+            base, edits = pending
+            tree = base._take_tree()
+            if tree:
+                for edit in edits:
+                    tree.edit(**edit)
+        return tree
+
+    def get_derived(self, key: str, create: Callable[["DocumentTree"], T]) -> T:
+        """Return data derived from this snapshot, creating it on first use."""
+        if key in self.derived:
+            STATS.cache("derived", 1, 0)
+            return self.derived[key]
+        STATS.cache("derived", 0, 1)
+        value = create(self)
+        self.derived[key] = value
+        return value
+
+    @property
+    def line_offsets(self) -> "array[int]":
+        """Byte offset of the start of each line, 8 bytes a line instead of
+        an int object and a pointer of a list."""
+        if self._line_offsets is None:
+            src = self.utf8_bytes
+            offsets = array("q", [0])
+            pos = src.find(b"\n")
+            while pos >= 0:
+                offsets.append(pos + 1)
+                pos = src.find(b"\n", pos + 1)
+            self._line_offsets = offsets
+        return self._line_offsets
+
+    def position_to_point(self, position: lsp_types.Position) -> Tuple[int, int, int]:
+        """Return (byte offset, row, byte column) of an LSP position."""
+        offsets = self.line_offsets
+        if position.line >= len(offsets):
+            # past the end of the document
+            row = len(offsets) - 1
+            return len(self.utf8_bytes), row, len(self.utf8_bytes) - offsets[row]
+        row = position.line
+        start = offsets[row]
+        end = offsets[row + 1] if row + 1 < len(offsets) else len(self.utf8_bytes)
+        line = self.utf8_bytes[start:end].rstrip(b"\r\n")
+        column = utf16_to_byte_column(line, position.character)
+        return start + column, row, column
+
+    def point_to_position(self, point: Tuple[int, int]) -> lsp_types.Position:
+        """Convert a tree-sitter point (row, byte column) to an LSP position."""
+        row, column = point
+        offsets = self.line_offsets
+        if row >= len(offsets):
+            return lsp_types.Position(line=row, character=0)
+        start = offsets[row]
+        line = self.utf8_bytes[start : start + column]
+        return lsp_types.Position(
+            line=row, character=byte_to_utf16_column(line, column)
+        )
+
+    def offset_to_position(self, offset: int) -> lsp_types.Position:
+        """Convert a byte offset to an LSP position."""
+        row = bisect.bisect_right(self.line_offsets, offset) - 1
+        return self.point_to_position((row, offset - self.line_offsets[row]))
+
+    def node_at(self, position: lsp_types.Position) -> tree_sitter.Node:
+        """The smallest node at the position, see iter_ancestors for its path.
+
+        A node that ends at the position contains it, like the text just typed
+        before the cursor. The lookup descends the tree in C instead of
+        visiting the nodes before the position.
+        """
+        offset = self.position_to_point(position)[0]
+        root = self.tree.root_node
+        node = root.descendant_for_byte_range(offset, offset)
+        if offset > 0:
+            # the node touching the position from the left
+            left = root.descendant_for_byte_range(offset - 1, offset)
+            if node.start_byte <= left.start_byte and left.end_byte <= node.end_byte:
+                return left
+        return node
+
+    def apply_change(self, change: lsp_types.TextDocumentContentChangeEvent) -> None:
+        """Apply a content change to the source of an unparsed snapshot and
+        record the edit of the tree of its base.
+
+        A change that replaces the whole document drops the base.
+        """
+        text = change.text.encode("utf-8")
+        match change:
+            case lsp_types.TextDocumentContentChangeEvent_Type1(range=change_range):
+                start_byte, start_row, start_column = self.position_to_point(
+                    change_range.start
+                )
+                old_end_byte, old_end_row, old_end_column = self.position_to_point(
+                    change_range.end
+                )
+            case _:
+                self.utf8_bytes = text
+                self._line_offsets = None
+                self._pending = None
+                return
+
+        newlines = text.count(b"\n")
+        if newlines:
+            new_end_point = (start_row + newlines, len(text) - text.rfind(b"\n") - 1)
+        else:
+            new_end_point = (start_row, start_column + len(text))
+
+        # joined from views, the only copy of the source is the new one
+        src = memoryview(self.utf8_bytes)
+        self.utf8_bytes = b"".join((src[:start_byte], text, src[old_end_byte:]))
+        self._line_offsets = None
+        pending = self._pending
+        if pending:
+            base, edits = pending
+            edit: EditArgs = dict(
+                start_byte=start_byte,
+                old_end_byte=old_end_byte,
+                new_end_byte=start_byte + len(text),
+                start_point=(start_row, start_column),
+                old_end_point=(old_end_row, old_end_column),
+                new_end_point=new_end_point,
+            )
+            self._pending = (base, edits + (edit,))
+
+
+class DocumentTreeStore:
+    """Versioned snapshot cache keyed by (uri, version).
+
+    Keeps the last snapshot per uri, edits its tree on didChange for an
+    incremental reparse on the next access and evicts the least recently
+    used documents when the cached source exceeds ``max_bytes``. Evicted
+    documents are parsed again on the next access.
+
+    Each session of a shared server has its own overlay of the documents it
+    opened, a uri open in two editors has a snapshot in each. ``opened``
+    holds the sessions a uri is open in, so the caches derived by uri are
+    released only after the last one closed it.
+
+    Handlers in the thread pool get their snapshot while didChange replaces
+    it on the event loop, ``_lock`` guards the cache. It is never held while
+    waiting for the lock of a document.
+    """
+
+    def __init__(self, parse: ParseFunc, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.parse = parse
+        self.max_bytes = max_bytes
+        self.documents: "OrderedDict[Hashable, DocumentTree]" = OrderedDict()
+        self.total_bytes = 0
+        self.opened: Dict[str, Set[Optional[int]]] = {}
+        self._lock = threading.RLock()
+
+    def _put(self, document: DocumentTree) -> DocumentTree:
+        with self._lock:
+            self._remove(document.key)
+            self.documents[document.key] = document
+            self.total_bytes += len(document.utf8_bytes)
+            while self.total_bytes > self.max_bytes and len(self.documents) > 1:
+                key, _ = next(iter(self.documents.items()))
+                LOGGER.debug(f"evict: {key}")
+                self._remove(key)
+        return document
+
+    def _remove(self, key: Hashable) -> None:
+        with self._lock:
+            document = self.documents.pop(key, None)
+            if document:
+                self.total_bytes -= len(document.utf8_bytes)
+
+    def _snapshot(
+        self, uri: str, version: Optional[int], source: str, session: Optional[int]
+    ) -> DocumentTree:
+        previous = self.documents.get(document_key(uri, session))
+        return self._put(
+            DocumentTree(
+                uri,
+                version,
+                source.encode("utf-8"),
+                self.parse,
+                # a handler in the thread pool may hold the lock of the uri
+                lock=previous.lock if previous else None,
+                session=session,
+            )
+        )
+
+    def open(
+        self,
+        uri: str,
+        version: Optional[int],
+        source: str,
+        session: Optional[int] = None,
+    ) -> DocumentTree:
+        self.opened.setdefault(uri, set()).add(session)
+        return self._snapshot(uri, version, source, session)
+
+    def change(
+        self,
+        uri: str,
+        version: Optional[int],
+        content_changes: Sequence[lsp_types.TextDocumentContentChangeEvent],
+        session: Optional[int] = None,
+    ) -> Optional[DocumentTree]:
+        """Create the snapshot of the next version from the previous one.
+
+        The previous tree is edited in place on the first access of the next
+        version for an incremental parse. A handler in the thread pool may
+        still hold the lock of the previous version, the event loop does not
+        wait for it here.
+        """
+        previous = self.documents.get(document_key(uri, session))
+        if not previous:
+            return None
+
+        document = DocumentTree(
+            uri,
+            version,
+            previous.utf8_bytes,
+            self.parse,
+            previous.lock,
+            session,
+            base=previous,
+        )
+        for change in content_changes:
+            document.apply_change(change)
+        return self._put(document)
+
+    def close(self, uri: str, session: Optional[int] = None) -> None:
+        self._remove(document_key(uri, session))
+        sessions = self.opened.get(uri)
+        if sessions is not None:
+            sessions.discard(session)
+            if not sessions:
+                del self.opened[uri]
+
+    def is_open(self, uri: str) -> bool:
+        """Open in any session."""
+        return uri in self.opened
+
+    def session_uris(self, session: Optional[int]) -> List[str]:
+        return [uri for uri, sessions in self.opened.items() if session in sessions]
+
+    def get(
+        self,
+        uri: str,
+        version: Optional[int],
+        source: str,
+        session: Optional[int] = None,
+    ) -> DocumentTree:
+        """Return the snapshot for the given version, reparsing if out of sync."""
+        key = document_key(uri, session)
+        with self._lock:
+            document = self.documents.get(key)
+            if document and document.version == version:
+                self.documents.move_to_end(key)
+                STATS.cache("documents", 1, 0)
+                return document
+        STATS.cache("documents", 0, 1)
+        LOGGER.debug(f"full parse: {uri}")
+        return self._snapshot(uri, version, source, session)
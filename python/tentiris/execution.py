@@ -0,0 +1,202 @@
+from typing import Optional, Any, Callable, Dict, Iterable, List, TypeVar
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import lsprotocol.types as lsp_types
+from .parser_pool import ParseCancelled
+
+LOGGER = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# where a request handler runs: on the event loop between the other messages,
+# or in the thread pool of the server while the loop goes on
+LOOP = "loop"
+THREAD = "thread"
+EXECUTION_MODES = (LOOP, THREAD)
+
+# the handlers that parse, highlight or walk a whole tree. tree-sitter
+# releases the GIL while parsing, the loop keeps reading didChange and
+# $/cancelRequest meanwhile. Diagnostics run in the thread pool anyway, see
+# ValidationScheduler, and the workspace index in a process pool, see
+# WorkspaceIndex.max_processes.
+DEFAULT_POLICY: Dict[str, str] = {
+    lsp_types.TEXT_DOCUMENT_COMPLETION: THREAD,
+    lsp_types.TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL: THREAD,
+    lsp_types.TEXT_DOCUMENT_SEMANTIC_TOKENS_FULL_DELTA: THREAD,
+    lsp_types.TEXT_DOCUMENT_SEMANTIC_TOKENS_RANGE: THREAD,
+    lsp_types.TEXT_DOCUMENT_DOCUMENT_SYMBOL: THREAD,
+    lsp_types.TEXT_DOCUMENT_FOLDING_RANGE: THREAD,
+}
+
+POLICY: Dict[str, str] = dict(DEFAULT_POLICY)
+
+
+def parse_policy(items: Iterable[str]) -> Dict[str, str]:
+    """{method: mode} of "method=mode" items, as given on the command line.
+    A method is a request or a command."""
+    policy = {}
+    for item in items:
+        method, _, mode = item.rpartition("=")
+        if not method or mode not in EXECUTION_MODES:
+            raise ValueError(
+                f"expected method={'|'.join(EXECUTION_MODES)}, got: {item}"
+            )
+        types = lsp_types.METHOD_TO_TYPES.get(method)
+        if mode != LOOP and types and types[1] is None:
+            # the order of didChange and the requests after it matters
+            raise ValueError(f"a notification runs on the loop: {method}")
+        policy[method] = mode
+    return policy
+
+
+def set_policy(overrides: Dict[str, str]) -> None:
+    """The default policy with the modes of overrides, before the handlers
+    are registered."""
+    POLICY.clear()
+    POLICY.update(DEFAULT_POLICY)
+    POLICY.update(overrides)
+
+
+def mode(method: str) -> str:
+    return POLICY.get(method, LOOP)
+
+
+# iterations of a cancellable loop between two checks, see Preorder
+CHECK_INTERVAL = 256
+
+
+class RequestCancelled(Exception):
+    """The request running in the thread pool was cancelled by the client
+    or superseded."""
+
+
+class CancelToken:
+    """Set from the event loop on $/cancelRequest. A handler adds the
+    conditions that make its result useless, like a newer version of its
+    document, see cancel_when."""
+
+    def __init__(self):
+        self.cancelled = False
+        self.conditions: List[Callable[[], bool]] = []
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    def is_cancelled(self) -> bool:
+        return self.cancelled or any(condition() for condition in self.conditions)
+
+
+# of the request running in the thread pool, None elsewhere
+_TOKEN: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar(
+    "token", default=None
+)
+
+
+def is_cancelled() -> bool:
+    """False outside of a request in the thread pool."""
+    token = _TOKEN.get()
+    return token is not None and token.is_cancelled()
+
+
+def check_cancelled() -> None:
+    """Raise RequestCancelled once the current request is cancelled."""
+    if is_cancelled():
+        raise RequestCancelled()
+
+
+def cancel_when(condition: Callable[[], bool]) -> None:
+    """Cancel the current request once condition() is true."""
+    token = _TOKEN.get()
+    if token is not None:
+        token.conditions.append(condition)
+
+
+def call_cancellable(is_cancelled: Callable[[], bool], f: Callable[..., T], *args) -> T:
+    """f(*args) as if in a request cancelled once is_cancelled() is true: the
+    checkpoints of the traversals and the parse stop it. For the work in the
+    thread pool that is not a request, like a validation."""
+    token = CancelToken()
+    token.conditions.append(is_cancelled)
+
+    def run() -> T:
+        _TOKEN.set(token)
+        return f(*args)
+
+    return contextvars.copy_context().run(run)
+
+
+class ThreadServer:
+    """The server as a handler in the thread pool sees it.
+
+    Messages to the client are sent from the event loop, a transport is not
+    thread safe. They are queued before the response, the loop sends them
+    first.
+    """
+
+    def __init__(self, ls, loop: asyncio.AbstractEventLoop):
+        self._ls = ls
+        self._loop = loop
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._ls, name)
+
+    def _call_soon(self, f: Callable[..., Any], *args, **keys) -> None:
+        self._loop.call_soon_threadsafe(functools.partial(f, *args, **keys))
+
+    def send_notification(self, *args, **keys) -> None:
+        self._call_soon(self._ls.send_notification, *args, **keys)
+
+    def show_message(self, *args, **keys) -> None:
+        self._call_soon(self._ls.show_message, *args, **keys)
+
+    def show_message_log(self, *args, **keys) -> None:
+        self._call_soon(self._ls.show_message_log, *args, **keys)
+
+
+async def run_in_thread(
+    ls,
+    f: Callable[..., T],
+    *args,
+    lock: Optional[threading.RLock] = None,
+) -> T:
+    """f(ls, *args) in the thread pool of ls with lock held, the lock of the
+    document the request is about.
+
+    On $/cancelRequest pygls cancels the task awaiting it. A handler that has
+    not started yet does not run, a running one stops at its next checkpoint,
+    an is_cancelled check of a traversal, the token encoder or the parse, and
+    its result is dropped. RequestCancelled of a superseded request is for
+    the caller to answer as cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    token = CancelToken()
+
+    def call() -> T:
+        try:
+            return f(ThreadServer(ls, loop), *args)
+        except ParseCancelled:
+            if token.is_cancelled():
+                raise RequestCancelled()
+            # a timeout
+            raise
+
+    def run() -> T:
+        _TOKEN.set(token)
+        check_cancelled()
+        if lock is None:
+            return call()
+        with lock:
+            # cancelled while a validation or another handler held the lock
+            check_cancelled()
+            return call()
+
+    try:
+        return await loop.run_in_executor(
+            ls.thread_pool_executor, contextvars.copy_context().run, run
+        )
+    except asyncio.CancelledError:
+        token.cancel()
+        raise
@@ -1,256 +1,612 @@
-from typing import Optional, List, NamedTuple, Tuple, Iterable
-import json
+from typing import Optional, List, NamedTuple, Tuple, Dict, Callable, Hashable, Any
+from array import array
+import itertools
+import os
+import threading
+import urllib.parse
 import lsprotocol.types as lsp_types
 from pygls.server import LanguageServer
+from pygls.uris import from_fs_path, to_fs_path
+from tree_sitter import Tree
 
 
-import tree_sitter
 import logging
+from . import execution
+from .documents import DocumentTree, DocumentTreeStore, document_key, iter_ancestors
+from .semantic_tokens import (
+    Highlighter,
+    SemanticToken,
+    TOKEN_MODIFIERS,
+    TOKEN_TYPES,
+    semantic_tokens_edits,
+    semantic_tokens_from_utf8bytes,
+    to_relative,
+    token_encoder,
+)
+from .parser_pool import ParseCancelled, treesitter_parse
+from .validation import ValidationScheduler
+from .diagnostics import MarkdownDiagnostics, NAME
+from .headings import SlugCounter, slugify
+from .large_documents import SETTINGS, Regions
+from .outline import Outline, Outliner
+from .path_trie import PrefixIndex
+from .sessions import session_of
+from .completion import (
+    Completer,
+    NO_COMPLETION_TYPES,
+    completion_context,
+    LocalAnchors,
+    line_prefix,
+    local_references,
+)
+from .workspace_index import (
+    WorkspaceIndex,
+    FileSymbols,
+    HeadingSymbol,
+    LinkSymbol,
+    Span,
+    MARKDOWN_SUFFIXES,
+    document_symbols,
+    resolve_link,
+    span_contains,
+)
 
 LOGGER = logging.getLogger(__name__)
 
-NAME = "tentiris"
 
-MD_LANGUAGE = tree_sitter.Language("build/my-languages.dll", "markdown")
+def _parse(utf8_bytes: bytes, old_tree: Optional[Tree] = None) -> Tree:
+    # a request in the thread pool stops parsing once it is cancelled, a
+    # validation once it is stale, see _validate_markdown
+    return treesitter_parse(utf8_bytes, old_tree, is_cancelled=execution.is_cancelled)
 
 
-def treesitter_parse(utf8_bytes: bytes) -> tree_sitter.Tree:
-    parser = tree_sitter.Parser()
-    parser.set_language(MD_LANGUAGE)
-    return parser.parse(utf8_bytes)
+DOCUMENTS = DocumentTreeStore(_parse)
 
 
-def iter_node(
-    node: tree_sitter.Node, parent: List[tree_sitter.Node]
-) -> Iterable[List[tree_sitter.Node]]:
-    path = [node] + parent
-    yield path
+def document_path(uri: str) -> Optional[str]:
+    """File system path of a file: uri, None for untitled documents."""
+    if not uri.startswith("file:"):
+        return None
+    return to_fs_path(uri)
 
-    cursor = node.walk()
-    if cursor.goto_first_child():
-        while True:
-            for child in iter_node(cursor.node, path):
-                yield child
-            if not cursor.goto_next_sibling():
-                break
 
+def is_open_path(path: str) -> bool:
+    """Open in the editor of any session."""
+    return any(document_path(uri) == path for uri in DOCUMENTS.opened)
+
+
+WORKSPACE_INDEX = WorkspaceIndex(is_open_path)
 
-def node_contains(node: tree_sitter.Node, position: lsp_types.Position) -> bool:
-    if position.line < node.start_point[0]:
-        return False
-    if position.line > node.end_point[0]:
-        return False
-    if position.line == node.start_point[0]:
-        if position.character < node.start_point[1]:
-            return False
-        if position.line == node.end_point[0]:
-            return position.character <= node.end_point[1]
-        else:
-            return True
-    else:
-        if position.line == node.end_point[0]:
-            return position.character <= node.end_point[1]
-        else:
-            return True
 
+def get_document_tree(ls: LanguageServer, uri: str) -> DocumentTree:
+    """Snapshot of the current version of the document, shared by all features."""
+    doc = ls.workspace.get_document(uri)
+    document = DOCUMENTS.get(uri, doc.version, doc.source, session_of(ls))
+    # a request in the thread pool is superseded by the next version
+    execution.cancel_when(
+        lambda: ls.workspace.get_document(uri).version != document.version
+    )
+    return document
+
+
+def document_lock(ls: LanguageServer, params: Any) -> Optional[threading.RLock]:
+    """The lock of the document of a request, a handler in the thread pool
+    holds it, see execution.run_in_thread."""
+    text_document = getattr(params, "text_document", None)
+    if text_document is None:
+        return None
+    return get_document_tree(ls, text_document.uri).lock
+
+
+MARKDOWN_DIAGNOSTICS = MarkdownDiagnostics()
+
+
+# the visible and edited rows of each document, a large one is served in
+# them only
+REGIONS = Regions()
+
+
+def _validate_markdown(
+    document: DocumentTree, is_stale: Optional[Callable[[], bool]] = None
+) -> Optional[List[lsp_types.Diagnostic]]:
+    def validate() -> Optional[List[lsp_types.Diagnostic]]:
+        if SETTINGS.is_large(document):
+            return MARKDOWN_DIAGNOSTICS.validate(
+                document,
+                is_stale,
+                REGIONS.rows(document.key),
+                # from the sections of the outline reused across versions
+                set(_anchors(document).keys),
+            )
+        return MARKDOWN_DIAGNOSTICS.validate(document, is_stale)
 
-def _validate_markdown(source: str):
     try:
-        parsed = treesitter_parse(source.encode("utf-8"))
-        return []
+        if is_stale is None:
+            return validate()
+        # the parse and the outline walk of a stale version stop early too
+        return execution.call_cancellable(is_stale, validate)
+    except (ParseCancelled, execution.RequestCancelled):
+        raise
     except Exception as e:
         LOGGER.warn(e)
         raise e
 
 
-def _validate_json(source: str):
-    """Validates json file."""
-    diagnostics = []
-
+def _validate(
+    document: DocumentTree, is_stale: Callable[[], bool]
+) -> Optional[List[lsp_types.Diagnostic]]:
+    """Runs in the thread pool, see ValidationScheduler."""
+    LOGGER.debug(f"validating: {document.uri} ({document.version})")
+    if not document.utf8_bytes:
+        return []
     try:
-        json.loads(source)
-    except json.JSONDecodeError as err:
-        msg = err.msg
-        col = err.colno
-        line = err.lineno
-
-        d = lsp_types.Diagnostic(
-            range=lsp_types.Range(
-                start=lsp_types.Position(line=line - 1, character=col - 1),
-                end=lsp_types.Position(line=line - 1, character=col),
-            ),
-            message=msg,
-            source=NAME,
-        )
-
-        diagnostics.append(d)
-
+        diagnostics = _validate_markdown(document, is_stale)
+    except (ParseCancelled, execution.RequestCancelled):
+        return None
+    path = document_path(document.uri)
+    if diagnostics is not None and path:
+        # the workspace index reuses the tree instead of parsing the file again,
+        # navigation shares the same symbols
+        WORKSPACE_INDEX.update_document(path, document)
     return diagnostics
 
 
-def _validate(ls: LanguageServer, params):
-    ls.show_message_log("Validating markdown...")
-
-    text_doc = ls.workspace.get_document(params.text_document.uri)
-
-    source = text_doc.source
-    diagnostics = _validate_markdown(source) if source else []
-
-    ls.publish_diagnostics(text_doc.uri, diagnostics)
+VALIDATION = ValidationScheduler(_validate)
 
 
 def did_open(ls, params: lsp_types.DidOpenTextDocumentParams):
     """Text document did open notification."""
     ls.show_message("Text Document Did Open")
-    _validate(ls, params)
+    text_doc = params.text_document
+    document = DOCUMENTS.open(
+        text_doc.uri, text_doc.version, text_doc.text, session_of(ls)
+    )
+    VALIDATION.schedule(ls, document, delay=0)
 
 
 def did_change(ls, params: lsp_types.DidChangeTextDocumentParams):
     """Text document did change notification."""
-    _validate(ls, params)
+    uri = params.text_document.uri
+    session = session_of(ls)
+    # let a running validation of the previous version stop early
+    VALIDATION.cancel(uri, session)
+    REGIONS.edit(document_key(uri, session), params.content_changes)
+    document = DOCUMENTS.change(
+        uri,
+        params.text_document.version,
+        params.content_changes,
+        session,
+    )
+    if not document:
+        document = get_document_tree(ls, uri)
+    VALIDATION.schedule(ls, document)
+
+
+def _close(uri: str, session: Optional[int]) -> None:
+    VALIDATION.cancel(uri, session)
+    DOCUMENTS.close(uri, session)
+    SEMANTIC_TOKENS_RESULTS.pop(document_key(uri, session), None)
+    REGIONS.release(document_key(uri, session))
+    OUTLINER.release(document_key(uri, session))
+    MARKDOWN_DIAGNOSTICS.release(document_key(uri, session))
+    HIGHLIGHTER.release(document_key(uri, session))
+    if DOCUMENTS.is_open(uri):
+        # the index of its unsaved changes serves the editor of another session
+        return
+    path = document_path(uri)
+    if path:
+        # unsaved changes were discarded, index the file on disk again
+        WORKSPACE_INDEX.queue_changes([(path, False)])
 
 
 def did_close(ls: LanguageServer, params: lsp_types.DidCloseTextDocumentParams):
     """Text document did close notification."""
+    _close(params.text_document.uri, session_of(ls))
     ls.show_message("Text Document Did Close")
 
 
+def end_session(ls: LanguageServer) -> None:
+    """Close the documents a client left open, see sessions.SessionServer."""
+    session = session_of(ls)
+    for uri in DOCUMENTS.session_uris(session):
+        _close(uri, session)
+
+
+def did_change_watched_files(
+    ls: LanguageServer, params: lsp_types.DidChangeWatchedFilesParams
+):
+    """Update the workspace index for files changed outside of the editor."""
+    changes = []
+    for change in params.changes:
+        path = document_path(change.uri)
+        if path and path.endswith(MARKDOWN_SUFFIXES):
+            changes.append((path, change.type == lsp_types.FileChangeType.Deleted))
+    if changes:
+        WORKSPACE_INDEX.queue_changes(changes)
+
+
+class AnchorTarget(NamedTuple):
+    """A file, or a heading in it if anchor is set."""
+
+    path: str
+    anchor: Optional[str]
+
+
+def _symbols(document: DocumentTree) -> FileSymbols:
+    return document_symbols(
+        document_path(document.uri) or document.uri,
+        document,
+        execution.is_cancelled,
+    )
+
+
+def _target_at(
+    symbols: FileSymbols, position: lsp_types.Position
+) -> Optional[AnchorTarget]:
+    """The heading or the link target under the cursor."""
+    for heading in symbols.headings:
+        if span_contains(heading.span, position.line, position.character):
+            return AnchorTarget(symbols.path, heading.anchor)
+    for link in symbols.links:
+        if span_contains(link.span, position.line, position.character):
+            return AnchorTarget(
+                resolve_link(symbols.path, link),
+                urllib.parse.unquote(link.anchor) or None,
+            )
+    return None
+
+
+def _heading(symbols: FileSymbols, target: AnchorTarget) -> Optional[HeadingSymbol]:
+    if not target.anchor:
+        return None
+    if target.path == symbols.path:
+        # the index lags behind the editor until the next validation
+        return next((h for h in symbols.headings if h.anchor == target.anchor), None)
+    return WORKSPACE_INDEX.heading(target.path, target.anchor)
+
+
+def _links_to(
+    symbols: FileSymbols, target: AnchorTarget
+) -> List[Tuple[str, LinkSymbol]]:
+    found = [
+        (source, link)
+        for source, link in WORKSPACE_INDEX.links_to(target.path, target.anchor)
+        if source != symbols.path
+    ]
+    for link in symbols.links:
+        if resolve_link(symbols.path, link) != target.path:
+            continue
+        if target.anchor is None or urllib.parse.unquote(link.anchor) == target.anchor:
+            found.append((symbols.path, link))
+    return found
+
+
+def _uri(document: DocumentTree, symbols: FileSymbols, path: str) -> str:
+    if path == symbols.path:
+        return document.uri
+    return from_fs_path(path)
+
+
+def _range(span: Span) -> lsp_types.Range:
+    return lsp_types.Range(
+        start=lsp_types.Position(line=span[0], character=span[1]),
+        end=lsp_types.Position(line=span[2], character=span[3]),
+    )
+
+
+def definition(
+    ls: LanguageServer, params: lsp_types.DefinitionParams
+) -> Optional[lsp_types.Location]:
+    """The heading of an anchor link, or the top of a linked file."""
+    document = get_document_tree(ls, params.text_document.uri)
+    symbols = _symbols(document)
+    target = _target_at(symbols, params.position)
+    if not target:
+        return None
+    heading = _heading(symbols, target)
+    if heading:
+        span = heading.span
+    elif target.anchor is None and (
+        target.path in WORKSPACE_INDEX.files or os.path.exists(target.path)
+    ):
+        span = (0, 0, 0, 0)
+    else:
+        return None
+    return lsp_types.Location(
+        uri=_uri(document, symbols, target.path), range=_range(span)
+    )
+
+
+def references(
+    ls: LanguageServer, params: lsp_types.ReferenceParams
+) -> List[lsp_types.Location]:
+    """Links to the heading or the file under the cursor, from the link index."""
+    document = get_document_tree(ls, params.text_document.uri)
+    symbols = _symbols(document)
+    target = _target_at(symbols, params.position)
+    if not target:
+        return []
+    locations = []
+    heading = _heading(symbols, target)
+    if heading and params.context.include_declaration:
+        locations.append(
+            lsp_types.Location(
+                uri=_uri(document, symbols, target.path), range=_range(heading.span)
+            )
+        )
+    for source, link in _links_to(symbols, target):
+        locations.append(
+            lsp_types.Location(
+                uri=_uri(document, symbols, source), range=_range(link.span)
+            )
+        )
+    return locations
+
+
+def prepare_rename(
+    ls: LanguageServer, params: lsp_types.PrepareRenameParams
+) -> Optional[lsp_types.PrepareRenameResult_Type1]:
+    """Only headings can be renamed, from the heading or a link to it."""
+    document = get_document_tree(ls, params.text_document.uri)
+    symbols = _symbols(document)
+    target = _target_at(symbols, params.position)
+    heading = _heading(symbols, target) if target else None
+    if not heading:
+        return None
+    # the range under the cursor, the edit may be in another file
+    for h in symbols.headings:
+        if span_contains(h.span, params.position.line, params.position.character):
+            return lsp_types.PrepareRenameResult_Type1(
+                range=_range(h.title_span), placeholder=heading.title
+            )
+    for link in symbols.links:
+        if span_contains(link.span, params.position.line, params.position.character):
+            return lsp_types.PrepareRenameResult_Type1(
+                range=_range(_anchor_span(link)), placeholder=heading.title
+            )
+    return None
+
+
+def _anchor_span(link: LinkSymbol) -> Span:
+    # a link destination has no whitespace, it is on a single line
+    length = len(link.anchor.encode("utf-16-le")) // 2
+    return (link.span[2], link.span[3] - length, link.span[2], link.span[3])
+
+
+def rename(
+    ls: LanguageServer, params: lsp_types.RenameParams
+) -> Optional[lsp_types.WorkspaceEdit]:
+    """Rename a heading and update the anchor of every link to it."""
+    document = get_document_tree(ls, params.text_document.uri)
+    symbols = _symbols(document)
+    target = _target_at(symbols, params.position)
+    heading = _heading(symbols, target) if target else None
+    if not target or not heading:
+        return None
+    anchor = slugify(params.new_name)
+    if not anchor:
+        return None
+
+    changes: Dict[str, List[lsp_types.TextEdit]] = {}
+
+    def add(path: str, span: Span, new_text: str):
+        changes.setdefault(_uri(document, symbols, path), []).append(
+            lsp_types.TextEdit(range=_range(span), new_text=new_text)
+        )
+
+    add(target.path, heading.title_span, params.new_name)
+    for source, link in _links_to(symbols, target):
+        add(source, _anchor_span(link), anchor)
+    return lsp_types.WorkspaceEdit(changes=changes)
+
+
+# candidates per response, the client asks again as the prefix grows
+MAX_COMPLETION_ITEMS = 200
+# items per $/progress notification when the client accepts partial results,
+# completions and workspace symbols
+PARTIAL_RESULT_BATCH = 50
+
+
 def completions(
     ls: LanguageServer,
     params: lsp_types.CompletionParams,
 ) -> lsp_types.CompletionList:
-    """ """
-    uri = params.text_document.uri
-    doc = ls.workspace.get_document(uri)
-    tree = treesitter_parse(doc.source.encode("utf-8"))
-
-    active_node = None
-    active_path = []
-    for path in iter_node(tree.root_node, []):
-        node = path[0]
-        if params.position.line < node.start_point[0]:
+    """Workspace paths and heading anchors in a link destination, reference
+    labels in a reference link."""
+    document = get_document_tree(ls, params.text_document.uri)
+
+    empty = lsp_types.CompletionList(is_incomplete=False, items=[])
+    for node in iter_ancestors(document.node_at(params.position)):
+        if node.type in NO_COMPLETION_TYPES:
+            return empty
+    context = completion_context(line_prefix(document, params.position))
+    if not context:
+        return empty
+
+    candidates = Completer(
+        WORKSPACE_INDEX,
+        lambda: _anchors(document),
+        lambda: document.get_derived(
+            "references", lambda document: local_references(_symbols(document))
+        ),
+        document_path(document.uri),
+        params.position,
+        # one more tells the list is incomplete
+        MAX_COMPLETION_ITEMS + 1,
+    ).complete(context)
+
+    token = params.partial_result_token
+    items: List[lsp_types.CompletionItem] = []
+    count = 0
+    is_incomplete = False
+    for item in candidates:
+        if count == MAX_COMPLETION_ITEMS:
+            is_incomplete = True
             break
-        if node_contains(node, params.position):
-            active_node = node
-            active_path = path
-
-    assert active_node
-    match active_node.type:
-        case "document":
-            return lsp_types.CompletionList(
-                is_incomplete=False,
-                items=[
-                    lsp_types.CompletionItem(label='"', detail="quote"),
-                    lsp_types.CompletionItem(label="["),
-                    lsp_types.CompletionItem(label="]"),
-                    lsp_types.CompletionItem(label="{"),
-                    lsp_types.CompletionItem(label="}"),
-                ],
+        items.append(item)
+        count += 1
+        if token is not None and len(items) == PARTIAL_RESULT_BATCH:
+            # no more partial results for a cancelled request
+            execution.check_cancelled()
+            ls.send_notification(
+                lsp_types.PROGRESS, lsp_types.ProgressParams(token=token, value=items)
             )
-
-        case _:
-            LOGGER.warn(active_path)
-            return lsp_types.CompletionList(
-                is_incomplete=False,
-                items=[
-                    lsp_types.CompletionItem(label='"', detail="quote"),
-                    lsp_types.CompletionItem(label="["),
-                    lsp_types.CompletionItem(label="]"),
-                    lsp_types.CompletionItem(label="{"),
-                    lsp_types.CompletionItem(label="}"),
-                ],
+            items = []
+    if token is not None and items:
+        # with partial results the response itself carries no items
+        ls.send_notification(
+            lsp_types.PROGRESS, lsp_types.ProgressParams(token=token, value=items)
+        )
+        items = []
+    return lsp_types.CompletionList(is_incomplete=is_incomplete, items=items)
+
+
+# headings per workspace/symbol response
+MAX_WORKSPACE_SYMBOLS = 200
+
+
+def workspace_symbol(
+    ls: LanguageServer, params: lsp_types.WorkspaceSymbolParams
+) -> List[lsp_types.SymbolInformation]:
+    """Headings of every indexed file by fuzzy rank, best first."""
+    token = params.partial_result_token
+    symbols: List[lsp_types.SymbolInformation] = []
+    for path, heading in WORKSPACE_INDEX.search_headings(
+        params.query, MAX_WORKSPACE_SYMBOLS
+    ):
+        symbols.append(
+            lsp_types.SymbolInformation(
+                name=heading.title or "#" * heading.level,
+                kind=lsp_types.SymbolKind.String,
+                location=lsp_types.Location(
+                    uri=from_fs_path(path), range=_range(heading.span)
+                ),
+                container_name=os.path.basename(path),
+            )
+        )
+        if token is not None and len(symbols) == PARTIAL_RESULT_BATCH:
+            ls.send_notification(
+                lsp_types.PROGRESS, lsp_types.ProgressParams(token=token, value=symbols)
             )
+            symbols = []
+    if token is not None and symbols:
+        ls.send_notification(
+            lsp_types.PROGRESS, lsp_types.ProgressParams(token=token, value=symbols)
+        )
+        symbols = []
+    return symbols
+
+
+# last full token array per document key for semanticTokens/full/delta
+SEMANTIC_TOKENS_RESULTS: Dict[Hashable, Tuple[str, "array[int]"]] = {}
+SEMANTIC_TOKENS_RESULT_IDS = itertools.count()
 
 
-class SemanticToken(NamedTuple):
-    start: Tuple[int, int]
-    byte_len: int
-    type: str
-    modifiers: List[str]
-
-    @staticmethod
-    def create(node: tree_sitter.Node, type: str) -> "SemanticToken":
-        # node.start_point,
-        byte_len = node.end_byte - node.start_byte
-        if node.start_point[0] != node.end_point[0] and node.end_point[1] == 0:
-            byte_len -= 1
-        return SemanticToken(node.start_point, byte_len, type, [])
-
-
-def semantic_tokens_from_utf8bytes(src: bytes) -> List[SemanticToken]:
-    parsed = treesitter_parse(src)
-
-    data: List[SemanticToken] = []
-
-    def traverse(node: tree_sitter.Node, indent=""):
-        # print(f"{indent}{node}")
-
-        match node.type:
-            case "document" | "section" | "list" | "atx_heading":
-                cursor = node.walk()
-                if cursor.goto_first_child():
-                    while True:
-                        traverse(cursor.node, indent + "  ")
-                        if not cursor.goto_next_sibling():
-                            break
-            case "inline" | "paragraph" | "fenced_code_block":
-                pass
-            case "atx_h1_marker" | "atx_h2_marker":
-                data.append(
-                    SemanticToken.create(node, lsp_types.SemanticTokenTypes.Struct)
-                )
-            case "list_item":
-                data.append(
-                    SemanticToken.create(node, lsp_types.SemanticTokenTypes.Property)
-                )
-            case _:
-                raise NotImplementedError(node)
-
-    traverse(parsed.root_node)
-
-    return data
-
-
-def to_relative(
-    tokens: List[SemanticToken], token_types: List[str]
-) -> lsp_types.SemanticTokens:
-    data = []
-    last: Optional[SemanticToken] = None
-    for token in tokens:
-        # deltaLine: (lineno - last_line)
-        # deltaStart: (start - last_start)
-        # length: (end - start)
-        # tokenType: 0
-        # tokenModifiers: 0
-        deltaLine = token.start[0]
-        deltaStart = token.start[1]
-        if last:
-            deltaLine -= last.start[0]
-            if deltaLine == 0:
-                deltaStart -= last.start[1]
-
-        data += [
-            deltaLine,
-            deltaStart,
-            token.byte_len,
-            token_types.index(token.type),
-            0,
-        ]
-        last = token
-
-    return lsp_types.SemanticTokens(data=data)
+HIGHLIGHTER = Highlighter()
+SEMANTIC_TOKENS_LEGEND = lsp_types.SemanticTokensLegend(
+    token_types=TOKEN_TYPES, token_modifiers=TOKEN_MODIFIERS
+)
+
+
+def _full_semantic_tokens(document: DocumentTree) -> Tuple[str, "array[int]"]:
+    tokens = document.get_derived(
+        "semantic_tokens",
+        lambda document: HIGHLIGHTER.tokens(
+            document, is_cancelled=execution.is_cancelled
+        ),
+    )
+    data = token_encoder(tuple(TOKEN_TYPES), tuple(TOKEN_MODIFIERS)).encode(
+        tokens, document, execution.is_cancelled
+    )
+    result = (str(next(SEMANTIC_TOKENS_RESULT_IDS)), data)
+    SEMANTIC_TOKENS_RESULTS[document.key] = result
+    return result
 
 
 def semantic_tokens(ls: LanguageServer, params: lsp_types.SemanticTokensParams):
     """See https://microsoft.github.io/language-server-protocol/specification#textDocument_semanticTokens
     for details on how semantic tokens are encoded."""
-    uri = params.text_document.uri
-    doc = ls.workspace.get_document(uri)
-    tokens = semantic_tokens_from_utf8bytes(doc.source.encode("utf-8"))
-    match ls.lsp.client_capabilities:  # type: ignore
-        case lsp_types.ClientCapabilities() as client_capabilities:
-            return to_relative(
-                tokens, client_capabilities.text_document.semantic_tokens.token_types  # type: ignore
-            )
-        case _:
-            raise Exception()
+    document = get_document_tree(ls, params.text_document.uri)
+    if SETTINGS.is_large(document):
+        # the client asks for the visible range instead
+        return None
+    result_id, data = _full_semantic_tokens(document)
+    return lsp_types.SemanticTokens(data=data.tolist(), result_id=result_id)
+
+
+def semantic_tokens_delta(
+    ls: LanguageServer, params: lsp_types.SemanticTokensDeltaParams
+):
+    """Edits from the token array of previous_result_id."""
+    document = get_document_tree(ls, params.text_document.uri)
+    if SETTINGS.is_large(document):
+        SEMANTIC_TOKENS_RESULTS.pop(document.key, None)
+        return None
+    previous = SEMANTIC_TOKENS_RESULTS.get(document.key)
+    result_id, data = _full_semantic_tokens(document)
+    if not previous or previous[0] != params.previous_result_id:
+        return lsp_types.SemanticTokens(data=data.tolist(), result_id=result_id)
+    return lsp_types.SemanticTokensDelta(
+        edits=semantic_tokens_edits(previous[1], data), result_id=result_id
+    )
+
+
+def _revalidate(ls: LanguageServer, document: DocumentTree) -> None:
+    # on the event loop, a newer version is validated anyway
+    if DOCUMENTS.documents.get(document.key) is document:
+        VALIDATION.schedule(ls, document)
+
+
+def semantic_tokens_range(
+    ls: LanguageServer, params: lsp_types.SemanticTokensRangeParams
+):
+    """Tokens of the nodes intersecting the visible range only, all a large
+    document gets."""
+    document = get_document_tree(ls, params.text_document.uri)
+    rows = (params.range.start.line, params.range.end.line)
+    large = SETTINGS.is_large(document)
+    if REGIONS.show(document.key, rows) and large:
+        # the diagnostics follow the scroll
+        ls.loop.call_soon_threadsafe(_revalidate, ls, document)
+    tokens = HIGHLIGHTER.tokens(document, rows, execution.is_cancelled, bounded=large)
+    return to_relative(
+        tokens, TOKEN_TYPES, document, TOKEN_MODIFIERS, execution.is_cancelled
+    )
+
+
+OUTLINER = Outliner()
+
+
+def _outline(document: DocumentTree) -> Outline:
+    return document.get_derived(
+        "outline", lambda document: OUTLINER.outline(document, execution.is_cancelled)
+    )
+
+
+def _anchors(document: DocumentTree) -> LocalAnchors:
+    """The anchors of the headings of the outline, whose sections are reused
+    across versions, a new version does not walk the whole tree for them
+    like _symbols."""
+
+    def create(document: DocumentTree) -> LocalAnchors:
+        slugs = SlugCounter()
+        anchors = []
+        for heading in _outline(document).headings:
+            anchor = slugs.add(slugify(heading.title))
+            if anchor:
+                anchors.append((anchor, (anchor, heading)))
+        return PrefixIndex(anchors)
+
+    return document.get_derived("anchors", create)
+
+
+def document_symbol(ls: LanguageServer, params: lsp_types.DocumentSymbolParams):
+    """The heading tree, clients show it as outline and breadcrumbs."""
+    document = get_document_tree(ls, params.text_document.uri)
+    return _outline(document).symbols
+
+
+def folding_range(ls: LanguageServer, params: lsp_types.FoldingRangeParams):
+    """Headings until the next of the same level and multi-line blocks."""
+    document = get_document_tree(ls, params.text_document.uri)
+    return _outline(document).folding_ranges
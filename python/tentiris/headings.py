@@ -0,0 +1,68 @@
+from typing import Optional, Dict, Tuple
+import re
+import tree_sitter
+
+HEADING_TYPES = ("atx_heading", "setext_heading")
+
+ATX_LEVELS = {f"atx_h{level}_marker": level for level in range(1, 7)}
+SETEXT_LEVELS = {"setext_h1_underline": 1, "setext_h2_underline": 2}
+
+NOT_SLUG = re.compile(r"[^\w\- ]")
+CLOSING_SEQUENCE = re.compile(r"(^|\s+)#+\s*$")
+CLOSING_SEQUENCE_BYTES = re.compile(rb"(^|\s+)#+\s*$")
+
+
+def slugify(title: str) -> str:
+    """GitHub style anchor of a heading title."""
+    return NOT_SLUG.sub("", title.strip().lower()).replace(" ", "-")
+
+
+def heading_level(node: tree_sitter.Node) -> int:
+    for child in node.children:
+        level = ATX_LEVELS.get(child.type) or SETEXT_LEVELS.get(child.type)
+        if level:
+            return level
+    return 0
+
+
+def heading_title(node: tree_sitter.Node, utf8_bytes: bytes) -> str:
+    content = node.child_by_field_name("heading_content")
+    if not content:
+        return ""
+    title = utf8_bytes[content.start_byte : content.end_byte].decode(
+        "utf-8", errors="replace"
+    )
+    if node.type == "atx_heading":
+        title = CLOSING_SEQUENCE.sub("", title)
+    return " ".join(title.split())
+
+
+def heading_title_range(
+    node: tree_sitter.Node, utf8_bytes: bytes
+) -> Optional[Tuple[int, int]]:
+    """Byte range of the title text, without markers and closing sequence."""
+    content = node.child_by_field_name("heading_content")
+    if not content:
+        return None
+    text = utf8_bytes[content.start_byte : content.end_byte]
+    if node.type == "atx_heading":
+        m = CLOSING_SEQUENCE_BYTES.search(text)
+        if m:
+            text = text[: m.start()]
+    start = content.start_byte + len(text) - len(text.lstrip())
+    return (start, content.start_byte + len(text.rstrip()))
+
+
+class SlugCounter:
+    """Numbers duplicate slugs like GitHub: title, title-1, title-2..."""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+
+    def add(self, slug: str) -> Optional[str]:
+        """Return the unique anchor of the slug, or None for an empty slug."""
+        if not slug:
+            return None
+        count = self.counts.get(slug, 0)
+        self.counts[slug] = count + 1
+        return slug if count == 0 else f"{slug}-{count}"
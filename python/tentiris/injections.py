@@ -0,0 +1,123 @@
+from typing import Optional, List, NamedTuple, Dict, Iterator
+import functools
+import logging
+import tree_sitter
+from .parser_pool import MD_INLINE_PARSERS, ParserPool, load_language
+from .traversal import Preorder
+
+LOGGER = logging.getLogger(__name__)
+
+# language of the info string of a fenced code block: grammar in the library
+EMBEDDED_GRAMMARS: Dict[str, str] = {
+    "json": "json",
+    "jsonc": "json",
+    "python": "python",
+    "py": "python",
+    "python3": "python",
+    "yaml": "yaml",
+    "yml": "yaml",
+}
+
+
+class EmbeddedLanguage(NamedTuple):
+    name: str
+    language: tree_sitter.Language
+    parsers: ParserPool
+
+
+@functools.lru_cache(maxsize=None)
+def load_grammar(name: str) -> Optional[EmbeddedLanguage]:
+    """Load a grammar the first time a block of its language is seen.
+
+    None if the grammar was not built into the library.
+    """
+    try:
+        language = load_language(name)
+    except AttributeError as e:
+        LOGGER.warning(f"no {name} grammar: {e}")
+        return None
+    return EmbeddedLanguage(name, language, ParserPool(language))
+
+
+def embedded_language(info: Optional[str]) -> Optional[EmbeddedLanguage]:
+    """The grammar of a fenced code block, by the language of its info string."""
+    if not info:
+        return None
+    grammar = EMBEDDED_GRAMMARS.get(info.lower())
+    if not grammar:
+        return None
+    return load_grammar(grammar)
+
+
+def fence_language(block: tree_sitter.Node, utf8_bytes: bytes) -> Optional[str]:
+    """The language of the info string of a fenced_code_block, ```python -> python."""
+    for child in block.children:
+        if child.type == "info_string":
+            for language in child.children:
+                if language.type == "language":
+                    return utf8_bytes[language.start_byte : language.end_byte].decode(
+                        "utf-8", errors="replace"
+                    )
+            return None
+    return None
+
+
+def content_ranges(
+    node: tree_sitter.Node, utf8_bytes: bytes
+) -> List[tree_sitter.Range]:
+    """The node without the block continuations ("> " of a quote, the indent
+    of a list item) on its following lines. An inline node or the content of
+    a code block is parsed in these ranges with another grammar."""
+    if utf8_bytes.find(b"\n", node.start_byte, node.end_byte) == -1:
+        return [
+            tree_sitter.Range(
+                node.start_point, node.end_point, node.start_byte, node.end_byte
+            )
+        ]
+    ranges = []
+    start_point, start_byte = node.start_point, node.start_byte
+    for child in node.children:
+        if child.type == "block_continuation":
+            if child.start_byte > start_byte:
+                ranges.append(
+                    tree_sitter.Range(
+                        start_point, child.start_point, start_byte, child.start_byte
+                    )
+                )
+            start_point, start_byte = child.end_point, child.end_byte
+    if node.end_byte > start_byte:
+        ranges.append(
+            tree_sitter.Range(start_point, node.end_point, start_byte, node.end_byte)
+        )
+    return ranges
+
+
+def parse_injection(
+    ranges: List[tree_sitter.Range], utf8_bytes: bytes, parsers: ParserPool
+) -> tree_sitter.Tree:
+    """Parse only the ranges of the document with the parser of the pool."""
+    parser = parsers.get()
+    parser.set_included_ranges(ranges)
+    return parser.parse(utf8_bytes)
+
+
+class InlineLink(NamedTuple):
+    # without the angle brackets of <a b.md>
+    destination: bytes
+    start_byte: int
+    node: tree_sitter.Node
+
+
+def inline_links(inline: tree_sitter.Node, utf8_bytes: bytes) -> Iterator[InlineLink]:
+    """The destinations of the links in an inline node, from the inline
+    grammar. A link in a code span is text and an image is not a link."""
+    tree = parse_injection(
+        content_ranges(inline, utf8_bytes), utf8_bytes, MD_INLINE_PARSERS
+    )
+    for node in Preorder(tree.root_node, types=("link_destination",)):
+        if node.parent.type != "inline_link":
+            continue
+        start, end = node.start_byte, node.end_byte
+        if utf8_bytes[start : start + 1] == b"<" and utf8_bytes[end - 1 : end] == b">":
+            start, end = start + 1, end - 1
+        yield InlineLink(utf8_bytes[start:end], start, node)
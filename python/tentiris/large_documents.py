@@ -0,0 +1,149 @@
+from typing import Any, Deque, Dict, Hashable, List, Sequence, Tuple
+import collections
+import logging
+import threading
+import lsprotocol.types as lsp_types
+from .documents import DocumentTree
+
+LOGGER = logging.getLogger(__name__)
+
+# a document above this size is served in its visible and edited regions
+# only, 0 never
+LARGE_DOCUMENT_BYTES = 1024 * 1024
+# the edits of a large document that are validated, the latest first
+EDITED_REGIONS = 4
+
+# (first, last) row
+Rows = Tuple[int, int]
+
+
+class Settings:
+    """Thresholds of the large document mode, from the "Tentiris"
+    configuration section of the client, see commands.load_settings.
+
+    A shared server has one for every session, the last one read wins.
+    """
+
+    # key in the section: attribute
+    KEYS = {
+        "largeDocumentBytes": "large_document_bytes",
+        "editedRegions": "edited_regions",
+    }
+
+    def __init__(self):
+        self.large_document_bytes = LARGE_DOCUMENT_BYTES
+        self.edited_regions = EDITED_REGIONS
+
+    def update(self, section: Dict[str, Any]) -> None:
+        for key, attribute in self.KEYS.items():
+            value = section.get(key)
+            if value is None:
+                continue
+            if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                LOGGER.warning(f"{key}: expected a non negative integer, got {value!r}")
+                continue
+            setattr(self, attribute, value)
+
+    def snapshot(self) -> Dict[str, int]:
+        return {key: getattr(self, attribute) for key, attribute in self.KEYS.items()}
+
+    def is_large(self, document: DocumentTree) -> bool:
+        return 0 < self.large_document_bytes < len(document.utf8_bytes)
+
+
+SETTINGS = Settings()
+
+
+class Regions:
+    """The rows of a document the client shows, from semanticTokens/range,
+    and the rows of its latest edits, by DocumentTree.key.
+
+    A large document is validated in these regions only and the tokens of
+    the visible one only are cached, so the memory of a document does not
+    grow with its size. The rows of the regions after an edit move with the
+    lines it adds or removes.
+
+    didChange updates them on the event loop, the handlers and the
+    validation read them in the thread pool, every method takes the lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.visible: Dict[Hashable, Rows] = {}
+        self.edited: Dict[Hashable, Deque[Rows]] = {}
+
+    def release(self, key: Hashable) -> None:
+        with self.lock:
+            self.visible.pop(key, None)
+            self.edited.pop(key, None)
+
+    def show(self, key: Hashable, rows: Rows) -> bool:
+        """True if the client shows other rows than before."""
+        with self.lock:
+            if self.visible.get(key) == rows:
+                return False
+            self.visible[key] = rows
+            return True
+
+    def edit(
+        self,
+        key: Hashable,
+        content_changes: Sequence[lsp_types.TextDocumentContentChangeEvent],
+    ) -> None:
+        with self.lock:
+            edited = self.edited.get(key)
+            if edited is None or edited.maxlen != SETTINGS.edited_regions:
+                edited = self.edited[key] = collections.deque(
+                    edited or (), maxlen=SETTINGS.edited_regions
+                )
+            for change in content_changes:
+                match change:
+                    case lsp_types.TextDocumentContentChangeEvent_Type1(
+                        range=change_range
+                    ):
+                        first = change_range.start.line
+                        last = first + change.text.count("\n")
+                        moved = last - change_range.end.line
+                        if moved:
+                            self._move(key, change_range.end.line, moved)
+                        edited.appendleft((first, last))
+                    case _:
+                        # a new document
+                        edited.clear()
+                        self.visible.pop(key, None)
+
+    def _move(self, key: Hashable, after: int, lines: int) -> None:
+        def move(rows: Rows) -> Rows:
+            first, last = rows
+            if last <= after:
+                return rows
+            if first > after:
+                first += lines
+            return (first, max(first, last + lines))
+
+        visible = self.visible.get(key)
+        if visible:
+            self.visible[key] = move(visible)
+        edited = self.edited.get(key)
+        if edited:
+            moved = [move(rows) for rows in edited]
+            edited.clear()
+            edited.extend(moved)
+
+    def rows(self, key: Hashable) -> List[Rows]:
+        """The regions sorted and merged."""
+        with self.lock:
+            regions = list(self.edited.get(key, ()))
+            if key in self.visible:
+                regions.append(self.visible[key])
+        merged: List[Rows] = []
+        for first, last in sorted(regions):
+            if merged and first <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+            else:
+                merged.append((first, last))
+        return merged
+
+
+def intersects(regions: Sequence[Rows], first: int, last: int) -> bool:
+    return any(start <= last and first <= end for start, end in regions)
@@ -0,0 +1,354 @@
+from typing import Optional, List, Dict, NamedTuple, Tuple, Callable, Hashable
+import lsprotocol.types as lsp_types
+import tree_sitter
+from .documents import DocumentTree
+from .execution import CHECK_INTERVAL, RequestCancelled
+from .headings import HEADING_TYPES, heading_level, heading_title
+from .stats import STATS
+from .traversal import Preorder
+
+Point = Tuple[int, int]
+
+# multi-line blocks that fold, besides the sections
+FOLDING_BLOCK_TYPES = (
+    "fenced_code_block",
+    "indented_code_block",
+    "html_block",
+    "block_quote",
+    "list",
+    "pipe_table",
+    "minus_metadata",
+    "plus_metadata",
+)
+
+
+class OutlineHeading(NamedTuple):
+    level: int
+    title: str
+    # of the heading node, the title line of a setext heading
+    start: Point
+    end: Point
+
+
+class OutlineFold(NamedTuple):
+    start_row: int
+    end_row: int
+
+
+class SectionContent(NamedTuple):
+    """Headings and folds of a section before its first subsection, with rows
+    relative to the section start."""
+
+    headings: Tuple[OutlineHeading, ...]
+    folds: Tuple[OutlineFold, ...]
+
+
+class SectionOutline(NamedTuple):
+    """The symbols of a section at its row in a version."""
+
+    # (level, symbol) of the headings not below another one of the section
+    symbols: Tuple[Tuple[int, lsp_types.DocumentSymbol], ...]
+    folding_ranges: Tuple[lsp_types.FoldingRange, ...]
+    # every heading of the section in order, at its row in the version
+    headings: Tuple[OutlineHeading, ...]
+
+
+class Outline(NamedTuple):
+    """The heading tree of a version, for documentSymbol and foldingRange,
+    and its headings in order for the anchors."""
+
+    symbols: List[lsp_types.DocumentSymbol]
+    folding_ranges: List[lsp_types.FoldingRange]
+    headings: List[OutlineHeading]
+
+
+ContentKey = Tuple[int, int, int]
+# the row of the section and its content key
+OutlineKey = Tuple[int, int, int, int]
+
+
+class OutlineCache(NamedTuple):
+    contents: Dict[ContentKey, SectionContent]
+    outlines: Dict[OutlineKey, SectionOutline]
+
+
+class _Walk:
+    """The state of one outline() call, calls for other documents run at the
+    same time in the thread pool.
+
+    check() raises RequestCancelled once is_cancelled() is true, checked
+    every CHECK_INTERVAL blocks across the sections.
+    """
+
+    def __init__(self, is_cancelled: Optional[Callable[[], bool]]):
+        self.is_cancelled = is_cancelled
+        self.countdown = CHECK_INTERVAL
+        # sections reused and walked
+        self.hits = 0
+        self.misses = 0
+
+    def check(self) -> None:
+        if self.is_cancelled is None:
+            return
+        self.countdown -= 1
+        if not self.countdown:
+            if self.is_cancelled():
+                raise RequestCancelled()
+            self.countdown = CHECK_INTERVAL
+
+
+def _end_row(node: tree_sitter.Node) -> int:
+    """The last row of a block, not the row after its newline."""
+    row, column = node.end_point
+    if column == 0 and row > node.start_point[0]:
+        return row - 1
+    return row
+
+
+def _last_text_row(document: DocumentTree, first: int, end: int) -> int:
+    """The last row in [first, end) that is not blank."""
+    src = document.utf8_bytes
+    offsets = document.line_offsets
+    row = min(end, len(offsets)) - 1
+    while row > first:
+        line_end = offsets[row + 1] if row + 1 < len(offsets) else len(src)
+        if src[offsets[row] : line_end].strip():
+            break
+        row -= 1
+    return row
+
+
+def _line_end(document: DocumentTree, row: int) -> lsp_types.Position:
+    src = document.utf8_bytes
+    offsets = document.line_offsets
+    end = offsets[row + 1] if row + 1 < len(offsets) else len(src)
+    line = src[offsets[row] : end]
+    return document.point_to_position((row, len(line.rstrip(b"\r\n"))))
+
+
+def _position_key(position: lsp_types.Position) -> Tuple[int, int]:
+    return (position.line, position.character)
+
+
+class _Builder:
+    """Nests the symbols of a section by level, a heading is closed by the
+    next one of the same or a higher level or by the end of the section."""
+
+    def __init__(self, document: DocumentTree):
+        self.document = document
+        self.symbols: List[Tuple[int, lsp_types.DocumentSymbol]] = []
+        self.folding_ranges: List[lsp_types.FoldingRange] = []
+        self.stack: List[Tuple[int, lsp_types.DocumentSymbol]] = []
+
+    def add(self, level: int, symbol: lsp_types.DocumentSymbol) -> None:
+        self.close(level, symbol.range.start.line)
+        if self.stack:
+            self.stack[-1][1].children.append(symbol)  # type: ignore
+        else:
+            self.symbols.append((level, symbol))
+
+    def open(self, heading: OutlineHeading) -> None:
+        document = self.document
+        selection = lsp_types.Range(
+            start=document.point_to_position(heading.start),
+            end=document.point_to_position(heading.end),
+        )
+        symbol = lsp_types.DocumentSymbol(
+            # clients reject an empty name
+            name=heading.title or "#" * heading.level,
+            kind=lsp_types.SymbolKind.String,
+            range=lsp_types.Range(start=selection.start, end=selection.end),
+            selection_range=selection,
+            children=[],
+        )
+        self.add(heading.level, symbol)
+        self.stack.append((heading.level, symbol))
+
+    def close(self, level: int, end: int) -> None:
+        """Close the open headings of level or below before the row end."""
+        while self.stack and self.stack[-1][0] >= level:
+            _, symbol = self.stack.pop()
+            start = symbol.range.start.line
+            last_row = _last_text_row(self.document, start, end)
+            symbol.range.end = max(
+                _line_end(self.document, last_row),
+                symbol.selection_range.end,
+                key=_position_key,
+            )
+            if last_row > start:
+                self.folding_ranges.append(
+                    lsp_types.FoldingRange(
+                        start_line=start,
+                        end_line=last_row,
+                        kind=lsp_types.FoldingRangeKind.Region,
+                    )
+                )
+
+
+class Outliner:
+    """The outline of a document from its section nodes.
+
+    Two caches per document: the headings and folds of the content of a
+    section before its subsections with relative rows, keyed by its column
+    and bytes, and the symbols of a whole section at its row in the previous
+    version. After an edit only the sections that contain it are walked
+    again. The sections above it are reused as they are, the ones below
+    convert their cached content again if the line count changed. Headings
+    that do not open a section node, setext and quoted ones, are nested by
+    level within their section.
+    """
+
+    def __init__(self):
+        # by DocumentTree.key
+        self.caches: Dict[Hashable, OutlineCache] = {}
+
+    def release(self, key: Hashable) -> None:
+        self.caches.pop(key, None)
+
+    def outline(
+        self,
+        document: DocumentTree,
+        is_cancelled: Optional[Callable[[], bool]] = None,
+    ) -> Outline:
+        """Raises RequestCancelled once is_cancelled() is true."""
+        previous = self.caches.get(document.key) or OutlineCache({}, {})
+        cache = OutlineCache({}, {})
+        walk = _Walk(is_cancelled)
+        try:
+            root = self._outline(
+                document, document.tree.root_node, previous, cache, walk
+            )
+        except RequestCancelled:
+            # the sections walked so far serve the request of the next version
+            self.caches[document.key] = OutlineCache(
+                {**previous.contents, **cache.contents},
+                {**previous.outlines, **cache.outlines},
+            )
+            raise
+        self.caches[document.key] = cache
+        STATS.cache("outline", walk.hits, walk.misses)
+        folding_ranges = sorted(
+            root.folding_ranges, key=lambda f: (f.start_line, -f.end_line)
+        )
+        return Outline(
+            [symbol for _, symbol in root.symbols], folding_ranges, list(root.headings)
+        )
+
+    def _outline(
+        self,
+        document: DocumentTree,
+        node: tree_sitter.Node,
+        previous: OutlineCache,
+        cache: OutlineCache,
+        walk: _Walk,
+    ) -> SectionOutline:
+        walk.check()
+        row, column = node.start_point
+        utf8_bytes = document.utf8_bytes
+        is_section = node.type == "section"
+        content = None
+        if is_section:
+            key = (
+                row,
+                column,
+                node.end_byte - node.start_byte,
+                hash(utf8_bytes[node.start_byte : node.end_byte]),
+            )
+            outline = cache.outlines.get(key)
+            if outline is None:
+                outline = previous.outlines.get(key)
+            if outline is not None:
+                cache.outlines[key] = outline
+                walk.hits += 1
+                return outline
+            walk.misses += 1
+            # the content until the first subsection
+            end_byte = next(
+                (c.start_byte for c in node.children if c.type == "section"),
+                node.end_byte,
+            )
+            content_key = (
+                column,
+                end_byte - node.start_byte,
+                hash(utf8_bytes[node.start_byte : end_byte]),
+            )
+            content = cache.contents.get(content_key)
+            if content is None:
+                content = previous.contents.get(content_key)
+            if content is None:
+                content = self._content(document, node, walk)
+            cache.contents[content_key] = content
+        else:
+            content = self._content(document, node, walk)
+
+        builder = _Builder(document)
+        headings = [
+            heading._replace(
+                start=(heading.start[0] + row, heading.start[1]),
+                end=(heading.end[0] + row, heading.end[1]),
+            )
+            for heading in content.headings
+        ]
+        for heading in headings:
+            builder.open(heading)
+        builder.folding_ranges.extend(
+            lsp_types.FoldingRange(
+                start_line=fold.start_row + row, end_line=fold.end_row + row
+            )
+            for fold in content.folds
+        )
+        # subsections follow the content of a section
+        for child in node.children:
+            if child.type != "section":
+                continue
+            section = self._outline(document, child, previous, cache, walk)
+            for level, symbol in section.symbols:
+                builder.add(level, symbol)
+            builder.folding_ranges.extend(section.folding_ranges)
+            headings.extend(section.headings)
+        end_row, end_column = node.end_point
+        builder.close(0, end_row + 1 if end_column else end_row)
+
+        outline = SectionOutline(
+            tuple(builder.symbols), tuple(builder.folding_ranges), tuple(headings)
+        )
+        if is_section:
+            cache.outlines[key] = outline
+        return outline
+
+    def _content(
+        self,
+        document: DocumentTree,
+        node: tree_sitter.Node,
+        walk: _Walk,
+    ) -> SectionContent:
+        utf8_bytes = document.utf8_bytes
+        row = node.start_point[0]
+        headings: List[OutlineHeading] = []
+        folds: List[OutlineFold] = []
+        for child in node.children:
+            if child.type == "section":
+                continue
+            walk.check()
+            start_row = child.start_point[0]
+            if child.type in FOLDING_BLOCK_TYPES and _end_row(child) > start_row:
+                folds.append(OutlineFold(start_row - row, _end_row(child) - row))
+            # headings in a quote or a list item too, like the anchors
+            for heading in Preorder(
+                child,
+                types=HEADING_TYPES,
+                skip_types=("inline",) + HEADING_TYPES,
+                is_cancelled=walk.is_cancelled,
+            ):
+                title = heading.child_by_field_name("heading_content") or heading
+                start = heading.start_point
+                end = title.end_point
+                headings.append(
+                    OutlineHeading(
+                        heading_level(heading),
+                        heading_title(heading, utf8_bytes),
+                        (start[0] - row, start[1]),
+                        (end[0] - row, end[1]),
+                    )
+                )
+        return SectionContent(tuple(headings), tuple(folds))
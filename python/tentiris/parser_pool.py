@@ -0,0 +1,155 @@
+from typing import Optional, Callable, Union
+import functools
+import os
+import pathlib
+import threading
+import time
+import logging
+import tree_sitter
+
+LOGGER = logging.getLogger(__name__)
+
+# a long parse is split into slices of this length to check for cancellation
+SLICE_MICROS = 20_000
+
+# build_treesitter.py builds the library next to the package
+PACKAGE_LANGUAGE_LIBRARY = (
+    pathlib.Path(__file__).absolute().parent.parent / "build" / "my-languages.dll"
+)
+LANGUAGE_LIBRARY_ENV = "TENTIRIS_LANGUAGE_LIBRARY"
+_language_library: Optional[str] = None
+
+
+def set_language_library(path: Optional[str]) -> None:
+    """Load the grammars from path, call before the first parse."""
+    global _language_library
+    _language_library = path
+
+
+def language_library() -> str:
+    """--language-library, $TENTIRIS_LANGUAGE_LIBRARY or the library next to
+    the package, independent of the working directory."""
+    return (
+        _language_library
+        or os.environ.get(LANGUAGE_LIBRARY_ENV)
+        or str(PACKAGE_LANGUAGE_LIBRARY)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def load_language(name: str) -> tree_sitter.Language:
+    """Load a grammar of the library on first use.
+
+    Raises AttributeError if the grammar was not built into the library.
+    """
+    LOGGER.debug(f"load {name} from {language_library()}")
+    return tree_sitter.Language(language_library(), name)
+
+
+class ParseCancelled(Exception):
+    """The parse was cancelled before the tree was complete."""
+
+
+class ParseTimeout(ParseCancelled):
+    """The parse did not complete within its timeout."""
+
+
+class ParserPool:
+    """Reuses configured tree_sitter.Parser instances.
+
+    A parser must not be used by two threads at once, so every thread
+    (the asyncio loop and the pygls thread pool workers) keeps its own parser
+    for the pool's language.
+    """
+
+    def __init__(
+        self,
+        language: Union[str, tree_sitter.Language],
+        slice_micros: int = SLICE_MICROS,
+    ):
+        """language is the name of a grammar of the library to load it on the
+        first parse."""
+        self._language = language
+        self.slice_micros = slice_micros
+        self.local = threading.local()
+
+    @property
+    def language(self) -> tree_sitter.Language:
+        if isinstance(self._language, str):
+            self._language = load_language(self._language)
+        return self._language
+
+    def get(self) -> tree_sitter.Parser:
+        parser = getattr(self.local, "parser", None)
+        if parser is None:
+            parser = tree_sitter.Parser()
+            parser.set_language(self.language)
+            self.local.parser = parser
+        return parser
+
+    def parse(
+        self,
+        utf8_bytes: bytes,
+        old_tree: Optional[tree_sitter.Tree] = None,
+        *,
+        timeout: Optional[float] = None,
+        is_cancelled: Optional[Callable[[], bool]] = None,
+    ) -> tree_sitter.Tree:
+        """Parse with the parser of the current thread.
+
+        With ``timeout`` (seconds) or ``is_cancelled``, the parse runs in
+        slices and raises ParseTimeout / ParseCancelled between slices.
+        """
+        parser = self.get()
+        if timeout is None and is_cancelled is None:
+            return _parse(parser, utf8_bytes, old_tree)
+
+        deadline = time.perf_counter() + timeout if timeout is not None else None
+        parser.set_timeout_micros(self.slice_micros)
+        try:
+            while True:
+                try:
+                    return _parse(parser, utf8_bytes, old_tree)
+                except ValueError:
+                    # the slice timed out, the next call resumes the parse
+                    pass
+                if is_cancelled and is_cancelled():
+                    raise ParseCancelled()
+                if deadline is not None and time.perf_counter() > deadline:
+                    LOGGER.warning(f"parse timeout: {len(utf8_bytes)} bytes")
+                    raise ParseTimeout()
+        except ParseCancelled:
+            # discard the partial state so the next parse starts over
+            parser.reset()
+            raise
+        finally:
+            parser.set_timeout_micros(0)
+
+
+def _parse(
+    parser: tree_sitter.Parser,
+    utf8_bytes: bytes,
+    old_tree: Optional[tree_sitter.Tree],
+) -> tree_sitter.Tree:
+    if old_tree:
+        return parser.parse(utf8_bytes, old_tree)
+    return parser.parse(utf8_bytes)
+
+
+MD_PARSERS = ParserPool("markdown")
+# the content of the inline nodes of the markdown grammar
+MD_INLINE_PARSERS = ParserPool("markdown_inline")
+
+# a pasted huge document must not stall the server
+PARSE_TIMEOUT_SECONDS = 10.0
+
+
+def treesitter_parse(
+    utf8_bytes: bytes,
+    old_tree: Optional[tree_sitter.Tree] = None,
+    timeout: Optional[float] = PARSE_TIMEOUT_SECONDS,
+    is_cancelled: Optional[Callable[[], bool]] = None,
+) -> tree_sitter.Tree:
+    return MD_PARSERS.parse(
+        utf8_bytes, old_tree, timeout=timeout, is_cancelled=is_cancelled
+    )
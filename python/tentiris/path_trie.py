@@ -0,0 +1,110 @@
+from typing import Optional, List, Dict, Generic, Iterable, Iterator, Tuple, TypeVar
+import bisect
+import os
+
+T = TypeVar("T")
+
+
+class PrefixIndex(Generic[T]):
+    """Values by key, sorted once. The keys starting with a prefix are a
+    range found by bisection, a keystroke costs O(log n + matches)."""
+
+    def __init__(self, items: Iterable[Tuple[str, T]]):
+        pairs = sorted(items, key=lambda item: item[0])
+        self.keys = [key for key, _ in pairs]
+        self.values = [value for _, value in pairs]
+
+    def complete(self, prefix: str) -> Iterator[T]:
+        """The values of the keys that start with prefix, in key order."""
+        for i in range(bisect.bisect_left(self.keys, prefix), len(self.keys)):
+            if not self.keys[i].startswith(prefix):
+                return
+            yield self.values[i]
+
+
+class _Node:
+    __slots__ = ("children", "names", "is_file")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        # the keys of children, sorted
+        self.names: List[str] = []
+        self.is_file = False
+
+    def child(self, name: str) -> "_Node":
+        node = self.children.get(name)
+        if node is None:
+            node = self.children[name] = _Node()
+            bisect.insort(self.names, name)
+        return node
+
+    def remove_child(self, name: str) -> None:
+        del self.children[name]
+        del self.names[bisect.bisect_left(self.names, name)]
+
+
+def _parts(path: str) -> List[str]:
+    drive, rest = os.path.splitdrive(os.path.normpath(path))
+    return [drive + os.sep] + [part for part in rest.split(os.sep) if part]
+
+
+class PathTrie:
+    """Indexed file paths by path segment.
+
+    Completing ``dir/na`` walks to ``dir`` in O(depth) and bisects the sorted
+    names of that folder for ``na``, never looking at the other entries.
+    """
+
+    def __init__(self):
+        self.root = _Node()
+
+    def add(self, path: str) -> None:
+        node = self.root
+        for part in _parts(path):
+            node = node.child(part)
+        node.is_file = True
+
+    def remove(self, path: str) -> None:
+        nodes = [self.root]
+        parts = _parts(path)
+        for part in parts:
+            node = nodes[-1].children.get(part)
+            if not node:
+                return
+            nodes.append(node)
+        nodes[-1].is_file = False
+        # prune the folders left empty
+        for part, node, parent in zip(
+            reversed(parts), reversed(nodes[1:]), reversed(nodes[:-1])
+        ):
+            if node.is_file or node.children:
+                break
+            parent.remove_child(part)
+
+    def clear(self) -> None:
+        self.root = _Node()
+
+    def _find(self, folder: str) -> Optional[_Node]:
+        node = self.root
+        for part in _parts(folder):
+            node = node.children.get(part)
+            if not node:
+                return None
+        return node
+
+    def complete(self, folder: str, prefix: str) -> Iterator[Tuple[str, bool]]:
+        """(name, is_folder) of the children of folder that start with prefix,
+        in name order."""
+        node = self._find(folder)
+        if not node:
+            return
+        names = node.names
+        for i in range(bisect.bisect_left(names, prefix), len(names)):
+            name = names[i]
+            if not name.startswith(prefix):
+                return
+            child = node.children[name]
+            if child.is_file:
+                yield name, False
+            if child.children:
+                yield name, True
@@ -0,0 +1,127 @@
+from typing import Optional, Dict, Any, List
+import asyncio
+import collections
+import cProfile
+import io
+import os
+import pathlib
+import pstats
+import sys
+import threading
+import time
+
+PROFILE_MODES = ("cprofile", "sampling")
+
+# seconds between two samples of the stacks
+SAMPLE_INTERVAL = 0.005
+
+# lines of the summary returned with the dump
+SUMMARY_LINES = 20
+
+
+class Sampler:
+    """Samples the stacks of every thread from a thread of its own.
+
+    The dump has a line of collapsed stacks per distinct stack, root first
+    and separated by ";", and its count, the input of flamegraph.pl and
+    speedscope. Unlike cProfile it sees the thread pool too and does not slow
+    the sampled code down.
+    """
+
+    extension = "folded"
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: collections.Counter = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack: List[str] = []
+                while frame:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}"
+                        f":{frame.f_lineno})"
+                    )
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def dump(self, path: pathlib.Path) -> str:
+        with path.open("w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        # the innermost frames most often on a stack
+        leaves: collections.Counter = collections.Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rpartition(";")[2]] += count
+        lines = [f"{self.samples} samples"]
+        lines.extend(
+            f"{count:>8} {leaf}" for leaf, count in leaves.most_common(SUMMARY_LINES)
+        )
+        return "\n".join(lines)
+
+
+class Profiler:
+    """cProfile of the thread that starts it, the event loop of the server."""
+
+    extension = "prof"
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self) -> None:
+        self.profile.enable()
+
+    def stop(self) -> None:
+        self.profile.disable()
+
+    def dump(self, path: pathlib.Path) -> str:
+        self.profile.dump_stats(str(path))
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats(
+            pstats.SortKey.CUMULATIVE
+        ).print_stats(SUMMARY_LINES)
+        return out.getvalue()
+
+
+# one profile at a time, cProfile cannot nest
+_running: Optional[str] = None
+
+
+async def profile(mode: str, seconds: float, folder: str) -> Dict[str, Any]:
+    """Profile the running server for seconds, dump the result to a file in
+    folder and return its path with a summary."""
+    global _running
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"unknown profile mode: {mode}, {'|'.join(PROFILE_MODES)}")
+    if _running:
+        raise RuntimeError(f"already profiling: {_running}")
+    profiler = Sampler() if mode == "sampling" else Profiler()
+    _running = mode
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+        _running = None
+    path = pathlib.Path(folder) / (
+        f"tentiris-{mode}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        f".{profiler.extension}"
+    )
+    summary = profiler.dump(path)
+    return {"mode": mode, "seconds": seconds, "path": str(path), "summary": summary}
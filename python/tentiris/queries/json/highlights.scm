@@ -0,0 +1,19 @@
+; fenced code blocks tagged json
+
+(string) @string
+(pair key: (string) @property)
+(escape_sequence) @string.escape
+(number) @number
+
+[
+  (true)
+  (false)
+  (null)
+] @constant.builtin
+
+(comment) @comment
+
+[
+  ","
+  ":"
+] @punctuation.delimiter
@@ -0,0 +1,66 @@
+; block grammar. The capture names are mapped to semantic token types by
+; semantic_tokens.HIGHLIGHTS, an inner capture wins over the captures around it.
+
+(atx_heading (inline) @markup.heading)
+(setext_heading (paragraph) @markup.heading)
+(pipe_table_header (pipe_table_cell) @markup.heading)
+
+[
+  (atx_h1_marker)
+  (atx_h2_marker)
+  (atx_h3_marker)
+  (atx_h4_marker)
+  (atx_h5_marker)
+  (atx_h6_marker)
+  (setext_h1_underline)
+  (setext_h2_underline)
+] @punctuation.special
+
+[
+  (list_marker_plus)
+  (list_marker_minus)
+  (list_marker_star)
+  (list_marker_dot)
+  (list_marker_parenthesis)
+  (thematic_break)
+  (block_quote_marker)
+  (block_continuation)
+] @punctuation.special
+
+(task_list_marker_checked) @markup.list.checked
+(task_list_marker_unchecked) @markup.list.unchecked
+
+(indented_code_block) @markup.raw
+; markup.raw, or highlighted with the grammar of the language of the block
+(code_fence_content) @_code
+
+(fenced_code_block_delimiter) @punctuation.delimiter
+(info_string) @label
+
+(pipe_table_header "|" @punctuation.special)
+(pipe_table_row "|" @punctuation.special)
+(pipe_table_delimiter_row) @punctuation.special
+
+(link_reference_definition ":" @punctuation.delimiter)
+(link_label) @markup.link
+(link_destination) @markup.link.url
+(link_title) @string
+
+(html_block) @tag
+
+[
+  (minus_metadata)
+  (plus_metadata)
+] @comment
+
+(backslash_escape) @string.escape
+[
+  (entity_reference)
+  (numeric_character_reference)
+] @character.special
+
+; parsed again with the inline grammar
+[
+  (inline)
+  (pipe_table_cell)
+] @_inline
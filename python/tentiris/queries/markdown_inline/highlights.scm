@@ -0,0 +1,48 @@
+; inline grammar, for the content of the inline nodes of the block grammar
+
+(emphasis) @markup.italic
+(strong_emphasis) @markup.strong
+(strikethrough) @markup.strikethrough
+
+[
+  (code_span)
+  (latex_block)
+] @markup.raw
+
+[
+  (emphasis_delimiter)
+  (code_span_delimiter)
+  (latex_span_delimiter)
+] @punctuation.delimiter
+
+[
+  (link_text)
+  (link_label)
+  (image_description)
+] @markup.link
+
+[
+  (link_destination)
+  (uri_autolink)
+  (email_autolink)
+] @markup.link.url
+
+(link_title) @string
+
+(inline_link ["[" "]" "(" ")"] @punctuation.delimiter)
+(image ["!" "[" "]" "(" ")"] @punctuation.delimiter)
+(full_reference_link ["[" "]"] @punctuation.delimiter)
+(collapsed_reference_link ["[" "]"] @punctuation.delimiter)
+(shortcut_link ["[" "]"] @punctuation.delimiter)
+
+(html_tag) @tag
+
+[
+  (backslash_escape)
+  (hard_line_break)
+] @string.escape
+
+[
+  (entity_reference)
+  (numeric_character_reference)
+] @character.special
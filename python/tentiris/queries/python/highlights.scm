@@ -0,0 +1,70 @@
+; fenced code blocks tagged python
+
+(parameters (identifier) @variable.parameter)
+(default_parameter name: (identifier) @variable.parameter)
+(typed_parameter (identifier) @variable.parameter)
+(typed_default_parameter name: (identifier) @variable.parameter)
+(keyword_argument name: (identifier) @variable.parameter)
+
+(attribute attribute: (identifier) @property)
+(call function: (identifier) @function)
+(call function: (attribute attribute: (identifier) @function))
+(function_definition name: (identifier) @function)
+(class_definition name: (identifier) @type)
+(type (identifier) @type)
+(decorator) @attribute
+
+(string) @string
+(escape_sequence) @string.escape
+
+[
+  (integer)
+  (float)
+] @number
+
+[
+  (true)
+  (false)
+  (none)
+] @constant.builtin
+
+(comment) @comment
+
+[
+  "and"
+  "as"
+  "assert"
+  "async"
+  "await"
+  "break"
+  "case"
+  "class"
+  "continue"
+  "def"
+  "del"
+  "elif"
+  "else"
+  "except"
+  "exec"
+  "finally"
+  "for"
+  "from"
+  "global"
+  "if"
+  "import"
+  "in"
+  "is"
+  "lambda"
+  "match"
+  "nonlocal"
+  "not"
+  "or"
+  "pass"
+  "print"
+  "raise"
+  "return"
+  "try"
+  "while"
+  "with"
+  "yield"
+] @keyword
@@ -0,0 +1,536 @@
+from typing import (
+    Hashable,
+    Optional,
+    Callable,
+    List,
+    NamedTuple,
+    Tuple,
+    Dict,
+    Iterable,
+    Iterator,
+    Sequence,
+)
+from array import array
+import bisect
+import functools
+import pathlib
+import re
+import lsprotocol.types as lsp_types
+import tree_sitter
+from .documents import DocumentTree
+from .diagnostics import CONTAINER_TYPES
+from .execution import CHECK_INTERVAL, RequestCancelled
+from .parser_pool import (
+    MD_INLINE_PARSERS,
+    ParserPool,
+    load_language,
+    treesitter_parse,
+)
+from .injections import (
+    content_ranges,
+    embedded_language,
+    fence_language,
+    load_grammar,
+    parse_injection,
+)
+from .stats import STATS
+from .traversal import Preorder
+
+QUERIES = pathlib.Path(__file__).parent / "queries"
+
+
+class SemanticToken(NamedTuple):
+    start: Tuple[int, int]
+    byte_len: int
+    type: str
+    modifiers: List[str]
+
+
+# token type and modifiers
+Highlight = Tuple[str, List[str]]
+
+# capture names of the highlight queries. Captures named _* are not highlights.
+HIGHLIGHTS: Dict[str, Highlight] = {
+    "markup.heading": ("class", ["declaration"]),
+    "markup.italic": ("parameter", []),
+    "markup.strong": ("variable", []),
+    "markup.strikethrough": ("variable", ["deprecated"]),
+    "markup.raw": ("string", []),
+    "markup.link": ("property", []),
+    "markup.link.url": ("macro", []),
+    "markup.list.checked": ("enumMember", []),
+    "markup.list.unchecked": ("enumMember", []),
+    "label": ("type", []),
+    "string": ("string", []),
+    "string.escape": ("regexp", []),
+    "character.special": ("number", []),
+    "tag": ("decorator", []),
+    "comment": ("comment", []),
+    "punctuation.special": ("keyword", []),
+    "punctuation.delimiter": ("operator", []),
+    # embedded languages
+    "keyword": ("keyword", []),
+    "number": ("number", []),
+    "constant.builtin": ("keyword", []),
+    "property": ("property", []),
+    "function": ("function", []),
+    "type": ("type", []),
+    "variable.parameter": ("parameter", []),
+    "attribute": ("decorator", []),
+}
+
+# the legend of the server
+TOKEN_TYPES: List[str] = list(
+    dict.fromkeys(token_type for token_type, _ in HIGHLIGHTS.values())
+)
+TOKEN_MODIFIERS: List[str] = list(
+    dict.fromkeys(
+        modifier for _, modifiers in HIGHLIGHTS.values() for modifier in modifiers
+    )
+)
+
+# nodes of the block grammar with inline content
+INLINE_CAPTURE = "_inline"
+# the content of a fenced code block
+CODE_CAPTURE = "_code"
+
+
+def load_highlights(language: tree_sitter.Language, name: str) -> tree_sitter.Query:
+    """Compile queries/{name}/highlights.scm."""
+    source = (QUERIES / name / "highlights.scm").read_text(encoding="utf-8")
+    for capture in re.findall(r"@([\w.]+)", source):
+        if not capture.startswith("_") and capture not in HIGHLIGHTS:
+            raise ValueError(f"{name}/highlights.scm: unknown capture @{capture}")
+    return language.query(source)
+
+
+@functools.lru_cache(maxsize=None)
+def highlights(grammar: str) -> tree_sitter.Query:
+    """The highlight query of a grammar, compiled once on first use."""
+    return load_highlights(load_language(grammar), grammar)
+
+
+# start byte, end byte, highlight and layer. Inline captures are in a higher
+# layer than a block capture of the same range.
+Capture = Tuple[int, int, Highlight, int]
+# tokens of a block with rows relative to its start
+BlockTokens = Tuple[SemanticToken, ...]
+BlockKey = Tuple[str, int, int, int]
+
+
+def injected_captures(
+    node: tree_sitter.Node,
+    utf8_bytes: bytes,
+    parsers: ParserPool,
+    highlights: tree_sitter.Query,
+) -> List[Capture]:
+    """Parse the content of node with another grammar and capture it."""
+    ranges = content_ranges(node, utf8_bytes)
+    if not ranges:
+        return []
+    tree = parse_injection(ranges, utf8_bytes, parsers)
+    return [
+        (captured.start_byte, captured.end_byte, HIGHLIGHTS[name], 1)
+        for captured, name in highlights.captures(tree.root_node)
+    ]
+
+
+def embedded_highlights(grammar: str) -> Optional[tree_sitter.Query]:
+    """None if the grammar is not in the library or has no query."""
+    if not load_grammar(grammar) or not (QUERIES / grammar / "highlights.scm").exists():
+        return None
+    return highlights(grammar)
+
+
+def code_captures(node: tree_sitter.Node, utf8_bytes: bytes) -> List[Capture]:
+    """The content of a fenced code block highlighted with the grammar of its
+    language, or as markup.raw."""
+    embedded = embedded_language(fence_language(node.parent, utf8_bytes))
+    highlights = embedded_highlights(embedded.name) if embedded else None
+    if not embedded or not highlights:
+        return [(node.start_byte, node.end_byte, HIGHLIGHTS["markup.raw"], 0)]
+    return injected_captures(node, utf8_bytes, embedded.parsers, highlights)
+
+
+def flatten(
+    captures: Iterable[Capture],
+) -> Iterator[Tuple[int, int, Highlight]]:
+    """Non overlapping (start, end, highlight) of captures sorted by start and
+    by decreasing end. The innermost capture wins, an outer capture
+    highlights the gaps between its inner captures."""
+    # (end, highlight) of the enclosing captures, the innermost last
+    stack: List[Tuple[int, Highlight]] = []
+    pos = 0
+    for start, end, highlight, _ in captures:
+        if end <= start:
+            continue
+        while stack and stack[-1][0] <= start:
+            top_end, top = stack.pop()
+            if pos < top_end:
+                yield pos, top_end, top
+                pos = top_end
+        if pos < start:
+            if stack:
+                yield pos, start, stack[-1][1]
+            pos = start
+        if stack and end > stack[-1][0]:
+            # not nested, cut at the enclosing capture
+            end = stack[-1][0]
+        stack.append((end, highlight))
+    while stack:
+        top_end, top = stack.pop()
+        if pos < top_end:
+            yield pos, top_end, top
+            pos = top_end
+
+
+def _capture_order(capture: Capture) -> Tuple[int, int, int]:
+    return (capture[0], -capture[1], capture[3])
+
+
+def block_tokens(
+    node: tree_sitter.Node, utf8_bytes: bytes, line_offsets: Sequence[int]
+) -> BlockTokens:
+    """Tokens of a block, rows relative to the block."""
+    captures: List[Capture] = []
+    for captured, name in highlights("markdown").captures(node):
+        if name == INLINE_CAPTURE:
+            captures.extend(
+                injected_captures(
+                    captured,
+                    utf8_bytes,
+                    MD_INLINE_PARSERS,
+                    highlights("markdown_inline"),
+                )
+            )
+        elif name == CODE_CAPTURE:
+            captures.extend(code_captures(captured, utf8_bytes))
+        elif not name.startswith("_"):
+            captures.append(
+                (captured.start_byte, captured.end_byte, HIGHLIGHTS[name], 0)
+            )
+    captures.sort(key=_capture_order)
+
+    first_row = node.start_point[0]
+    tokens: List[SemanticToken] = []
+    for start, end, (token_type, modifiers) in flatten(captures):
+        row = bisect.bisect_right(line_offsets, start) - 1
+        tokens.append(
+            SemanticToken(
+                (row - first_row, start - line_offsets[row]),
+                end - start,
+                token_type,
+                modifiers,
+            )
+        )
+    return tuple(tokens)
+
+
+class Highlighter:
+    """Semantic tokens from the highlight queries of the block and the inline
+    grammar.
+
+    A block is captured with the block query. The content of its inline
+    nodes and table cells is parsed with the inline grammar, skipping the
+    block continuations, and captured with the inline query. Nested captures
+    are flattened, tokens never overlap. Tokens are cached per top level
+    block like the diagnostics, so after an edit only the changed blocks are
+    captured again.
+
+    ``caches`` holds the blocks of the last whole document and ``partial``
+    the blocks of the last range or cancelled request on top of it, each
+    replaced by the next one, so blocks made stale by edits do not pile up.
+    """
+
+    def __init__(self):
+        self.caches: Dict[Hashable, Dict[BlockKey, BlockTokens]] = {}
+        self.partial: Dict[Hashable, Dict[BlockKey, BlockTokens]] = {}
+
+    def release(self, key: Hashable) -> None:
+        self.caches.pop(key, None)
+        self.partial.pop(key, None)
+
+    def tokens(
+        self,
+        document: DocumentTree,
+        rows: Optional[Tuple[int, int]] = None,
+        is_cancelled: Optional[Callable[[], bool]] = None,
+        bounded: bool = False,
+    ) -> List[SemanticToken]:
+        """Tokens of the document, or only of the blocks intersecting rows
+        (first, last). Raises RequestCancelled once is_cancelled() is true.
+        If bounded, a large document, only the blocks of rows stay cached."""
+        src = document.utf8_bytes
+        offsets = document.line_offsets
+        previous = self.caches.get(document.key, {})
+        partial = self.partial.get(document.key, {})
+        cache: Dict[BlockKey, BlockTokens] = {}
+        tokens: List[SemanticToken] = []
+        blocks = 0
+        misses = 0
+
+        walk = Preorder(document.tree.root_node, is_cancelled=is_cancelled)
+        try:
+            for node in walk:
+                if rows:
+                    if node.start_point[0] > rows[1]:
+                        break
+                    if node.end_point <= (rows[0], 0):
+                        walk.skip()
+                        continue
+                if node.type in CONTAINER_TYPES:
+                    continue
+                walk.skip()
+                key = (
+                    node.type,
+                    node.start_point[1],
+                    node.end_byte - node.start_byte,
+                    hash(src[node.start_byte : node.end_byte]),
+                )
+                block = cache.get(key)
+                if block is None:
+                    block = partial.get(key)
+                if block is None:
+                    block = previous.get(key)
+                if block is None:
+                    block = block_tokens(node, src, offsets)
+                    misses += 1
+                blocks += 1
+                cache[key] = block
+                row = node.start_point[0]
+                tokens.extend(
+                    SemanticToken((row + r, column), byte_len, token_type, modifiers)
+                    for (r, column), byte_len, token_type, modifiers in block
+                )
+        except RequestCancelled:
+            # the blocks captured so far serve the request of the next version
+            self.partial[document.key] = cache
+            raise
+
+        if rows and not bounded:
+            # the blocks of the rest of the document stay for a full request
+            self.partial[document.key] = cache
+        else:
+            self.caches[document.key] = cache
+            self.partial.pop(document.key, None)
+        STATS.cache("highlight", blocks - misses, misses)
+        return tokens
+
+
+def semantic_tokens_from_utf8bytes(src: bytes) -> List[SemanticToken]:
+    return Highlighter().tokens(DocumentTree("", None, src, treesitter_parse))
+
+
+def _utf16_len(utf8_bytes: bytes) -> int:
+    if utf8_bytes.isascii():
+        return len(utf8_bytes)
+    return len(utf8_bytes.decode("utf-8", errors="replace").encode("utf-16-le")) // 2
+
+
+# line, utf-16 character, utf-16 length, type index, modifier bits
+Segment = Tuple[int, int, int, int, int]
+
+
+class SemanticTokensEncoder:
+    """Encodes tokens as the relative uint array of the LSP.
+
+    The type and modifier maps are built once per legend. Byte columns are
+    converted to utf-16 with the line table of the document: an ascii line
+    as is, others incrementally from the previous token on the line, so a
+    document is encoded in one linear pass. A token across lines is split
+    per line, clients are not required to support multiline tokens. The
+    segments are sorted only if they are not in document order.
+
+    With ``is_cancelled`` the encoding raises RequestCancelled once it is
+    true, checked every CHECK_INTERVAL tokens.
+    """
+
+    def __init__(self, token_types: Sequence[str], token_modifiers: Sequence[str] = ()):
+        self.type_indices = {token_type: i for i, token_type in enumerate(token_types)}
+        self.modifier_bits = {
+            modifier: 1 << i for i, modifier in enumerate(token_modifiers)
+        }
+
+    def segments(
+        self,
+        tokens: Iterable[SemanticToken],
+        document: DocumentTree,
+        is_cancelled: Optional[Callable[[], bool]] = None,
+    ) -> Iterator[Segment]:
+        src = document.utf8_bytes
+        size = len(src)
+        offsets = document.line_offsets
+        lines = len(offsets)
+        ascii_document = src.isascii()
+        type_indices = self.type_indices
+        modifier_bits = self.modifier_bits
+
+        # the current row and the utf-16 column of byte_col in it
+        row = -1
+        row_start = row_end = next_start = 0
+        ascii_row = True
+        # only characters outside the BMP take two utf-16 units
+        astral_row = False
+        byte_col = utf16_col = 0
+        countdown = CHECK_INTERVAL
+
+        for (line, column), byte_len, token_type, modifiers in tokens:
+            if is_cancelled is not None:
+                countdown -= 1
+                if not countdown:
+                    if is_cancelled():
+                        raise RequestCancelled()
+                    countdown = CHECK_INTERVAL
+            index = type_indices.get(token_type)
+            if index is None:
+                # not in the legend
+                continue
+            bits = 0
+            for modifier in modifiers:
+                bits |= modifier_bits.get(modifier, 0)
+
+            start = offsets[line] + column
+            end = start + byte_len
+            while True:
+                if line != row:
+                    row = line
+                    row_start = offsets[row]
+                    if row + 1 < lines:
+                        next_start = offsets[row + 1]
+                        row_end = next_start - 1
+                        if row_end > row_start and src[row_end - 1] == 0x0D:
+                            row_end -= 1
+                    else:
+                        next_start = row_end = size
+                    if ascii_document:
+                        ascii_row = True
+                    else:
+                        row_bytes = src[row_start:row_end]
+                        ascii_row = row_bytes.isascii()
+                        astral_row = not ascii_row and max(row_bytes) >= 0xF0
+                    byte_col, utf16_col = row_start, 0
+                segment_end = end if end < row_end else row_end
+                if ascii_row:
+                    if segment_end > start:
+                        yield (
+                            line,
+                            start - row_start,
+                            segment_end - start,
+                            index,
+                            bits,
+                        )
+                elif segment_end > start:
+                    if start < byte_col:
+                        byte_col, utf16_col = row_start, 0
+                    if astral_row:
+                        character = utf16_col + _utf16_len(src[byte_col:start])
+                        length = _utf16_len(src[start:segment_end])
+                    else:
+                        character = utf16_col + len(
+                            src[byte_col:start].decode("utf-8", errors="replace")
+                        )
+                        length = len(
+                            src[start:segment_end].decode("utf-8", errors="replace")
+                        )
+                    byte_col, utf16_col = segment_end, character + length
+                    yield (line, character, length, index, bits)
+                if end <= next_start or line + 1 >= lines:
+                    break
+                # the rest of the token is on the next line
+                line += 1
+                start = offsets[line]
+
+    def encode(
+        self,
+        tokens: Iterable[SemanticToken],
+        document: DocumentTree,
+        is_cancelled: Optional[Callable[[], bool]] = None,
+    ) -> "array[int]":
+        data: List[int] = []
+        extend = data.extend
+        last_line = last_character = 0
+        rest: List[Segment] = []
+        segments = self.segments(tokens, document, is_cancelled)
+        for segment in segments:
+            line, character, length, index, bits = segment
+            if line == last_line:
+                if character < last_character:
+                    rest.append(segment)
+                    break
+                extend((0, character - last_character, length, index, bits))
+            elif line > last_line:
+                extend((line - last_line, character, length, index, bits))
+            else:
+                rest.append(segment)
+                break
+            last_line, last_character = line, character
+
+        if rest:
+            # not in document order, like a multiline token before the tokens
+            # inside it. Decode the deltas so far and start over sorted.
+            emitted: List[Segment] = []
+            line = character = 0
+            for i in range(0, len(data), 5):
+                line += data[i]
+                character = data[i + 1] + (character if data[i] == 0 else 0)
+                emitted.append((line, character) + tuple(data[i + 2 : i + 5]))
+            rest.extend(segments)
+            data = []
+            extend = data.extend
+            last_line = last_character = 0
+            for line, character, length, index, bits in sorted(emitted + rest):
+                if line != last_line:
+                    last_character = 0
+                extend(
+                    (line - last_line, character - last_character, length, index, bits)
+                )
+                last_line, last_character = line, character
+
+        return array("I", data)
+
+
+@functools.lru_cache(maxsize=8)
+def token_encoder(
+    token_types: Tuple[str, ...], token_modifiers: Tuple[str, ...] = ()
+) -> SemanticTokensEncoder:
+    """The encoder of a legend, shared by every request."""
+    return SemanticTokensEncoder(token_types, token_modifiers)
+
+
+def to_relative(
+    tokens: Iterable[SemanticToken],
+    token_types: Sequence[str],
+    document: DocumentTree,
+    token_modifiers: Sequence[str] = (),
+    is_cancelled: Optional[Callable[[], bool]] = None,
+) -> lsp_types.SemanticTokens:
+    data = token_encoder(tuple(token_types), tuple(token_modifiers)).encode(
+        tokens, document, is_cancelled
+    )
+    return lsp_types.SemanticTokens(data=data.tolist())
+
+
+def semantic_tokens_edits(
+    previous: Sequence[int], data: Sequence[int]
+) -> List[lsp_types.SemanticTokensEdit]:
+    """Minimal edit from the previous token array: replace all but the common
+    prefix and suffix."""
+    prefix = 0
+    size = min(len(previous), len(data))
+    while prefix < size and previous[prefix] == data[prefix]:
+        prefix += 1
+    suffix = 0
+    while (
+        suffix < size - prefix
+        and previous[len(previous) - 1 - suffix] == data[len(data) - 1 - suffix]
+    ):
+        suffix += 1
+    if prefix == len(previous) == len(data):
+        return []
+    return [
+        lsp_types.SemanticTokensEdit(
+            start=prefix,
+            delete_count=len(previous) - prefix - suffix,
+            data=list(data[prefix : len(data) - suffix]),
+        )
+    ]
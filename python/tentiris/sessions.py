@@ -0,0 +1,198 @@
+from typing import Optional, Any, Dict, Callable
+import asyncio
+import functools
+import itertools
+import json
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.pool import ThreadPool
+from lsprotocol.types import EXIT
+from pygls.protocol import LanguageServerProtocol, lsp_method
+from pygls.server import LanguageServer, WebSocketTransportAdapter
+
+LOGGER = logging.getLogger(__name__)
+
+# the thread pool of the handlers and the validation, shared by the sessions
+MAX_WORKERS = 4
+
+
+def session_of(ls) -> Optional[int]:
+    """The id of a client session of a shared server, None for a stdio server.
+    ls may be the execution.ThreadServer of a handler in the thread pool."""
+    return getattr(ls, "session_id", None)
+
+
+class SessionProtocol(LanguageServerProtocol):
+    """The connection of a session. The end of it ends the session, not the
+    process."""
+
+    def connection_lost(self, exc):
+        LOGGER.info(f"session {self._server.session_id}: connection lost")
+        self._server.end()
+
+    @lsp_method(EXIT)
+    def lsp_exit(self, *args) -> None:
+        if self.transport is not None:
+            self.transport.close()
+        self._server.end()
+
+
+class Session(LanguageServer):
+    """A client of a SessionServer, with the workspace documents of its
+    editor. Sessions share the event loop, the thread pools and every
+    module level state: the parser pool, the workspace index and the caches
+    derived from trees. The documents a session opened are its overlay in
+    features.DOCUMENTS, see session_of.
+    """
+
+    def __init__(self, server: "SessionServer", session_id: int, *args, **kwargs):
+        super().__init__(
+            *args, loop=server.loop, protocol_cls=SessionProtocol, **kwargs
+        )
+        # Server.__init__ sets a new event loop of its own
+        stray = asyncio.get_event_loop_policy().get_event_loop()
+        asyncio.set_event_loop(server.loop)
+        if stray is not server.loop:
+            stray.close()
+        self.server = server
+        self.session_id = session_id
+        self.ended = False
+
+    @property
+    def thread_pool(self) -> ThreadPool:
+        return self.server.thread_pool
+
+    @property
+    def thread_pool_executor(self) -> ThreadPoolExecutor:
+        return self.server.thread_pool_executor
+
+    def end(self) -> None:
+        if not self.ended:
+            self.ended = True
+            self.server.end(self)
+
+
+class SessionServer:
+    """One process serving the editors of a machine over TCP or WebSocket.
+
+    Every connection is a Session with the features registered by
+    init_session, which is called with a factory of the session like
+    LanguageServer(name, version). on_end releases the documents a session
+    left open.
+    """
+
+    def __init__(
+        self,
+        init_session: Callable[[Callable[..., LanguageServer]], LanguageServer],
+        on_end: Callable[[Session], None],
+        max_workers: int = MAX_WORKERS,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ):
+        self.init_session = init_session
+        self.on_end = on_end
+        self.max_workers = max_workers
+        self.loop = loop or asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.sessions: Dict[int, Session] = {}
+        self.ids = itertools.count(1)
+        # an asyncio or a websockets server
+        self._server: Optional[Any] = None
+        self._thread_pool: Optional[ThreadPool] = None
+        self._thread_pool_executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def thread_pool(self) -> ThreadPool:
+        if not self._thread_pool:
+            self._thread_pool = ThreadPool(processes=self.max_workers)
+        return self._thread_pool
+
+    @property
+    def thread_pool_executor(self) -> ThreadPoolExecutor:
+        if not self._thread_pool_executor:
+            self._thread_pool_executor = ThreadPoolExecutor(
+                max_workers=self.max_workers
+            )
+        return self._thread_pool_executor
+
+    def connect(self) -> Session:
+        session_id = next(self.ids)
+        session = self.init_session(functools.partial(Session, self, session_id))
+        assert isinstance(session, Session)
+        self.sessions[session_id] = session
+        LOGGER.info(f"session {session_id}: connected, {len(self.sessions)} sessions")
+        return session
+
+    def end(self, session: Session) -> None:
+        if self.sessions.pop(session.session_id, None):
+            self.on_end(session)
+            LOGGER.info(
+                f"session {session.session_id}: ended, {len(self.sessions)} sessions"
+            )
+
+    async def serve_tcp(self, host: str, port: int) -> asyncio.AbstractServer:
+        """Listen, a connection is a session."""
+        self._server = await self.loop.create_server(
+            lambda: self.connect().lsp, host, port
+        )
+        return self._server
+
+    async def serve_ws(self, host: str, port: int) -> None:
+        try:
+            from websockets.server import serve
+        except ImportError:
+            LOGGER.error("Run `pip install pygls[ws]` to install `websockets`.")
+            sys.exit(1)
+
+        async def connection(websocket):
+            session = self.connect()
+            session.lsp._send_only_body = True
+            session.lsp.transport = WebSocketTransportAdapter(websocket, self.loop)
+            try:
+                async for message in websocket:
+                    session.lsp._procedure_handler(
+                        json.loads(
+                            message, object_hook=session.lsp._deserialize_message
+                        )
+                    )
+            finally:
+                session.end()
+
+        self._server = await serve(connection, host, port)
+
+    def start_tcp(self, host: str, port: int) -> None:
+        LOGGER.info(f"Starting TCP server on {host}:{port}")
+        self._run(self.serve_tcp(host, port))
+
+    def start_ws(self, host: str, port: int) -> None:
+        LOGGER.info(f"Starting WebSocket server on {host}:{port}")
+        self._run(self.serve_ws(host, port))
+
+    def _run(self, serve) -> None:
+        self.loop.run_until_complete(serve)
+        try:
+            self.loop.run_forever()
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            self.shutdown()
+
+    async def close(self) -> None:
+        """Stop listening and end the sessions."""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        for session in list(self.sessions.values()):
+            # the websockets server closed its connections
+            if isinstance(session.lsp.transport, asyncio.BaseTransport):
+                session.lsp.transport.close()
+            session.end()
+
+    def shutdown(self) -> None:
+        self.loop.run_until_complete(self.close())
+        if self._thread_pool:
+            self._thread_pool.terminate()
+            self._thread_pool.join()
+        if self._thread_pool_executor:
+            self._thread_pool_executor.shutdown()
+        self.loop.close()
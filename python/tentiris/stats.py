@@ -0,0 +1,167 @@
+from typing import Optional, List, Dict, Any
+import asyncio
+import bisect
+import logging
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+# upper bounds of the histogram buckets in milliseconds, the last is unbounded
+BUCKETS_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# how often the event loop is checked for lag
+LAG_INTERVAL = 0.5
+
+
+class Histogram:
+    """Counts of durations in BUCKETS_MS, percentiles are bucket bounds."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        ms = seconds * 1e3
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, p: float) -> float:
+        """The bucket bound below which p percent of the durations are."""
+        rank = p / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max
+        return 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max,
+            # (upper bound in ms or null, count) of the buckets in use
+            "buckets": [
+                [BUCKETS_MS[i] if i < len(BUCKETS_MS) else None, count]
+                for i, count in enumerate(self.counts)
+                if count
+            ],
+        }
+
+
+class Stats:
+    """Process wide counters of the language server, for the tentiris.stats
+    command and the periodic log line.
+
+    ``requests`` holds the latency of each method as handled by the
+    wrappers of init_language_server, an async handler until it returns.
+    The others are recorded where the work happens and may come from the
+    thread pool, so every update takes the lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests: Dict[str, Histogram] = {}
+        self.parse = Histogram()
+        self.loop_lag = Histogram()
+        self.counters: Dict[str, int] = {}
+        # name: [hits, misses]
+        self.caches: Dict[str, List[int]] = {}
+
+    def record(self, method: str, seconds: float) -> None:
+        with self.lock:
+            histogram = self.requests.get(method)
+            if histogram is None:
+                histogram = self.requests[method] = Histogram()
+            histogram.add(seconds)
+
+    def record_parse(self, seconds: float, incremental: bool) -> None:
+        name = "parse.incremental" if incremental else "parse.full"
+        with self.lock:
+            self.parse.add(seconds)
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def cache(self, name: str, hits: int, misses: int) -> None:
+        with self.lock:
+            counts = self.caches.get(name)
+            if counts is None:
+                counts = self.caches[name] = [0, 0]
+            counts[0] += hits
+            counts[1] += misses
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "uptime_s": time.time() - self.started,
+                "requests": {
+                    method: histogram.snapshot()
+                    for method, histogram in sorted(self.requests.items())
+                },
+                "parse": self.parse.snapshot(),
+                "loop_lag": self.loop_lag.snapshot(),
+                "counters": dict(sorted(self.counters.items())),
+                "caches": {
+                    name: {
+                        "hits": hits,
+                        "misses": misses,
+                        "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+                    }
+                    for name, (hits, misses) in sorted(self.caches.items())
+                },
+            }
+
+    def log_line(self) -> str:
+        """The busiest methods, parse and loop lag in one line."""
+        with self.lock:
+            busiest = sorted(self.requests.items(), key=lambda item: -item[1].total)[:5]
+            parts = [
+                f"{method} n={h.count} p95={h.percentile(95):g}ms max={h.max:.0f}ms"
+                for method, h in busiest
+            ]
+            parts.append(
+                f"parse n={self.parse.count} p95={self.parse.percentile(95):g}ms"
+            )
+            parts.append(
+                f"loop lag p95={self.loop_lag.percentile(95):g}ms "
+                f"max={self.loop_lag.max:.0f}ms"
+            )
+        return "stats: " + ", ".join(parts)
+
+    def watch_loop(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        interval: float = LAG_INTERVAL,
+        log_interval: Optional[float] = None,
+    ) -> None:
+        """Record how late the loop runs a timer, the time it was blocked, and
+        log a line every log_interval seconds. A chain of timers and not a
+        task, nothing is left pending when the server closes the loop."""
+
+        def check(due: float, last_log: float):
+            now = loop.time()
+            with self.lock:
+                self.loop_lag.add(max(0.0, now - due))
+            if log_interval and now - last_log >= log_interval:
+                last_log = now
+                # opt-in, shown at the default level
+                LOGGER.warning(self.log_line())
+            loop.call_later(interval, check, now + interval, last_log)
+
+        loop.call_later(interval, check, loop.time() + interval, loop.time())
+
+
+STATS = Stats()
@@ -0,0 +1,274 @@
+from typing import Generic, List, Dict, Iterable, Set, Tuple, TypeVar
+from array import array
+import bisect
+import collections
+import heapq
+import itertools
+import re
+import threading
+
+T = TypeVar("T")
+
+NOT_KEY = re.compile(r"[\W_]+")
+
+# build the table again once this many entries changed since the last build
+REBUILD_ENTRIES = 5000
+
+# distinct keys scored per query, the shortest first
+MAX_CANDIDATES = 5000
+
+
+def normalize(text: str) -> str:
+    """Lower case words separated by a space, a slug and its title match."""
+    return " ".join(NOT_KEY.sub(" ", text.lower()).split())
+
+
+def trigrams(word: str) -> Set[str]:
+    return {word[i : i + 3] for i in range(len(word) - 2)}
+
+
+class _Query:
+    """A normalized query, with the query words each key word matches."""
+
+    def __init__(self, text: str):
+        self.key = normalize(text)
+        self.words = self.key.split()
+        self.grams = [trigrams(word) for word in self.words]
+        # word: bit i set if it matches query word i
+        self.masks: Dict[str, int] = {}
+
+    def mask(self, word: str) -> int:
+        mask = self.masks.get(word)
+        if mask is None:
+            mask = 0
+            word_grams = None
+            for i, (query_word, grams) in enumerate(zip(self.words, self.grams)):
+                if query_word in word:
+                    mask |= 1 << i
+                elif len(grams) > 1:
+                    # a typo, at least half of the trigrams
+                    if word_grams is None:
+                        word_grams = trigrams(word)
+                    if 2 * len(grams & word_grams) >= len(grams):
+                        mask |= 1 << i
+            self.masks[word] = mask
+        return mask
+
+    def rank(self, key: str) -> Tuple[int, int, int, int, str]:
+        """Equal, prefix, word prefix and substring first, then by the
+        number of query words in the key and matching a word of it."""
+        if key == self.key:
+            match_class = 0
+        else:
+            position = key.find(self.key)
+            if position == 0:
+                match_class = 1
+            elif position > 0:
+                match_class = 2 if key[position - 1] == " " else 3
+            else:
+                match_class = 4
+        found = sum(1 for word in self.words if word in key)
+        mask = 0
+        for word in key.split():
+            mask |= self.mask(word)
+        return (match_class, -found, -bin(mask).count("1"), len(key), key)
+
+
+class _Table(Generic[T]):
+    """Entries grouped by distinct key, with the keys of each word and the
+    words of each trigram.
+
+    Key ids are positions in (len(key), key) order, so a sorted set of ids
+    comes shortest key first. Headings like "Usage" repeat across files and
+    words repeat across headings, so the postings stay much smaller than
+    trigrams of every heading.
+    """
+
+    def __init__(self, entries: List[Tuple[str, str, T]]):
+        entries.sort(key=lambda e: (len(e[1]), e[1]))
+        self.paths = [path for path, _, _ in entries]
+        self.values = [value for _, _, value in entries]
+        self.keys: List[str] = []
+        # the entries of key id are starts[id]:starts[id + 1]
+        self.starts = array("I")
+        for i, (_, key, _) in enumerate(entries):
+            if not self.keys or self.keys[-1] != key:
+                self.keys.append(key)
+                self.starts.append(i)
+        self.starts.append(len(entries))
+
+        word_keys: Dict[str, List[int]] = collections.defaultdict(list)
+        for id, key in enumerate(self.keys):
+            for word in set(key.split()):
+                word_keys[word].append(id)
+        # sorted for the prefixes too short for a trigram
+        self.words = sorted(word_keys)
+        self.word_keys = [array("I", word_keys[word]) for word in self.words]
+        postings: Dict[str, List[int]] = collections.defaultdict(list)
+        for id, word in enumerate(self.words):
+            for gram in trigrams(word):
+                postings[gram].append(id)
+        self.postings = {gram: array("I", ids) for gram, ids in postings.items()}
+
+    def entries(self, id: int) -> range:
+        return range(self.starts[id], self.starts[id + 1])
+
+    def matching_words(self, query_word: str) -> Iterable[int]:
+        """Ids of the words a query word matches."""
+        grams = trigrams(query_word)
+        if not grams:
+            start = bisect.bisect_left(self.words, query_word)
+            end = bisect.bisect_left(self.words, query_word + "\U0010ffff")
+            return range(start, end)
+        counts: collections.Counter = collections.Counter()
+        for gram in grams:
+            counts.update(self.postings.get(gram, ()))
+        if len(grams) == 1:
+            return counts.keys()
+        return [id for id, count in counts.items() if 2 * count >= len(grams)]
+
+    def matching_keys(self, query_word: str) -> Set[int]:
+        ids: Set[int] = set()
+        for id in self.matching_words(query_word):
+            ids.update(self.word_keys[id])
+        return ids
+
+
+class SymbolIndex(Generic[T]):
+    """Fuzzy ranked search over named symbols of many files.
+
+    The bulk of the entries is a table built in one pass from arrays of
+    postings, see _Table. Files put after the build are scanned until
+    build() runs again, search() never builds. A query ranks equal, prefix,
+    word prefix and substring matches, then keys by the number of query
+    words they contain or nearly contain, shorter keys first.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files: Dict[str, List[Tuple[str, T]]] = {}
+        self.table: _Table[T] = _Table([])
+        # path: version, the files changed since the table was built
+        self.changed: Dict[str, int] = {}
+        self.changed_entries = 0
+        self.version = 0
+
+    def put(self, path: str, items: Iterable[Tuple[str, T]]) -> None:
+        """Replace the (name, value) of the file."""
+        entries = [(normalize(name), value) for name, value in items]
+        with self.lock:
+            self._changed(path, len(entries))
+            self.files[path] = entries
+
+    def remove(self, path: str) -> None:
+        with self.lock:
+            if path in self.files:
+                self._changed(path, 0)
+                del self.files[path]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.files = {}
+            self.table = _Table([])
+            self.changed = {}
+            self.changed_entries = 0
+
+    def _changed(self, path: str, entries: int) -> None:
+        if path in self.changed:
+            # an open file is put on every edit, count it once
+            self.changed_entries -= len(self.files.get(path, ()))
+        self.version += 1
+        self.changed[path] = self.version
+        self.changed_entries += entries
+
+    @property
+    def needs_build(self) -> bool:
+        return self.changed_entries > REBUILD_ENTRIES
+
+    def build(self) -> None:
+        """Build the table of every file, without holding the lock."""
+        with self.lock:
+            version = self.version
+            entries = [
+                (path, key, value)
+                for path, items in self.files.items()
+                for key, value in items
+            ]
+        table = _Table(entries)
+        with self.lock:
+            self.table = table
+            # changed while building
+            self.changed = {
+                path: changed
+                for path, changed in self.changed.items()
+                if changed > version
+            }
+            self.changed_entries = sum(
+                len(self.files.get(path, ())) for path in self.changed
+            )
+
+    def search(self, query: str, limit: int) -> List[Tuple[str, T]]:
+        """(path, value) of the best limit matches, best first."""
+        with self.lock:
+            table = self.table
+            stale = set(self.changed)
+            delta = [(path, self.files.get(path, [])) for path in stale]
+
+        parsed = _Query(query)
+        if not parsed.key:
+            matches = list(
+                itertools.islice(
+                    (
+                        (path, value)
+                        for path, value in zip(table.paths, table.values)
+                        if path not in stale
+                    ),
+                    limit,
+                )
+            )
+            for path, items in delta:
+                matches.extend((path, value) for _, value in items)
+            return matches[:limit]
+
+        # rank the distinct keys, expand their entries only up to the limit
+        ranked = sorted(
+            (parsed.rank(table.keys[id]), id)
+            for id in self._candidates(table, parsed.words, limit)
+        )
+
+        def entries():
+            for rank, id in ranked:
+                for i in table.entries(id):
+                    path = table.paths[i]
+                    if path not in stale:
+                        yield (rank, i), (path, table.values[i])
+
+        changed = []
+        for path, items in delta:
+            for candidate, value in items:
+                rank = parsed.rank(candidate)
+                if rank[0] < 4 or -2 * rank[2] >= len(parsed.words):
+                    unique = len(table.paths) + len(changed)
+                    changed.append(((rank, unique), (path, value)))
+        changed.sort()
+        return [
+            match
+            for _, match in itertools.islice(heapq.merge(entries(), changed), limit)
+        ]
+
+    def _candidates(
+        self, table: _Table[T], query_words: List[str], limit: int
+    ) -> List[int]:
+        """Ids of the keys matching all query words, or at least half of them."""
+        matching = sorted(
+            (table.matching_keys(query_word) for query_word in query_words), key=len
+        )
+        found = set(matching[0])
+        for ids in matching[1:]:
+            found.intersection_update(ids)
+        if len(found) < limit and len(matching) > 1:
+            counts: collections.Counter = collections.Counter()
+            for ids in matching:
+                counts.update(ids)
+            found = {id for id, count in counts.items() if 2 * count >= len(matching)}
+        return sorted(found)[:MAX_CANDIDATES]
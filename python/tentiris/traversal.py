@@ -0,0 +1,93 @@
+from typing import Optional, Callable, Container, Iterator
+import tree_sitter
+from .execution import CHECK_INTERVAL, RequestCancelled
+
+
+class Preorder:
+    """Nodes of a subtree in pre-order, with a single TreeCursor.
+
+    No recursion and no per node lists, so deep nesting costs nothing extra.
+    Call ``skip()`` in the loop body to not visit the children of the
+    current node. The children of ``skip_types`` are never visited. With
+    ``types`` only those nodes are yielded, the others are still descended.
+    With ``is_cancelled`` the walk raises RequestCancelled once it is true,
+    checked every CHECK_INTERVAL nodes.
+
+        walk = Preorder(tree.root_node, skip_types=("inline",))
+        for node in walk:
+            if node.type == "fenced_code_block":
+                walk.skip()
+
+    Start positions never decrease in pre-order, so a loop can stop at the
+    first node past a range.
+    """
+
+    def __init__(
+        self,
+        node: tree_sitter.Node,
+        types: Optional[Container[str]] = None,
+        skip_types: Container[str] = (),
+        is_cancelled: Optional[Callable[[], bool]] = None,
+    ):
+        self.node = node
+        self.types = types
+        self.skip_types = skip_types
+        self.is_cancelled = is_cancelled
+        # of the node yielded last, below the root of the subtree
+        self.depth = 0
+        self._descend = True
+
+    def skip(self) -> None:
+        """Do not visit the children of the node yielded last."""
+        self._descend = False
+
+    def __iter__(self) -> Iterator[tree_sitter.Node]:
+        cursor = self.node.walk()
+        types = self.types
+        skip_types = self.skip_types
+        is_cancelled = self.is_cancelled
+        countdown = CHECK_INTERVAL
+        depth = 0
+        while True:
+            if is_cancelled is not None:
+                countdown -= 1
+                if not countdown:
+                    if is_cancelled():
+                        raise RequestCancelled()
+                    countdown = CHECK_INTERVAL
+            node = cursor.node
+            node_type = node.type
+            descend = True
+            if types is None or node_type in types:
+                self.depth = depth
+                self._descend = True
+                yield node
+                descend = self._descend
+            if descend and node_type not in skip_types and cursor.goto_first_child():
+                depth += 1
+                continue
+            while True:
+                # the cursor must not leave the subtree
+                if not depth:
+                    return
+                if cursor.goto_next_sibling():
+                    break
+                cursor.goto_parent()
+                depth -= 1
+
+
+def postorder(node: tree_sitter.Node) -> Iterator[tree_sitter.Node]:
+    """Nodes of a subtree in post-order, children before their parent."""
+    cursor = node.walk()
+    depth = 0
+    while True:
+        while cursor.goto_first_child():
+            depth += 1
+        while True:
+            yield cursor.node
+            if depth == 0:
+                return
+            if cursor.goto_next_sibling():
+                break
+            cursor.goto_parent()
+            depth -= 1
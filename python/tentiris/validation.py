@@ -0,0 +1,78 @@
+from typing import Optional, List, Dict, Callable, Hashable
+import asyncio
+import logging
+import lsprotocol.types as lsp_types
+from pygls.server import LanguageServer
+from .documents import DocumentTree, document_key
+
+LOGGER = logging.getLogger(__name__)
+
+# wait for a pause in typing before validating
+DEBOUNCE_SECONDS = 0.3
+
+ValidateFunc = Callable[
+    [DocumentTree, Callable[[], bool]], Optional[List[lsp_types.Diagnostic]]
+]
+
+
+class ValidationScheduler:
+    """Debounces validation per document and runs it off the event loop.
+
+    ``validate(document, is_stale)`` runs in the server thread pool with the
+    document lock held. It should return early (None) once ``is_stale()``
+    is true. Only the diagnostics of the latest version are published.
+    """
+
+    def __init__(self, validate: ValidateFunc, delay: float = DEBOUNCE_SECONDS):
+        self.validate = validate
+        self.delay = delay
+        # by DocumentTree.key, a uri open in two sessions validates twice
+        self.latest: Dict[Hashable, DocumentTree] = {}
+        self.tasks: Dict[Hashable, asyncio.Future] = {}
+
+    def cancel(self, uri: str, session: Optional[int] = None) -> None:
+        """Mark the pending and running validation of the uri as stale."""
+        key = document_key(uri, session)
+        self.latest.pop(key, None)
+        task = self.tasks.pop(key, None)
+        if task:
+            task.cancel()
+
+    def schedule(
+        self,
+        ls: LanguageServer,
+        document: DocumentTree,
+        delay: Optional[float] = None,
+    ) -> asyncio.Future:
+        self.cancel(document.uri, document.session)
+        self.latest[document.key] = document
+        task = asyncio.ensure_future(
+            self._run(ls, document, self.delay if delay is None else delay)
+        )
+        self.tasks[document.key] = task
+        return task
+
+    def is_stale(self, document: DocumentTree) -> bool:
+        return self.latest.get(document.key) is not document
+
+    def _validate_in_thread(
+        self, document: DocumentTree
+    ) -> Optional[List[lsp_types.Diagnostic]]:
+        if self.is_stale(document):
+            return None
+        with document.lock:
+            return self.validate(document, lambda: self.is_stale(document))
+
+    async def _run(self, ls: LanguageServer, document: DocumentTree, delay: float):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        loop = asyncio.get_running_loop()
+        diagnostics = await loop.run_in_executor(
+            ls.thread_pool_executor, self._validate_in_thread, document
+        )
+        if diagnostics is None or self.is_stale(document):
+            LOGGER.debug(f"drop stale diagnostics: {document.uri}")
+            return
+        if self.tasks.get(document.key) is asyncio.current_task():
+            del self.tasks[document.key]
+        ls.publish_diagnostics(document.uri, diagnostics, version=document.version)
@@ -0,0 +1,586 @@
+from typing import Optional, List, Dict, NamedTuple, Tuple, Callable, Iterable, Set
+import asyncio
+import concurrent.futures
+import hashlib
+import itertools
+import multiprocessing
+import os
+import pathlib
+import pickle
+import re
+import threading
+import urllib.parse
+import logging
+from .documents import DocumentTree
+from .headings import (
+    slugify,
+    heading_level,
+    heading_title,
+    heading_title_range,
+    SlugCounter,
+)
+from .injections import inline_links
+from .parser_pool import language_library, set_language_library, treesitter_parse
+from .path_trie import PathTrie, PrefixIndex
+from .symbol_index import SymbolIndex
+from .traversal import Preorder
+
+LOGGER = logging.getLogger(__name__)
+
+# bump when the pickled symbols change
+CACHE_VERSION = 2
+
+# files per process pool task
+CHUNK_SIZE = 64
+
+# collect watched file events for this long, a branch switch sends thousands
+BATCH_SECONDS = 0.2
+
+MARKDOWN_SUFFIXES = (".md", ".markdown")
+
+# an inline node that may contain a link, parsed with the inline grammar
+INLINE_LINK = re.compile(rb"\]\(")
+URI_SCHEME = re.compile(r"^[a-zA-Z][a-zA-Z0-9+.-]+:")
+FRONT_MATTER_ITEM = re.compile(r"^([\w-]+)\s*:\s*(.*?)\s*$")
+
+# LSP (utf-16) start line, start character, end line, end character
+Span = Tuple[int, int, int, int]
+
+
+class HeadingSymbol(NamedTuple):
+    level: int
+    title: str
+    anchor: str
+    span: Span
+    # the title text only, replaced by a rename
+    title_span: Span
+
+
+class LinkSymbol(NamedTuple):
+    """A link to a file in the workspace. path is "" for a same file anchor."""
+
+    path: str
+    anchor: str
+    span: Span
+
+
+class ReferenceDefinition(NamedTuple):
+    label: str
+    destination: str
+    span: Span
+
+
+class FileSymbols(NamedTuple):
+    path: str
+    mtime_ns: int
+    size: int
+    digest: str
+    headings: List[HeadingSymbol]
+    links: List[LinkSymbol]
+    references: List[ReferenceDefinition]
+    front_matter: Dict[str, str]
+
+
+class FileJob(NamedTuple):
+    path: str
+    mtime_ns: int
+    size: int
+    cached: Optional[FileSymbols]
+
+
+def digest_of(utf8_bytes: bytes) -> str:
+    return hashlib.blake2b(utf8_bytes, digest_size=16).hexdigest()
+
+
+def _span(document: DocumentTree, start: int, end: int) -> Span:
+    s = document.offset_to_position(start)
+    e = document.offset_to_position(end)
+    return (s.line, s.character, e.line, e.character)
+
+
+def _link(document: DocumentTree, destination: str, start: int) -> Optional[LinkSymbol]:
+    if URI_SCHEME.match(destination):
+        # external
+        return None
+    path, _, anchor = destination.partition("#")
+    return LinkSymbol(
+        path, anchor, _span(document, start, start + len(destination.encode("utf-8")))
+    )
+
+
+def extract_symbols(
+    path: str, utf8_bytes: bytes, mtime_ns: int = 0, size: int = 0
+) -> FileSymbols:
+    """Headings, links, reference definitions and front matter of a file."""
+    return symbols_from_document(
+        path, DocumentTree(path, None, utf8_bytes, treesitter_parse), mtime_ns, size
+    )
+
+
+def symbols_from_document(
+    path: str,
+    document: DocumentTree,
+    mtime_ns: int = 0,
+    size: int = 0,
+    is_cancelled: Optional[Callable[[], bool]] = None,
+) -> FileSymbols:
+    """Extract from an already parsed document, like one open in the editor."""
+    utf8_bytes = document.utf8_bytes
+    symbols = FileSymbols(path, mtime_ns, size, digest_of(utf8_bytes), [], [], [], {})
+    slugs = SlugCounter()
+
+    def text(node) -> str:
+        return utf8_bytes[node.start_byte : node.end_byte].decode("utf-8", "replace")
+
+    for node in Preorder(
+        document.tree.root_node,
+        skip_types=("inline", "link_reference_definition", "minus_metadata"),
+        is_cancelled=is_cancelled,
+    ):
+        match node.type:
+            case "atx_heading" | "setext_heading":
+                title = heading_title(node, utf8_bytes)
+                content = node.child_by_field_name("heading_content") or node
+                title_start, title_end = heading_title_range(node, utf8_bytes) or (
+                    content.end_byte,
+                    content.end_byte,
+                )
+                symbols.headings.append(
+                    HeadingSymbol(
+                        heading_level(node),
+                        title,
+                        slugs.add(slugify(title)) or "",
+                        _span(document, node.start_byte, content.end_byte),
+                        _span(document, title_start, title_end),
+                    )
+                )
+            case "inline":
+                if not INLINE_LINK.search(utf8_bytes, node.start_byte, node.end_byte):
+                    continue
+                for inline_link in inline_links(node, utf8_bytes):
+                    link = _link(
+                        document,
+                        inline_link.destination.decode("utf-8", "replace"),
+                        inline_link.start_byte,
+                    )
+                    if link:
+                        symbols.links.append(link)
+            case "link_reference_definition":
+                label = next((c for c in node.children if c.type == "link_label"), None)
+                destination = next(
+                    (c for c in node.children if c.type == "link_destination"), None
+                )
+                if label and destination:
+                    symbols.references.append(
+                        ReferenceDefinition(
+                            text(label).strip("[]"),
+                            text(destination),
+                            _span(document, node.start_byte, destination.end_byte),
+                        )
+                    )
+                    link = _link(document, text(destination), destination.start_byte)
+                    if link:
+                        symbols.links.append(link)
+            case "minus_metadata":
+                for line in text(node).splitlines():
+                    m = FRONT_MATTER_ITEM.match(line)
+                    if m:
+                        symbols.front_matter[m.group(1)] = m.group(2)
+    return symbols
+
+
+def document_symbols(
+    path: str,
+    document: DocumentTree,
+    is_cancelled: Optional[Callable[[], bool]] = None,
+) -> FileSymbols:
+    """Symbols of an open document, extracted once per version."""
+    return document.get_derived(
+        "symbols",
+        lambda document: symbols_from_document(
+            path, document, is_cancelled=is_cancelled
+        ),
+    )
+
+
+def index_files(jobs: List[FileJob]) -> List[Optional[FileSymbols]]:
+    """Runs in a worker process."""
+    results: List[Optional[FileSymbols]] = []
+    for job in jobs:
+        try:
+            utf8_bytes = pathlib.Path(job.path).read_bytes()
+        except OSError as e:
+            LOGGER.warning(e)
+            results.append(None)
+            continue
+        if job.cached and job.cached.digest == digest_of(utf8_bytes):
+            # touched but not modified
+            results.append(job.cached._replace(mtime_ns=job.mtime_ns, size=job.size))
+            continue
+        results.append(extract_symbols(job.path, utf8_bytes, job.mtime_ns, job.size))
+    return results
+
+
+def find_markdown_files(folders: Iterable[str]) -> List[Tuple[str, int, int]]:
+    """(path, mtime_ns, size) of the markdown files, skipping hidden folders."""
+    found = []
+    for folder in folders:
+        for root, dirs, files in os.walk(folder):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                if name.endswith(MARKDOWN_SUFFIXES):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    found.append((path, stat.st_mtime_ns, stat.st_size))
+    return found
+
+
+def default_cache_path(folders: Iterable[str]) -> pathlib.Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    key = hashlib.sha1("\n".join(sorted(folders)).encode("utf-8")).hexdigest()
+    return pathlib.Path(cache_home) / "tentiris" / f"index-{key}.pickle"
+
+
+def in_folders(path: str, folders: Iterable[str]) -> bool:
+    return any(
+        path.startswith(os.path.join(folder, "")) or path == folder
+        for folder in folders
+    )
+
+
+def span_contains(span: Span, line: int, character: int) -> bool:
+    return (span[0], span[1]) <= (line, character) <= (span[2], span[3])
+
+
+def resolve_link(source: str, link: LinkSymbol) -> str:
+    """Absolute path of the link target."""
+    if not link.path:
+        return source
+    return os.path.normpath(
+        os.path.join(os.path.dirname(source), urllib.parse.unquote(link.path))
+    )
+
+
+class WorkspaceIndex:
+    """Symbols of every markdown file under the workspace folders.
+
+    Files are parsed in a process pool. The index is persisted to an on-disk
+    cache, and a file is only parsed again if its mtime or size changed and
+    its content hash differs from the cached one.
+
+    ``backlinks`` maps a file to the files linking to it and ``anchors`` maps
+    a file to its headings by anchor, so navigation never walks a tree.
+    ``anchor_prefixes`` sorts the anchors of a file for completion and
+    ``paths`` holds the indexed files by folder for path completion and
+    ``symbols`` the headings for workspace/symbol. Files open in the editor
+    are indexed from their parsed document instead of the disk.
+
+    The sessions of a shared server scan their own workspace folders into
+    the one index, a scan replaces the files under its folders only.
+    ``is_open`` tells a file open in the editor of any session, a watched
+    file event does not index it from the disk.
+    """
+
+    def __init__(self, is_open: Callable[[str], bool] = lambda path: False):
+        self.files: Dict[str, FileSymbols] = {}
+        self.backlinks: Dict[str, Set[str]] = {}
+        self.anchors: Dict[str, Dict[str, HeadingSymbol]] = {}
+        self.anchor_prefixes: Dict[str, PrefixIndex[HeadingSymbol]] = {}
+        self.paths = PathTrie()
+        self.symbols: SymbolIndex[HeadingSymbol] = SymbolIndex()
+        self.lock = threading.Lock()
+        self.pending: Dict[str, bool] = {}
+        self.is_open = is_open
+        self._flush: Optional[asyncio.Future] = None
+        # workers of the process pool, the cpu count if None, 0 indexes in
+        # a thread of the event loop
+        self.max_processes: Optional[int] = None
+        self._executor: Optional[concurrent.futures.Executor] = None
+        self._symbols_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._symbols_build: Optional[concurrent.futures.Future] = None
+
+    @property
+    def executor(self) -> concurrent.futures.Executor:
+        if not self._executor:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.max_processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                # a spawned worker does not inherit --language-library
+                initializer=set_language_library,
+                initargs=(language_library(),),
+            )
+        return self._executor
+
+    def _add_links(self, symbols: FileSymbols) -> None:
+        self.anchors[symbols.path] = {h.anchor: h for h in symbols.headings}
+        self.anchor_prefixes[symbols.path] = PrefixIndex(
+            (h.anchor, h) for h in symbols.headings if h.anchor
+        )
+        self.paths.add(symbols.path)
+        self.symbols.put(symbols.path, ((h.title, h) for h in symbols.headings))
+        for link in symbols.links:
+            target = resolve_link(symbols.path, link)
+            self.backlinks.setdefault(target, set()).add(symbols.path)
+
+    def _remove_links(self, symbols: FileSymbols) -> None:
+        self.anchors.pop(symbols.path, None)
+        self.anchor_prefixes.pop(symbols.path, None)
+        for link in symbols.links:
+            target = resolve_link(symbols.path, link)
+            sources = self.backlinks.get(target)
+            if sources:
+                sources.discard(symbols.path)
+                if not sources:
+                    del self.backlinks[target]
+
+    def put(self, symbols: FileSymbols) -> None:
+        with self.lock:
+            previous = self.files.get(symbols.path)
+            if previous:
+                self._remove_links(previous)
+            self.files[symbols.path] = symbols
+            self._add_links(symbols)
+
+    def remove(self, path: str) -> None:
+        with self.lock:
+            previous = self.files.pop(path, None)
+            if previous:
+                self._remove_links(previous)
+                self.paths.remove(path)
+                self.symbols.remove(path)
+
+    def _replace_all(
+        self,
+        files: Dict[str, FileSymbols],
+        folders: Optional[List[str]] = None,
+        keep: Iterable[str] = (),
+    ) -> None:
+        """Replace every file, or the files under the folders. The files in
+        keep stay as they are now."""
+        with self.lock:
+            for path in keep:
+                if path in self.files:
+                    files[path] = self.files[path]
+            if folders is not None:
+                files = {
+                    **{
+                        path: symbols
+                        for path, symbols in self.files.items()
+                        if not in_folders(path, folders)
+                    },
+                    **files,
+                }
+            self.files = files
+            self.backlinks = {}
+            self.anchors = {}
+            self.anchor_prefixes = {}
+            self.paths.clear()
+            self.symbols.clear()
+            for symbols in files.values():
+                self._add_links(symbols)
+
+    def heading(self, path: str, anchor: str) -> Optional[HeadingSymbol]:
+        with self.lock:
+            return self.anchors.get(path, {}).get(anchor)
+
+    def complete_anchor(
+        self, path: str, prefix: str, limit: int
+    ) -> List[HeadingSymbol]:
+        """The first limit headings of the file whose anchor starts with
+        prefix."""
+        with self.lock:
+            anchors = self.anchor_prefixes.get(path)
+            if not anchors:
+                return []
+            return list(itertools.islice(anchors.complete(prefix), limit))
+
+    def complete_path(
+        self, folder: str, prefix: str, limit: int
+    ) -> List[Tuple[str, bool]]:
+        """(name, is_folder) of the first limit indexed entries in folder
+        starting with prefix."""
+        with self.lock:
+            return list(itertools.islice(self.paths.complete(folder, prefix), limit))
+
+    def links_to(
+        self, path: str, anchor: Optional[str] = None
+    ) -> List[Tuple[str, LinkSymbol]]:
+        """(source, link) of the links to the file, or to one of its headings."""
+        with self.lock:
+            sources = sorted(self.backlinks.get(path, ()))
+            found = []
+            for source in sources:
+                for link in self.files[source].links:
+                    if resolve_link(source, link) != path:
+                        continue
+                    if anchor is None or urllib.parse.unquote(link.anchor) == anchor:
+                        found.append((source, link))
+            return found
+
+    def search_headings(
+        self, query: str, limit: int
+    ) -> List[Tuple[str, HeadingSymbol]]:
+        """(path, heading) of the best fuzzy matches, best first."""
+        if self.symbols.needs_build:
+            self.build_symbols()
+        return self.symbols.search(query, limit)
+
+    def build_symbols(self) -> concurrent.futures.Future:
+        """Build the heading table in the background, one build at a time."""
+        if not self._symbols_build or self._symbols_build.done():
+            self._symbols_build = self._symbols_executor.submit(self.symbols.build)
+        return self._symbols_build
+
+    def update_document(self, path: str, document: DocumentTree) -> None:
+        """Index an open document from its tree, no parse of its own."""
+        self.put(document_symbols(path, document))
+
+    def load(self, cache_path: pathlib.Path) -> bool:
+        try:
+            with cache_path.open("rb") as f:
+                data = pickle.load(f)
+        except (
+            OSError,
+            EOFError,
+            pickle.UnpicklingError,
+            AttributeError,
+            TypeError,
+        ) as e:
+            # a TypeError is a NamedTuple pickled with other fields
+            LOGGER.info(f"no index cache: {e}")
+            return False
+        if data.get("version") != CACHE_VERSION:
+            return False
+        with self.lock:
+            # the files indexed for another session are newer
+            files = {**data["files"], **self.files}
+        self._replace_all(files)
+        return True
+
+    def save(
+        self, cache_path: pathlib.Path, folders: Optional[List[str]] = None
+    ) -> None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_path.with_suffix(".tmp")
+        with self.lock:
+            files = {
+                path: symbols
+                for path, symbols in self.files.items()
+                if (folders is None or in_folders(path, folders))
+                and not self.is_open(path)
+            }
+        with tmp.open("wb") as f:
+            pickle.dump(
+                {"version": CACHE_VERSION, "files": files},
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp, cache_path)
+
+    async def _index(
+        self,
+        jobs: List[FileJob],
+        on_result: Callable[[FileSymbols], None],
+        report: Optional[Callable[[int, int], None]] = None,
+    ) -> None:
+        if not jobs:
+            return
+        loop = asyncio.get_running_loop()
+        if len(jobs) <= CHUNK_SIZE or self.max_processes == 0:
+            # not worth a trip to the process pool, or there is none
+            futures = [loop.run_in_executor(None, index_files, jobs)]
+        else:
+            futures = [
+                loop.run_in_executor(
+                    self.executor, index_files, jobs[i : i + CHUNK_SIZE]
+                )
+                for i in range(0, len(jobs), CHUNK_SIZE)
+            ]
+        done = 0
+        for future in asyncio.as_completed(futures):
+            results = await future
+            for symbols in results:
+                if symbols:
+                    on_result(symbols)
+            done += len(results)
+            if report:
+                report(done, len(jobs))
+
+    async def scan(
+        self,
+        folders: List[str],
+        report: Optional[Callable[[int, int], None]] = None,
+        cache_path: Optional[pathlib.Path] = None,
+    ) -> None:
+        """Index the folders, reusing the cache for unchanged files."""
+        loop = asyncio.get_running_loop()
+        if cache_path and not any(in_folders(path, folders) for path in self.files):
+            # the first scan of the folders
+            await loop.run_in_executor(None, self.load, cache_path)
+
+        found = await loop.run_in_executor(None, find_markdown_files, folders)
+        files: Dict[str, FileSymbols] = {}
+        jobs: List[FileJob] = []
+        opened: List[str] = []
+        for path, mtime_ns, size in found:
+            if self.is_open(path) and path in self.files:
+                # indexed from the editor, not the disk
+                opened.append(path)
+                continue
+            cached = self.files.get(path)
+            if cached and cached.mtime_ns == mtime_ns and cached.size == size:
+                files[path] = cached
+            else:
+                jobs.append(FileJob(path, mtime_ns, size, cached))
+        LOGGER.info(f"index: {len(found)} files, {len(jobs)} to parse")
+
+        def on_result(symbols: FileSymbols):
+            files[symbols.path] = symbols
+
+        await self._index(jobs, on_result, report)
+
+        self._replace_all(files, folders, opened)
+        await asyncio.wrap_future(self.build_symbols())
+        if cache_path:
+            await loop.run_in_executor(None, self.save, cache_path, folders)
+
+    def queue_changes(self, changes: Iterable[Tuple[str, bool]]) -> asyncio.Future:
+        """Queue (path, deleted) events and apply them in one batch.
+
+        Files open when the batch is applied are skipped, the didChange path
+        indexes them.
+        """
+        for path, deleted in changes:
+            self.pending[path] = deleted
+        if not self._flush or self._flush.done():
+            self._flush = asyncio.ensure_future(self._apply_pending())
+        return self._flush
+
+    async def _apply_pending(self) -> None:
+        while True:
+            await asyncio.sleep(BATCH_SECONDS)
+            pending, self.pending = self.pending, {}
+            if not pending:
+                return
+            jobs: List[FileJob] = []
+            for path, deleted in pending.items():
+                if deleted:
+                    self.remove(path)
+                    continue
+                if self.is_open(path):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    self.remove(path)
+                    continue
+                jobs.append(
+                    FileJob(path, stat.st_mtime_ns, stat.st_size, self.files.get(path))
+                )
+            LOGGER.debug(f"index: {len(pending)} changes, {len(jobs)} to parse")
+            await self._index(jobs, self.put)
+            if self.symbols.needs_build:
+                self.build_symbols()
@@ -0,0 +1,47 @@
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import threading
+import lsprotocol.types as lsp_types
+from pygls.workspace import Workspace
+
+
+class FakeServer:
+    """The parts of a LanguageServer the feature handlers use: a workspace,
+    optionally with one open document, the thread pool and the messages sent
+    to the client.
+
+    The benchmarks drive the handlers with it too, see benchmarks.suite.
+    """
+
+    def __init__(
+        self,
+        uri: Optional[str] = None,
+        source: Optional[str] = None,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ):
+        self.workspace = Workspace("", lsp_types.TextDocumentSyncKind.Incremental)
+        if uri is not None:
+            self.workspace.put_document(
+                lsp_types.TextDocumentItem(
+                    uri=uri, language_id="markdown", version=1, text=source or ""
+                )
+            )
+        self.thread_pool_executor = executor
+        # semanticTokens/range schedules a validation on it
+        self.loop = mock.Mock()
+        self.notifications = []
+        # the thread each notification was sent from
+        self.notification_threads = []
+        # (uri, version) of publishDiagnostics
+        self.published = []
+
+    def show_message(self, *args, **kwargs):
+        pass
+
+    def send_notification(self, method, params=None):
+        self.notifications.append((method, params))
+        self.notification_threads.append(threading.current_thread())
+
+    def publish_diagnostics(self, uri, diagnostics, version=None):
+        self.published.append((uri, version))
@@ -0,0 +1,96 @@
+import unittest
+import io
+import json
+import os
+import pathlib
+import tempfile
+from tentiris import batch
+
+A = """# A
+
+## A
+
+[x](#nope)
+"""
+
+B = """# B
+
+```json
+{"a": }
+```
+"""
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = pathlib.Path(self.tmp.name)
+        (root / "sub").mkdir()
+        (root / ".hidden").mkdir()
+        (root / "a.md").write_text(A, encoding="utf-8")
+        (root / "sub" / "b.md").write_text(B, encoding="utf-8")
+        (root / ".hidden" / "c.md").write_text(A, encoding="utf-8")
+        (root / "ok.md").write_text("# ok\n", encoding="utf-8")
+        self.a = str(root / "a.md")
+        self.b = str(root / "sub" / "b.md")
+        self.ok = str(root / "ok.md")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_check(self):
+        out = io.StringIO()
+        self.assertEqual(1, batch.check([self.tmp.name], out, jobs=1))
+        self.assertEqual(
+            [
+                (self.a, 2, "hint", "Duplicate heading: A, linked as #a-1"),
+                (self.a, 4, "warning", "No heading found for anchor: #nope"),
+                (self.b, 3, "error", "Expecting value"),
+            ],
+            [
+                (d["path"], d["range"]["start"]["line"], d["severity"], d["message"])
+                for d in map(json.loads, out.getvalue().splitlines())
+            ],
+        )
+
+        # only errors fail
+        self.assertEqual(
+            0, batch.check([self.a, self.ok], io.StringIO(), jobs=1, fail_on="error")
+        )
+        self.assertEqual(1, batch.check([self.b], io.StringIO(), fail_on="error"))
+        self.assertEqual(0, batch.check([self.b], io.StringIO(), fail_on="never"))
+
+        # a missing file
+        out = io.StringIO()
+        missing = os.path.join(self.tmp.name, "missing.md")
+        self.assertEqual(1, batch.check([missing], out, fail_on="never"))
+        self.assertEqual(missing, json.loads(out.getvalue())["path"])
+
+    def test_sarif(self):
+        out = io.StringIO()
+        batch.check([self.b], out, format="sarif")
+        run = json.loads(out.getvalue())["runs"][0]
+        self.assertEqual("tentiris", run["tool"]["driver"]["name"])
+        (result,) = run["results"]
+        self.assertEqual("error", result["level"])
+        location = result["locations"][0]["physicalLocation"]
+        self.assertTrue(location["artifactLocation"]["uri"].endswith("sub/b.md"))
+        self.assertEqual(
+            {"startLine": 4, "startColumn": 7, "endLine": 4, "endColumn": 8},
+            location["region"],
+        )
+
+    def test_index(self):
+        out = io.StringIO()
+        self.assertEqual(0, batch.index([self.tmp.name], out, jobs=1))
+        files = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([self.a, self.ok, self.b], [f["path"] for f in files])
+        self.assertEqual(
+            [("A", "a"), ("A", "a-1")],
+            [(h["title"], h["anchor"]) for h in files[0]["headings"]],
+        )
+        self.assertEqual([{"path": "", "anchor": "nope", "line": 4}], files[0]["links"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+import os
+import tempfile
+import lsprotocol.types as lsp_types
+from pygls.uris import from_fs_path
+from tentiris import features
+from fake_server import FakeServer
+from tentiris.completion import CompletionContext, completion_context
+from tentiris.path_trie import PathTrie, PrefixIndex
+from tentiris.workspace_index import extract_symbols
+
+B = """# Install
+
+## Install on Linux
+"""
+
+
+class TestCompletionContext(unittest.TestCase):
+    def test_context(self):
+        cases = [
+            ("see [a](", CompletionContext("path", "", "")),
+            ("see [a](sub/b", CompletionContext("path", "sub/b", "b")),
+            ("see [a](b.md#ins", CompletionContext("anchor", "b.md", "ins")),
+            ("see [a](#", CompletionContext("anchor", "", "")),
+            ("[ref]: sub/", CompletionContext("path", "sub/", "")),
+            ("see [a][re", CompletionContext("reference", "", "re")),
+            ("see [a](b.md) and", None),
+            ("plain text", None),
+        ]
+        for prefix, expected in cases:
+            self.assertEqual(expected, completion_context(prefix), prefix)
+
+
+class TestPathTrie(unittest.TestCase):
+    def test_complete(self):
+        trie = PathTrie()
+        for path in ("/w/a.md", "/w/about.md", "/w/sub/b.md", "/x/c.md"):
+            trie.add(path)
+        self.assertEqual(
+            [("a.md", False), ("about.md", False)], list(trie.complete("/w", "a"))
+        )
+        self.assertEqual([("sub", True)], list(trie.complete("/w/", "s")))
+        trie.remove("/w/sub/b.md")
+        self.assertEqual([], list(trie.complete("/w", "s")))
+        self.assertEqual([], list(trie.complete("/nowhere", "")))
+
+    def test_prefix_index(self):
+        index = PrefixIndex((key, key.upper()) for key in ("ab", "b", "a", "abc"))
+        self.assertEqual(["A", "AB", "ABC"], list(index.complete("a")))
+        self.assertEqual(["AB", "ABC"], list(index.complete("ab")))
+        self.assertEqual([], list(index.complete("c")))
+
+
+class TestCompletions(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.a = os.path.join(self.tmp.name, "a.md")
+        self.b = os.path.join(self.tmp.name, "sub", "b.md")
+        features.WORKSPACE_INDEX.put(extract_symbols(self.a, b""))
+        features.WORKSPACE_INDEX.put(extract_symbols(self.b, B.encode()))
+        self.uri = from_fs_path(self.a)
+
+    def tearDown(self):
+        features.WORKSPACE_INDEX.remove(self.a)
+        features.WORKSPACE_INDEX.remove(self.b)
+        features.DOCUMENTS.close(self.uri)
+        self.tmp.cleanup()
+
+    def complete(self, source: str, token=None):
+        # every source is version 1
+        features.DOCUMENTS.close(self.uri)
+        ls = FakeServer(self.uri, source)
+        lines = source.splitlines()
+        result = features.completions(
+            ls,
+            lsp_types.CompletionParams(
+                text_document=lsp_types.TextDocumentIdentifier(uri=self.uri),
+                position=lsp_types.Position(
+                    line=len(lines) - 1, character=len(lines[-1])
+                ),
+                partial_result_token=token,
+            ),
+        )
+        return ls, result
+
+    def test_paths(self):
+        _, result = self.complete("see [b](su")
+        self.assertEqual(["sub/"], [item.label for item in result.items])
+        self.assertEqual(8, result.items[0].text_edit.range.start.character)
+
+        ls, result = self.complete("see [b](sub/")
+        self.assertEqual(["b.md"], [item.label for item in result.items])
+        # a path does not need the symbols of the document
+        document = features.get_document_tree(ls, self.uri)
+        self.assertNotIn("symbols", document.derived)
+
+    def test_limit(self):
+        paths = [os.path.join(self.tmp.name, f"x{i:03}.md") for i in range(300)]
+        for path in paths:
+            features.WORKSPACE_INDEX.put(extract_symbols(path, b""))
+        try:
+            _, result = self.complete("see [b](x")
+        finally:
+            for path in paths:
+                features.WORKSPACE_INDEX.remove(path)
+        self.assertTrue(result.is_incomplete)
+        self.assertEqual(
+            [f"x{i:03}.md" for i in range(features.MAX_COMPLETION_ITEMS)],
+            [item.label for item in result.items],
+        )
+
+    def test_anchors(self):
+        _, result = self.complete("see [b](sub/b.md#install-")
+        self.assertEqual(["install-on-linux"], [item.label for item in result.items])
+
+        _, result = self.complete("# Top\n\n[x][t]\n\n[top]: #t")
+        self.assertEqual(["top"], [item.label for item in result.items])
+
+    def test_references(self):
+        _, result = self.complete("[Top]: a.md\n\nsee [a][t")
+        self.assertEqual(["Top"], [item.label for item in result.items])
+
+    def test_code_block(self):
+        _, result = self.complete("```\n[b](su")
+        self.assertEqual([], result.items)
+
+    def test_partial_results(self):
+        ls, result = self.complete("see [b](", token="partial")
+        self.assertEqual([], result.items)
+        self.assertEqual(
+            [["a.md", "sub/"]],
+            [
+                sorted(item.label for item in params.value)
+                for _, params in ls.notifications
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
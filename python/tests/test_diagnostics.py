@@ -0,0 +1,94 @@
+import unittest
+from tentiris.features import treesitter_parse
+from tentiris.documents import DocumentTree, DocumentTreeStore
+from tentiris.diagnostics import MarkdownDiagnostics
+from tentiris.headings import slugify
+
+SOURCE = """# タイトル
+
+See [usage](#usage) and [missing](#nothing).
+
+Not a link: `[x](#not-a-heading)`, [second usage](<#usage-1>).
+
+### Usage
+
+## Usage
+
+```python
+print(1)
+"""
+
+
+def messages(diagnostics):
+    return [
+        (d.range.start.line, d.range.start.character, d.message) for d in diagnostics
+    ]
+
+
+class TestMarkdownDiagnostics(unittest.TestCase):
+    def test_slugify(self):
+        self.assertEqual("タイトル-1", slugify(" タイトル 1! "))
+        self.assertEqual("api_v2-usage", slugify("API_v2 Usage"))
+
+    def test_rules(self):
+        document = DocumentTree("file:///a.md", 1, SOURCE.encode(), treesitter_parse)
+        diagnostics = MarkdownDiagnostics().validate(document)
+        assert diagnostics is not None
+        self.assertEqual(
+            [
+                (6, 0, "Heading level skips from h1 to h3"),
+                (8, 0, "Duplicate heading: Usage, linked as #usage-1"),
+                (10, 0, "Unclosed code block"),
+                (2, 34, "No heading found for anchor: #nothing"),
+            ],
+            messages(diagnostics),
+        )
+
+    def test_json(self):
+        src = """```json
+{"a": 1,}
+```
+
+> ```JSON
+> {"a":
+> 1 x}
+> ```
+
+```json
+```
+"""
+        document = DocumentTree("file:///a.md", 1, src.encode(), treesitter_parse)
+        diagnostics = MarkdownDiagnostics().validate(document)
+        assert diagnostics is not None
+        self.assertEqual(
+            [
+                (1, 8, "Expecting property name enclosed in double quotes"),
+                # after the "> " of the quote
+                (6, 4, "Expecting ',' delimiter"),
+            ],
+            messages(diagnostics),
+        )
+
+    def test_cached_blocks(self):
+        store = DocumentTreeStore(treesitter_parse)
+        uri = "file:///a.md"
+        engine = MarkdownDiagnostics()
+        engine.validate(store.open(uri, 1, SOURCE))
+        cached = dict(engine.caches[uri])
+
+        document = store.get(uri, 2, "\n\n" + SOURCE)
+        diagnostics = engine.validate(document)
+        assert diagnostics
+        # all blocks were reused and the rows moved with them
+        for key, facts in engine.caches[uri].items():
+            self.assertIs(cached[key], facts)
+        self.assertEqual(8, diagnostics[0].range.start.line)
+
+    def test_stale(self):
+        src = b"# a\n\ntext\n\n" * 1000
+        document = DocumentTree("file:///a.md", 1, src, treesitter_parse)
+        self.assertIsNone(MarkdownDiagnostics().validate(document, lambda: True))
+
+
+if __name__ == "__main__":
+    unittest.main()
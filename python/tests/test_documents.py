@@ -0,0 +1,159 @@
+import unittest
+import threading
+import lsprotocol.types as lsp_types
+from pygls.workspace import Document
+from tentiris.features import treesitter_parse
+from tentiris.documents import DocumentTree, DocumentTreeStore, iter_ancestors
+
+SOURCE = """# 見出し
+
+本文 *text* です。
+
+## Sub
+
+- item
+"""
+
+
+def change(
+    start_line: int, start_char: int, end_line: int, end_char: int, text: str
+) -> lsp_types.TextDocumentContentChangeEvent:
+    return lsp_types.TextDocumentContentChangeEvent_Type1(
+        range=lsp_types.Range(
+            start=lsp_types.Position(line=start_line, character=start_char),
+            end=lsp_types.Position(line=end_line, character=end_char),
+        ),
+        text=text,
+    )
+
+
+class TestDocumentTreeStore(unittest.TestCase):
+    def assert_incremental(self, changes):
+        uri = "file:///sample.md"
+        store = DocumentTreeStore(treesitter_parse)
+        store.open(uri, 1, SOURCE)
+
+        doc = Document(uri, SOURCE)
+        for c in changes:
+            doc.apply_change(c)
+        document = store.change(uri, 2, changes)
+
+        assert document
+        self.assertEqual(doc.source.encode("utf-8"), document.utf8_bytes)
+        self.assertEqual(
+            treesitter_parse(document.utf8_bytes).root_node.sexp(),
+            document.tree.root_node.sexp(),
+        )
+
+    def test_insert_after_non_ascii(self):
+        self.assert_incremental([change(2, 2, 2, 2, "の")])
+
+    def test_insert_lines(self):
+        self.assert_incremental([change(4, 0, 4, 0, "# 新しい\n\n")])
+
+    def test_delete_across_lines(self):
+        self.assert_incremental([change(0, 2, 2, 3, "")])
+
+    def test_multiple_changes(self):
+        self.assert_incremental(
+            [change(6, 6, 6, 6, "\n- next"), change(0, 0, 0, 0, "> quote\n\n")]
+        )
+
+    def test_full_change(self):
+        self.assert_incremental(
+            [lsp_types.TextDocumentContentChangeEvent_Type2(text="# other\n")]
+        )
+
+    def test_change_while_locked(self):
+        uri = "file:///sample.md"
+        store = DocumentTreeStore(treesitter_parse)
+        first = store.open(uri, 1, SOURCE)
+        first.tree
+        locked = threading.Event()
+        release = threading.Event()
+
+        def handler():
+            # a handler in the thread pool reading the tree
+            with first.lock:
+                locked.set()
+                release.wait(5)
+
+        thread = threading.Thread(target=handler)
+        thread.start()
+        locked.wait(5)
+        # returns without waiting for the handler
+        second = store.change(uri, 2, [change(6, 6, 6, 6, "\n- next")])
+        third = store.change(uri, 3, [change(0, 0, 0, 0, "> quote\n\n")])
+        release.set()
+        thread.join()
+
+        assert second and third
+        # the versions in between are not kept alive by the pending edits
+        self.assertIs(first, (third._pending or ())[0])
+        self.assertEqual(
+            treesitter_parse(third.utf8_bytes).root_node.sexp(),
+            third.tree.root_node.sexp(),
+        )
+
+    def test_get_out_of_sync(self):
+        uri = "file:///sample.md"
+        store = DocumentTreeStore(treesitter_parse)
+        store.open(uri, 1, SOURCE)
+        document = store.get(uri, 3, "# new\n")
+        self.assertEqual(b"# new\n", document.utf8_bytes)
+        self.assertEqual(3, document.version)
+
+    def test_snapshot_derived(self):
+        uri = "file:///sample.md"
+        store = DocumentTreeStore(treesitter_parse)
+        store.open(uri, 1, SOURCE)
+        document = store.get(uri, 1, SOURCE)
+        calls = []
+        for _ in range(2):
+            document.get_derived("key", lambda d: calls.append(d.version))
+        self.assertEqual([1], calls)
+
+        changed = store.change(uri, 2, [change(0, 0, 0, 0, "x")])
+        assert changed
+        self.assertEqual({}, changed.derived)
+
+    def test_node_at(self):
+        document = DocumentTree(
+            "file:///sample.md", 1, "# a\n\npara\n\n```\nxx".encode(), treesitter_parse
+        )
+        cases = [
+            ((0, 0), "atx_h1_marker"),
+            # the end of the text before the cursor
+            ((0, 3), "inline"),
+            ((2, 0), "inline"),
+            ((2, 4), "inline"),
+            ((4, 1), "fenced_code_block_delimiter"),
+            ((5, 2), "code_fence_content"),
+        ]
+        for (line, character), expected in cases:
+            node = document.node_at(lsp_types.Position(line=line, character=character))
+            self.assertEqual(expected, node.type, (line, character))
+        self.assertEqual(
+            ["code_fence_content", "fenced_code_block", "section", "document"],
+            [
+                node.type
+                for node in iter_ancestors(
+                    document.node_at(lsp_types.Position(line=5, character=2))
+                )
+            ],
+        )
+
+    def test_lru_eviction(self):
+        store = DocumentTreeStore(treesitter_parse, max_bytes=len(SOURCE.encode()) * 2)
+        store.open("file:///a.md", 1, SOURCE)
+        store.open("file:///b.md", 1, SOURCE)
+        store.get("file:///a.md", 1, SOURCE)
+        store.open("file:///c.md", 1, SOURCE)
+        self.assertEqual(["file:///a.md", "file:///c.md"], list(store.documents))
+
+        store.close("file:///a.md")
+        self.assertEqual(len(SOURCE.encode()), store.total_bytes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+import unittest
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import lsprotocol.types as lsp_types
+from tentiris import execution, features
+from fake_server import FakeServer
+
+
+class TestPolicy(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(
+            {
+                lsp_types.TEXT_DOCUMENT_COMPLETION: "loop",
+                "tentiris.stats": "thread",
+            },
+            execution.parse_policy(
+                ["textDocument/completion=loop", "tentiris.stats=thread"]
+            ),
+        )
+        with self.assertRaises(ValueError):
+            execution.parse_policy(["textDocument/completion=process"])
+        with self.assertRaises(ValueError):
+            execution.parse_policy(["textDocument/didChange=thread"])
+
+    def test_set(self):
+        try:
+            execution.set_policy({lsp_types.TEXT_DOCUMENT_COMPLETION: "loop"})
+            self.assertEqual("loop", execution.mode(lsp_types.TEXT_DOCUMENT_COMPLETION))
+            self.assertEqual(
+                "thread", execution.mode(lsp_types.TEXT_DOCUMENT_DOCUMENT_SYMBOL)
+            )
+            self.assertEqual("loop", execution.mode(lsp_types.TEXT_DOCUMENT_RENAME))
+        finally:
+            execution.set_policy({})
+
+
+class TestRunInThread(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.ls = FakeServer(executor=self.executor)
+
+    async def asyncTearDown(self):
+        self.executor.shutdown()
+
+    async def test_notifications_from_the_loop(self):
+        def handler(ls, params):
+            ls.send_notification("$/progress", params)
+            return threading.current_thread()
+
+        lock = threading.RLock()
+        thread = await execution.run_in_thread(self.ls, handler, 1, lock=lock)
+        self.assertIsNot(threading.current_thread(), thread)
+        await asyncio.sleep(0)
+        self.assertEqual([("$/progress", 1)], self.ls.notifications)
+        self.assertEqual([threading.current_thread()], self.ls.notification_threads)
+
+    async def test_cancel(self):
+        started = threading.Event()
+        release = threading.Event()
+        ran = []
+
+        def blocking(ls, params):
+            started.set()
+            release.wait(5)
+            ran.append(params)
+            execution.check_cancelled()
+            return params
+
+        running = asyncio.ensure_future(
+            execution.run_in_thread(self.ls, blocking, "running")
+        )
+        # queued behind it in the single worker
+        queued = asyncio.ensure_future(
+            execution.run_in_thread(self.ls, blocking, "queued")
+        )
+        while not started.is_set():
+            # the loop goes on meanwhile
+            await asyncio.sleep(0.01)
+        running.cancel()
+        queued.cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        for task in (running, queued):
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        await asyncio.get_running_loop().run_in_executor(self.executor, lambda: None)
+        self.assertEqual(["running"], ran)
+        self.assertFalse(execution.is_cancelled())
+
+    async def test_superseded(self):
+        def handler(ls, params):
+            # like a newer version of the document
+            execution.cancel_when(lambda: True)
+            return features._parse(b"- item *a*\n" * 100_000)
+
+        with self.assertRaises(execution.RequestCancelled):
+            await execution.run_in_thread(self.ls, handler, None)
+        # the parse of the next request starts over
+        tree = await execution.run_in_thread(
+            self.ls, lambda ls, src: features._parse(src), b"# a\n"
+        )
+        self.assertEqual("document", tree.root_node.type)
+
+    async def test_document_symbol_cancelled(self):
+        uri = "untitled:cancelled.md"
+        self.ls.workspace.put_document(
+            lsp_types.TextDocumentItem(
+                uri=uri,
+                language_id="markdown",
+                version=1,
+                text="# heading\n\ntext\n\n" * 5_000,
+            )
+        )
+        params = lsp_types.DocumentSymbolParams(
+            text_document=lsp_types.TextDocumentIdentifier(uri=uri)
+        )
+        # parsed already, only the outline is left to cancel
+        features.get_document_tree(self.ls, uri).tree
+        walked = []
+
+        def handler(ls, params):
+            def is_superseded():
+                walked.append(1)
+                return True
+
+            execution.cancel_when(is_superseded)
+            return features.document_symbol(ls, params)
+
+        try:
+            with self.assertRaises(execution.RequestCancelled):
+                await execution.run_in_thread(self.ls, handler, params)
+            # stopped at the first checkpoint of the section walk
+            self.assertEqual(1, len(walked))
+            symbols = await execution.run_in_thread(
+                self.ls, features.document_symbol, params
+            )
+            self.assertEqual(5_000, len(symbols))
+        finally:
+            features._close(uri, None)
+
+
+if __name__ == "__main__":
+    unittest.main()
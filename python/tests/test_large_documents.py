@@ -0,0 +1,113 @@
+import unittest
+import lsprotocol.types as lsp_types
+from tentiris import features
+from fake_server import FakeServer
+from tentiris.large_documents import SETTINGS, Regions, Settings
+
+URI = "untitled:large.md"
+
+# a heading, filler and two links far apart
+SOURCE = (
+    "# Top\n\n"
+    + "text\n\n" * 100
+    + "[near](#nowhere) [top](#top)\n\n"
+    + "text\n\n" * 100
+    + "[far](#nowhere)\n"
+)
+
+
+def change(line: int, end: int, text: str):
+    return lsp_types.TextDocumentContentChangeEvent_Type1(
+        range=lsp_types.Range(
+            start=lsp_types.Position(line=line, character=0),
+            end=lsp_types.Position(line=end, character=0),
+        ),
+        text=text,
+    )
+
+
+class TestRegions(unittest.TestCase):
+    def test_edits(self):
+        regions = Regions()
+        self.assertTrue(regions.show(URI, (10, 20)))
+        self.assertFalse(regions.show(URI, (10, 20)))
+        regions.edit(URI, [change(30, 30, "a\nb\n")])
+        regions.edit(URI, [change(22, 22, "x")])
+        self.assertEqual([(10, 20), (22, 22), (30, 32)], regions.rows(URI))
+
+        # two lines removed above the regions move them up
+        regions.edit(URI, [change(0, 2, "")])
+        self.assertEqual([(0, 0), (8, 18), (20, 20), (28, 30)], regions.rows(URI))
+
+        regions.edit(URI, [lsp_types.TextDocumentContentChangeEvent_Type2(text="")])
+        self.assertEqual([], regions.rows(URI))
+
+    def test_settings(self):
+        settings = Settings()
+        settings.update({"largeDocumentBytes": 10, "editedRegions": "many"})
+        self.assertEqual(
+            {"largeDocumentBytes": 10, "editedRegions": 4}, settings.snapshot()
+        )
+
+
+class TestLargeDocuments(unittest.TestCase):
+    def setUp(self):
+        self.threshold = SETTINGS.large_document_bytes
+        SETTINGS.large_document_bytes = 100
+        self.ls = FakeServer(URI, SOURCE)
+        self.text_document = lsp_types.TextDocumentIdentifier(uri=URI)
+
+    def tearDown(self):
+        SETTINGS.large_document_bytes = self.threshold
+        features._close(URI, None)
+
+    def visible(self, first: int, last: int) -> lsp_types.SemanticTokens:
+        return features.semantic_tokens_range(
+            self.ls,
+            lsp_types.SemanticTokensRangeParams(
+                text_document=self.text_document,
+                range=lsp_types.Range(
+                    start=lsp_types.Position(line=first, character=0),
+                    end=lsp_types.Position(line=last, character=0),
+                ),
+            ),
+        )
+
+    def test_range_only(self):
+        self.assertIsNone(
+            features.semantic_tokens(
+                self.ls,
+                lsp_types.SemanticTokensParams(text_document=self.text_document),
+            )
+        )
+        self.assertTrue(self.visible(195, 205).data)
+        self.ls.loop.call_soon_threadsafe.assert_called_once()
+        # the blocks of the range only
+        self.assertLess(len(features.HIGHLIGHTER.caches[URI]), 10)
+        self.visible(0, 5)
+        self.assertLess(len(features.HIGHLIGHTER.caches[URI]), 10)
+
+    def test_diagnostics(self):
+        document = features.get_document_tree(self.ls, URI)
+        self.assertEqual([], features._validate(document, lambda: False))
+
+        features.REGIONS.show(document.key, (195, 205))
+        diagnostics = features._validate(document, lambda: False)
+        assert diagnostics is not None
+        # the anchor of the heading outside of the region is known
+        self.assertEqual(
+            [(202, "No heading found for anchor: #nowhere")],
+            [(d.range.start.line, d.message) for d in diagnostics],
+        )
+        self.assertLess(len(features.MARKDOWN_DIAGNOSTICS.caches[URI]), 10)
+        # the anchors come from the outline, no walk of the whole tree
+        self.assertNotIn("symbols", document.derived)
+
+        SETTINGS.large_document_bytes = 0
+        diagnostics = features._validate(document, lambda: False)
+        assert diagnostics is not None
+        self.assertEqual(2, len(diagnostics))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import unittest
+import os
+import tempfile
+import lsprotocol.types as lsp_types
+from pygls.uris import from_fs_path
+from tentiris import features
+from fake_server import FakeServer
+from tentiris.workspace_index import extract_symbols
+
+A = """# Usage
+
+Go to [install](b.md#install), [again](b.md#install) or [top](#usage).
+"""
+
+B = """# Install
+
+[back](a.md#usage)
+"""
+
+
+class TestNavigation(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.a = os.path.join(self.tmp.name, "a.md")
+        self.b = os.path.join(self.tmp.name, "b.md")
+        for path, source in ((self.a, A), (self.b, B)):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(source)
+            features.WORKSPACE_INDEX.put(extract_symbols(path, source.encode()))
+        self.a_uri = from_fs_path(self.a)
+        self.b_uri = from_fs_path(self.b)
+        self.ls = FakeServer(self.a_uri, A)
+
+    def tearDown(self):
+        features.WORKSPACE_INDEX.remove(self.a)
+        features.WORKSPACE_INDEX.remove(self.b)
+        features.DOCUMENTS.close(self.a_uri)
+        self.tmp.cleanup()
+
+    def position(self, line: int, character: int):
+        return {
+            "text_document": lsp_types.TextDocumentIdentifier(uri=self.a_uri),
+            "position": lsp_types.Position(line=line, character=character),
+        }
+
+    def test_definition(self):
+        location = features.definition(
+            self.ls, lsp_types.DefinitionParams(**self.position(2, 25))
+        )
+        self.assertEqual(self.b_uri, location.uri)
+        self.assertEqual(0, location.range.start.line)
+
+        self.assertIsNone(
+            features.definition(
+                self.ls, lsp_types.DefinitionParams(**self.position(2, 0))
+            )
+        )
+
+    def test_references(self):
+        locations = features.references(
+            self.ls,
+            lsp_types.ReferenceParams(
+                context=lsp_types.ReferenceContext(include_declaration=True),
+                **self.position(0, 3),
+            ),
+        )
+        self.assertEqual(
+            [(self.a_uri, 0), (self.b_uri, 2), (self.a_uri, 2)],
+            [(location.uri, location.range.start.line) for location in locations],
+        )
+
+        # from a link, without the heading
+        locations = features.references(
+            self.ls,
+            lsp_types.ReferenceParams(
+                context=lsp_types.ReferenceContext(include_declaration=False),
+                **self.position(2, 25),
+            ),
+        )
+        self.assertEqual(
+            [(2, 16), (2, 39)],
+            [
+                (location.range.start.line, location.range.start.character)
+                for location in locations
+            ],
+        )
+
+    def test_rename(self):
+        prepared = features.prepare_rename(
+            self.ls, lsp_types.PrepareRenameParams(**self.position(2, 25))
+        )
+        self.assertEqual("Install", prepared.placeholder)
+        self.assertEqual(21, prepared.range.start.character)
+
+        edit = features.rename(
+            self.ls,
+            lsp_types.RenameParams(new_name="Getting Started", **self.position(2, 25)),
+        )
+        self.assertEqual(
+            [(0, 2, "Getting Started")],
+            [
+                (e.range.start.line, e.range.start.character, e.new_text)
+                for e in edit.changes[self.b_uri]
+            ],
+        )
+        self.assertEqual(
+            [(2, 21, 28, "getting-started"), (2, 44, 51, "getting-started")],
+            [
+                (
+                    e.range.start.line,
+                    e.range.start.character,
+                    e.range.end.character,
+                    e.new_text,
+                )
+                for e in edit.changes[self.a_uri]
+            ],
+        )
+
+    def test_workspace_symbol(self):
+        symbols = features.workspace_symbol(
+            self.ls, lsp_types.WorkspaceSymbolParams(query="instal")
+        )
+        self.assertEqual(
+            [("Install", self.b_uri, 0, "b.md")],
+            [
+                (s.name, s.location.uri, s.location.range.start.line, s.container_name)
+                for s in symbols
+            ],
+        )
+
+        symbols = features.workspace_symbol(
+            self.ls,
+            lsp_types.WorkspaceSymbolParams(query="sage", partial_result_token="p"),
+        )
+        self.assertEqual([], symbols)
+        self.assertEqual(
+            [["Usage"]],
+            [[s.name for s in params.value] for _, params in self.ls.notifications],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+import lsprotocol.types as lsp_types
+from tentiris.documents import DocumentTree
+from tentiris.outline import Outliner
+from tentiris.parser_pool import treesitter_parse
+
+URI = "file:///outline.md"
+SOURCE = """# title
+
+text
+
+## sub *one*
+
+```
+code
+```
+
+Setext
+------
+
+> ### quoted
+
+# second
+
+- a
+- b
+"""
+
+
+def document(source: str, version: int = 1, session=None) -> DocumentTree:
+    return DocumentTree(
+        URI, version, source.encode(), treesitter_parse, session=session
+    )
+
+
+def names(symbols):
+    return [(s.name, names(s.children)) for s in symbols]
+
+
+class TestOutline(unittest.TestCase):
+    def test_symbols(self):
+        outline = Outliner().outline(document(SOURCE))
+        self.assertEqual(
+            [
+                (
+                    "title",
+                    [
+                        ("sub *one*", []),
+                        ("Setext", [("quoted", [])]),
+                    ],
+                ),
+                ("second", []),
+            ],
+            names(outline.symbols),
+        )
+        title, second = outline.symbols
+        self.assertEqual(lsp_types.Position(line=0, character=0), title.range.start)
+        # trailing blank lines are not part of the heading
+        self.assertEqual(lsp_types.Position(line=13, character=12), title.range.end)
+        self.assertEqual(
+            lsp_types.Range(
+                start=lsp_types.Position(line=4, character=0),
+                end=lsp_types.Position(line=4, character=12),
+            ),
+            title.children[0].selection_range,
+        )
+        self.assertEqual(lsp_types.Position(line=18, character=3), second.range.end)
+
+    def test_folding_ranges(self):
+        outline = Outliner().outline(document(SOURCE))
+        self.assertEqual(
+            [
+                (0, 13, "region"),
+                (4, 8, "region"),
+                (6, 8, None),
+                (10, 13, "region"),
+                (15, 18, "region"),
+                (17, 18, None),
+            ],
+            [(f.start_line, f.end_line, f.kind) for f in outline.folding_ranges],
+        )
+
+    def test_edit(self):
+        outliner = Outliner()
+        before = outliner.outline(document(SOURCE))
+        cached = dict(outliner.caches[URI].contents)
+        after = outliner.outline(document("new line\n" + SOURCE, 2))
+        # the same sections one row below
+        self.assertEqual(
+            [s.range.start.line + 1 for s in before.symbols],
+            [s.range.start.line for s in after.symbols],
+        )
+        self.assertTrue(set(cached) & set(outliner.caches[URI].contents))
+
+        edited = outliner.outline(document(SOURCE.replace("# second", "# 2nd"), 3))
+        self.assertEqual(["title", "2nd"], [s.name for s in edited.symbols])
+        outliner.release(URI)
+        self.assertNotIn(URI, outliner.caches)
+
+    def test_sessions(self):
+        outliner = Outliner()
+        # the same uri with other unsaved changes in two editors
+        outliner.outline(document(SOURCE, session=1))
+        cache = outliner.caches[(1, URI)]
+        outliner.outline(document("# other\n", session=2))
+        self.assertEqual({(1, URI), (2, URI)}, set(outliner.caches))
+        self.assertIs(cache, outliner.caches[(1, URI)])
+
+
+if __name__ == "__main__":
+    unittest.main()
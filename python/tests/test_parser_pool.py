@@ -0,0 +1,71 @@
+import unittest
+import threading
+import os
+from unittest import mock
+from tentiris import parser_pool
+from tentiris.parser_pool import (
+    ParserPool,
+    ParseCancelled,
+    ParseTimeout,
+    language_library,
+    load_language,
+)
+
+LARGE = b"# title\n\nsome *text*\n\n- a\n- b\n" * 20000
+
+
+class TestParserPool(unittest.TestCase):
+    def test_reuse_per_thread(self):
+        pool = ParserPool("markdown")
+        self.assertIs(pool.get(), pool.get())
+
+        parsers = []
+        thread = threading.Thread(target=lambda: parsers.append(pool.get()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(pool.get(), parsers[0])
+
+    def test_cancel(self):
+        pool = ParserPool("markdown", slice_micros=1000)
+        with self.assertRaises(ParseCancelled):
+            pool.parse(LARGE, is_cancelled=lambda: True)
+        # the parser starts over after a cancel
+        src = b"# other\n"
+        self.assertEqual(len(src), pool.parse(src).root_node.end_byte)
+
+    def test_timeout(self):
+        pool = ParserPool("markdown", slice_micros=1000)
+        with self.assertRaises(ParseTimeout):
+            pool.parse(LARGE, timeout=0)
+
+    def test_sliced_parse(self):
+        pool = ParserPool("markdown", slice_micros=1000)
+        tree = pool.parse(LARGE, is_cancelled=lambda: False)
+        self.assertEqual(
+            ParserPool("markdown").parse(LARGE).root_node.sexp(),
+            tree.root_node.sexp(),
+        )
+
+    def test_language_library(self):
+        # next to the package, not relative to the working directory
+        with mock.patch.dict(os.environ, clear=True):
+            self.assertTrue(os.path.isabs(language_library()))
+            self.assertEqual(
+                str(parser_pool.PACKAGE_LANGUAGE_LIBRARY), language_library()
+            )
+        with mock.patch.dict(os.environ, {parser_pool.LANGUAGE_LIBRARY_ENV: "env.dll"}):
+            self.assertEqual("env.dll", language_library())
+            parser_pool.set_language_library("option.dll")
+            try:
+                self.assertEqual("option.dll", language_library())
+            finally:
+                parser_pool.set_language_library(None)
+
+        # loaded once, on first use
+        self.assertIs(load_language("markdown"), ParserPool("markdown").language)
+        with self.assertRaises(AttributeError):
+            load_language("no_such_grammar")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,287 @@
+import unittest
+from types import SimpleNamespace
+import lsprotocol.types as lsp_types
+from tentiris import features
+from fake_server import FakeServer
+from tentiris.documents import DocumentTree
+from tentiris.execution import RequestCancelled
+from tentiris.parser_pool import treesitter_parse
+from tentiris.injections import load_grammar
+from tentiris.semantic_tokens import (
+    Highlighter,
+    SemanticToken,
+    SemanticTokensEncoder,
+    TOKEN_MODIFIERS,
+    TOKEN_TYPES,
+    flatten,
+)
+
+URI = "file:///sample.md"
+SOURCE = """# title
+
+- a
+- b
+
+## sub
+
+- c
+"""
+
+
+def apply(previous, edits):
+    data = list(previous)
+    for edit in reversed(edits):
+        data[edit.start : edit.start + edit.delete_count] = edit.data or []
+    return data
+
+
+class TestSemanticTokens(unittest.TestCase):
+    def test_edits(self):
+        cases = [
+            ([1, 2, 3], [1, 2, 3]),
+            ([1, 2, 3], [1, 9, 3]),
+            ([1, 2, 3], [1, 2, 3, 4, 5]),
+            ([1, 2, 3, 4, 5], [4, 5]),
+            ([], [1]),
+            ([1, 1, 1], [1, 1]),
+        ]
+        for previous, data in cases:
+            edits = features.semantic_tokens_edits(previous, data)
+            self.assertEqual(data, apply(previous, edits))
+        self.assertEqual([], features.semantic_tokens_edits([1, 2], [1, 2]))
+
+    def test_highlight(self):
+        src = b"""> a *b
+> c* d
+
+| x |
+|---|
+| `1` |
+"""
+        document = DocumentTree(URI, 1, src, treesitter_parse)
+        highlighter = Highlighter()
+        tokens = [
+            (
+                token.start,
+                src.splitlines()[token.start[0]][token.start[1] :][: token.byte_len],
+                token.type,
+            )
+            for token in highlighter.tokens(document)
+        ]
+        self.assertEqual(
+            [
+                ((0, 0), b"> ", "keyword"),
+                ((0, 4), b"*", "operator"),
+                # the emphasis continues after the "> " of the next line
+                ((0, 5), b"b", "parameter"),
+                ((1, 0), b"> ", "keyword"),
+                ((1, 2), b"c", "parameter"),
+                ((1, 3), b"*", "operator"),
+                ((3, 0), b"|", "keyword"),
+                ((3, 2), b"x ", "class"),
+                ((3, 4), b"|", "keyword"),
+                ((4, 0), b"|---|", "keyword"),
+                ((5, 0), b"|", "keyword"),
+                ((5, 2), b"`", "operator"),
+                ((5, 3), b"1", "string"),
+                ((5, 4), b"`", "operator"),
+                ((5, 6), b"|", "keyword"),
+            ],
+            tokens,
+        )
+
+        # an unchanged block is not captured again
+        cache = highlighter.caches[URI]
+        self.assertEqual(2, len(cache))
+        edited = DocumentTree(URI, 2, src + b"\nnew *p*\n", treesitter_parse)
+        highlighter.tokens(edited)
+        self.assertEqual(3, len(highlighter.caches[URI]))
+        for key, inline in cache.items():
+            self.assertIs(inline, highlighter.caches[URI][key])
+
+    def test_embedded(self):
+        src = b"""> ```json
+> {"a": true}
+> ```
+
+```unknown
+x
+```
+"""
+        document = DocumentTree(URI, 1, src, treesitter_parse)
+        tokens = [
+            (
+                token.start,
+                src.splitlines()[token.start[0]][token.start[1] :][: token.byte_len],
+                token.type,
+            )
+            for token in Highlighter().tokens(document)
+        ]
+        self.assertEqual(
+            [
+                ((0, 0), b"> ", "keyword"),
+                ((0, 2), b"```", "operator"),
+                ((0, 5), b"json", "type"),
+                ((1, 0), b"> ", "keyword"),
+                # parsed as json without the "> "
+                ((1, 3), b'"a"', "property"),
+                ((1, 6), b":", "operator"),
+                ((1, 8), b"true", "keyword"),
+                ((2, 0), b"> ", "keyword"),
+                ((2, 2), b"```", "operator"),
+                ((4, 0), b"```", "operator"),
+                ((4, 3), b"unknown", "type"),
+                # no grammar
+                ((5, 0), b"x", "string"),
+                ((6, 0), b"```", "operator"),
+            ],
+            tokens,
+        )
+        # a grammar that is not in the library
+        self.assertIsNone(load_grammar("no_such_grammar"))
+
+    def test_flatten(self):
+        a, b, c = ("a", []), ("b", []), ("c", [])
+        self.assertEqual(
+            [(0, 2, a), (2, 3, b), (3, 4, c), (4, 5, b), (5, 8, a)],
+            list(flatten([(0, 8, a, 0), (2, 5, b, 0), (3, 4, c, 1), (6, 6, c, 0)])),
+        )
+        # not nested, cut at the enclosing capture
+        self.assertEqual(
+            [(0, 2, a), (2, 4, b)],
+            list(flatten([(0, 4, a, 0), (2, 9, b, 0)])),
+        )
+
+    def test_encoder(self):
+        src = "# 見出し\r\n\n𠮷 *a* b\nline\n".encode()
+        document = DocumentTree(URI, 1, src, treesitter_parse)
+        encoder = SemanticTokensEncoder(["a", "b"], ["m"])
+        tokens = [
+            # "見出し", 3 utf-16 units
+            SemanticToken((0, 2), 9, "a", ["m"]),
+            # "*a*" after a surrogate pair and a space
+            SemanticToken((2, 5), 3, "b", []),
+            # not in the legend
+            SemanticToken((2, 9), 1, "c", []),
+            # "b" to "li", split per line
+            SemanticToken((2, 9), 4, "a", []),
+        ]
+        self.assertEqual(
+            [0, 2, 3, 0, 1] + [2, 3, 3, 1, 0] + [0, 4, 1, 0, 0] + [1, 0, 2, 0, 0],
+            encoder.encode(tokens, document).tolist(),
+        )
+
+        # a multiline token before a token in it
+        tokens = [
+            SemanticToken((2, 9), 4, "a", []),
+            SemanticToken((3, 0), 1, "b", []),
+            SemanticToken((2, 5), 1, "b", []),
+        ]
+        self.assertEqual(
+            [2, 3, 1, 1, 0] + [0, 4, 1, 0, 0] + [1, 0, 1, 1, 0] + [0, 0, 2, 0, 0],
+            encoder.encode(tokens, document).tolist(),
+        )
+
+    def test_range_cache(self):
+        highlighter = Highlighter()
+        src = b"".join(b"paragraph *%d*\n\n" % i for i in range(20))
+        highlighter.tokens(DocumentTree(URI, 1, src, treesitter_parse))
+        full = highlighter.caches[URI]
+        # scrolling over edited versions
+        for version in range(2, 12):
+            src = b"edited *%d*\n\n" % version + src
+            document = DocumentTree(URI, version, src, treesitter_parse)
+            highlighter.tokens(document, (0, 39))
+        self.assertIs(full, highlighter.caches[URI])
+        # the blocks of the last range only
+        self.assertEqual(20, len(highlighter.partial[URI]))
+
+        highlighter.tokens(document)
+        self.assertEqual(30, len(highlighter.caches[URI]))
+        self.assertNotIn(URI, highlighter.partial)
+
+    def test_cancel(self):
+        src = "".join(f"paragraph *{i}*\n\n" for i in range(600)).encode()
+        document = DocumentTree(URI, 1, src, treesitter_parse)
+        highlighter = Highlighter()
+        with self.assertRaises(RequestCancelled):
+            highlighter.tokens(document, is_cancelled=lambda: True)
+        # the blocks highlighted before the cancel are reused
+        self.assertGreater(len(highlighter.partial[URI]), 0)
+        tokens = highlighter.tokens(document)
+        self.assertEqual(600, len(highlighter.caches[URI]))
+        self.assertNotIn(URI, highlighter.partial)
+
+        encoder = SemanticTokensEncoder(TOKEN_TYPES, TOKEN_MODIFIERS)
+        with self.assertRaises(RequestCancelled):
+            encoder.encode(tokens, document, lambda: True)
+        self.assertEqual(
+            encoder.encode(tokens, document).tolist(),
+            encoder.encode(tokens, document, lambda: False).tolist(),
+        )
+
+    def test_delta(self):
+        ls = FakeServer(URI, SOURCE)
+        doc = lsp_types.TextDocumentIdentifier(uri=URI)
+        full = features.semantic_tokens(
+            ls, lsp_types.SemanticTokensParams(text_document=doc)
+        )
+
+        ls.workspace.get_document(URI).apply_change(
+            lsp_types.TextDocumentContentChangeEvent_Type2(text=SOURCE + "- d\n")
+        )
+        ls.workspace.get_document(URI).version = 2
+        delta = features.semantic_tokens_delta(
+            ls,
+            lsp_types.SemanticTokensDeltaParams(
+                text_document=doc, previous_result_id=full.result_id
+            ),
+        )
+        assert isinstance(delta, lsp_types.SemanticTokensDelta)
+        self.assertNotEqual(full.result_id, delta.result_id)
+        src = (SOURCE + "- d\n").encode()
+        self.assertEqual(
+            features.to_relative(
+                features.semantic_tokens_from_utf8bytes(src),
+                TOKEN_TYPES,
+                DocumentTree(URI, 2, src, treesitter_parse),
+                TOKEN_MODIFIERS,
+            ).data,
+            apply(full.data, delta.edits),
+        )
+
+        # unknown result_id falls back to the full token array
+        full_again = features.semantic_tokens_delta(
+            ls,
+            lsp_types.SemanticTokensDeltaParams(
+                text_document=doc, previous_result_id="unknown"
+            ),
+        )
+        self.assertIsInstance(full_again, lsp_types.SemanticTokens)
+
+    def test_range(self):
+        ls = FakeServer(URI, SOURCE)
+        tokens = features.semantic_tokens_range(
+            ls,
+            lsp_types.SemanticTokensRangeParams(
+                text_document=lsp_types.TextDocumentIdentifier(uri=URI),
+                range=lsp_types.Range(
+                    start=lsp_types.Position(line=5, character=0),
+                    end=lsp_types.Position(line=7, character=0),
+                ),
+            ),
+        )
+        keyword = TOKEN_TYPES.index("keyword")
+        heading = TOKEN_TYPES.index("class")
+        declaration = 1 << TOKEN_MODIFIERS.index("declaration")
+        # "##", "sub" and "- "
+        self.assertEqual(
+            [5, 0, 2, keyword, 0]
+            + [0, 3, 3, heading, declaration]
+            + [2, 0, 2, keyword, 0],
+            tokens.data,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import unittest
+import asyncio
+import itertools
+import json
+from tentiris import features
+from tentiris.__main__ import init_language_server
+from tentiris.sessions import SessionServer
+
+URI = "untitled:shared.md"
+
+
+def caches_of(caches: dict, uri: str):
+    """The keys of the uri in every session."""
+    return [key for key in caches if key[1] == uri]
+
+
+class Client:
+    """A minimal LSP client over TCP."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.ids = itertools.count(1)
+
+    def send(self, message: dict):
+        body = json.dumps({"jsonrpc": "2.0", **message}).encode("utf-8")
+        self.writer.write(f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+
+    def notify(self, method: str, params: dict):
+        self.send({"method": method, "params": params})
+
+    async def request(self, method: str, params: dict):
+        id = next(self.ids)
+        self.send({"id": id, "method": method, "params": params})
+        while True:
+            headers = await self.reader.readuntil(b"\r\n\r\n")
+            length = next(
+                int(line.split(b":")[1])
+                for line in headers.split(b"\r\n")
+                if line.lower().startswith(b"content-length")
+            )
+            message = json.loads(await self.reader.readexactly(length))
+            # skip notifications like publishDiagnostics
+            if message.get("id") == id and "method" not in message:
+                return message["result"]
+
+    async def initialize(self):
+        await self.request(
+            "initialize", {"processId": None, "rootUri": None, "capabilities": {}}
+        )
+        self.notify("initialized", {})
+
+    def open(self, text: str):
+        self.notify(
+            "textDocument/didOpen",
+            {
+                "textDocument": {
+                    "uri": URI,
+                    "languageId": "markdown",
+                    "version": 1,
+                    "text": text,
+                }
+            },
+        )
+
+    async def symbols(self):
+        result = await self.request(
+            "textDocument/documentSymbol", {"textDocument": {"uri": URI}}
+        )
+        return [symbol["name"] for symbol in result]
+
+    async def semantic_tokens(self):
+        result = await self.request(
+            "textDocument/semanticTokens/full", {"textDocument": {"uri": URI}}
+        )
+        return result["data"]
+
+
+class TestSessions(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = SessionServer(
+            init_language_server,
+            features.end_session,
+            loop=asyncio.get_running_loop(),
+        )
+        tcp = await self.server.serve_tcp("127.0.0.1", 0)
+        self.port = tcp.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        await self.server.close()
+        self.server.thread_pool_executor.shutdown()
+
+    async def connect(self) -> Client:
+        client = Client(*await asyncio.open_connection("127.0.0.1", self.port))
+        await client.initialize()
+        return client
+
+    async def test_document_overlays(self):
+        one = await self.connect()
+        two = await self.connect()
+        self.assertEqual(2, len(self.server.sessions))
+
+        # the same uri with unsaved changes of its own in each editor
+        one.open("# One\n")
+        two.open("# Two\n\n## Sub\n")
+        self.assertEqual(["One"], await one.symbols())
+        self.assertEqual(["Two"], await two.symbols())
+        # each editor highlights its own contents
+        self.assertNotEqual(await one.semantic_tokens(), await two.semantic_tokens())
+        self.assertEqual(2, len(caches_of(features.HIGHLIGHTER.caches, URI)))
+        one.notify(
+            "textDocument/didChange",
+            {
+                "textDocument": {"uri": URI, "version": 2},
+                "contentChanges": [{"text": "# Uno\n"}],
+            },
+        )
+        self.assertEqual(["Uno"], await one.symbols())
+        self.assertEqual(["Two"], await two.symbols())
+
+        # latencies of both sessions, recorded by the handler wrappers
+        stats = await one.request(
+            "workspace/executeCommand", {"command": "tentiris.stats", "arguments": []}
+        )
+        self.assertGreaterEqual(
+            stats["requests"]["textDocument/documentSymbol"]["count"], 4
+        )
+
+        # still open in the other editor
+        one.notify("textDocument/didClose", {"textDocument": {"uri": URI}})
+        self.assertEqual(["Two"], await two.symbols())
+        self.assertTrue(features.DOCUMENTS.is_open(URI))
+        # the outline of the other editor only
+        self.assertEqual(1, len(caches_of(features.OUTLINER.caches, URI)))
+        self.assertEqual(1, len(caches_of(features.HIGHLIGHTER.caches, URI)))
+
+        # a disconnect closes the documents left open
+        two.writer.close()
+        await two.writer.wait_closed()
+        for _ in range(100):
+            if len(self.server.sessions) == 1:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(1, len(self.server.sessions))
+        self.assertFalse(features.DOCUMENTS.is_open(URI))
+        self.assertEqual([], caches_of(features.OUTLINER.caches, URI))
+        self.assertEqual([], caches_of(features.HIGHLIGHTER.caches, URI))
+        one.writer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import asyncio
+import pathlib
+import tempfile
+import time
+from tentiris import profiling
+from tentiris.documents import DocumentTree
+from tentiris.parser_pool import treesitter_parse
+from tentiris.semantic_tokens import Highlighter
+from tentiris.stats import STATS, Histogram, Stats
+
+
+class TestStats(unittest.TestCase):
+    def test_histogram(self):
+        histogram = Histogram()
+        for ms in (0.05, 3, 3, 4, 40, 9000):
+            histogram.add(ms / 1e3)
+        self.assertEqual(6, histogram.count)
+        self.assertEqual(5, histogram.percentile(50))
+        self.assertEqual(9000, histogram.percentile(99))
+        snapshot = histogram.snapshot()
+        self.assertEqual([[0.1, 1], [5, 3], [50, 1], [None, 1]], snapshot["buckets"])
+
+    def test_snapshot(self):
+        stats = Stats()
+        stats.record("textDocument/completion", 0.004)
+        stats.record_parse(0.002, incremental=True)
+        stats.cache("highlight", 3, 1)
+        snapshot = stats.snapshot()
+        self.assertEqual(1, snapshot["requests"]["textDocument/completion"]["count"])
+        self.assertEqual({"parse.incremental": 1}, snapshot["counters"])
+        self.assertEqual(0.75, snapshot["caches"]["highlight"]["hit_ratio"])
+        self.assertIn("textDocument/completion n=1", stats.log_line())
+
+    def test_block_cache_hits(self):
+        src = b"# a\n\ntext\n\n- b\n"
+        highlighter = Highlighter()
+        highlighter.tokens(DocumentTree("file:///a.md", 1, src, treesitter_parse))
+        before = list(STATS.caches["highlight"])
+        highlighter.tokens(DocumentTree("file:///a.md", 2, src, treesitter_parse))
+        hits, misses = STATS.caches["highlight"]
+        self.assertEqual(before[1], misses)
+        self.assertGreater(hits, before[0])
+
+
+class TestLoopLag(unittest.IsolatedAsyncioTestCase):
+    async def test_lag(self):
+        stats = Stats()
+        stats.watch_loop(asyncio.get_running_loop(), interval=0.01)
+        await asyncio.sleep(0.02)
+        # a handler blocking the loop
+        time.sleep(0.06)
+        await asyncio.sleep(0.02)
+        self.assertGreater(stats.loop_lag.max, 30)
+
+
+class TestProfiling(unittest.IsolatedAsyncioTestCase):
+    async def test_profile(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for mode in profiling.PROFILE_MODES:
+                result = await profiling.profile(mode, 0.05, tmp)
+                self.assertTrue(pathlib.Path(result["path"]).exists(), mode)
+                self.assertTrue(result["summary"])
+            with self.assertRaises(ValueError):
+                await profiling.profile("perf", 0.05, tmp)
+
+
+if __name__ == "__main__":
+    unittest.main()
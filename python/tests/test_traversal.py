@@ -0,0 +1,110 @@
+import unittest
+import sys
+from tentiris.execution import CHECK_INTERVAL, RequestCancelled
+from tentiris.parser_pool import treesitter_parse
+from tentiris.traversal import Preorder, postorder
+
+SOURCE = b"""# title
+
+text
+
+- a
+- b
+"""
+
+
+def recursive_preorder(node, result):
+    result.append(node)
+    for child in node.children:
+        recursive_preorder(child, result)
+    return result
+
+
+class TestTraversal(unittest.TestCase):
+    def test_preorder(self):
+        root = treesitter_parse(SOURCE).root_node
+        self.assertEqual(recursive_preorder(root, []), list(Preorder(root)))
+
+        # a subtree only
+        section = root.children[0]
+        self.assertEqual(recursive_preorder(section, []), list(Preorder(section)))
+
+    def test_skip_and_types(self):
+        root = treesitter_parse(SOURCE).root_node
+        walk = Preorder(root)
+        types = []
+        for node in walk:
+            types.append(node.type)
+            if node.type in ("atx_heading", "list_item"):
+                walk.skip()
+        self.assertEqual(
+            [
+                "document",
+                "section",
+                "atx_heading",
+                "paragraph",
+                "inline",
+                "list",
+                "list_item",
+                "list_item",
+            ],
+            types,
+        )
+        self.assertEqual(
+            ["list_marker_minus", "list_marker_minus"],
+            [node.type for node in Preorder(root, types=("list_marker_minus",))],
+        )
+        # the heading has one more
+        self.assertEqual(
+            ["inline", "inline", "inline"],
+            [
+                node.type
+                for node in Preorder(
+                    root, types=("inline",), skip_types=("atx_heading",)
+                )
+            ],
+        )
+
+    def test_cancel(self):
+        root = treesitter_parse(SOURCE * 100).root_node
+        visited = []
+        with self.assertRaises(RequestCancelled):
+            for node in Preorder(root, is_cancelled=lambda: True):
+                visited.append(node)
+        # checked every CHECK_INTERVAL nodes
+        self.assertEqual(CHECK_INTERVAL - 1, len(visited))
+        self.assertEqual(
+            len(recursive_preorder(root, [])),
+            len(list(Preorder(root, is_cancelled=lambda: False))),
+        )
+
+    def test_postorder(self):
+        root = treesitter_parse(SOURCE).root_node
+        nodes = list(postorder(root))
+        key = lambda node: (node.start_byte, node.end_byte, node.type)
+        self.assertEqual(
+            sorted(map(key, recursive_preorder(root, []))), sorted(map(key, nodes))
+        )
+        self.assertEqual(root, nodes[-1])
+        for i, node in enumerate(nodes):
+            # children come before their parent
+            for child in node.children:
+                self.assertLess(nodes.index(child), i)
+
+    def test_deep_nesting(self):
+        src = "".join("  " * i + "- x\n" for i in range(200)).encode()
+        root = treesitter_parse(src).root_node
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(100)
+        try:
+            walk = Preorder(root)
+            depth = max(walk.depth for _ in walk)
+            count = sum(1 for _ in postorder(root))
+        finally:
+            sys.setrecursionlimit(limit)
+        self.assertGreater(depth, 400)
+        self.assertEqual(sum(1 for _ in Preorder(root)), count)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from tentiris import features, parser_pool
+from tentiris.features import treesitter_parse
+from tentiris.documents import DocumentTree
+from tentiris.validation import ValidationScheduler
+from fake_server import FakeServer
+
+
+def document(version: int) -> DocumentTree:
+    return DocumentTree("file:///a.md", version, b"# a\n", treesitter_parse)
+
+
+class TestValidationScheduler(unittest.IsolatedAsyncioTestCase):
+    async def test_debounce(self):
+        ls = FakeServer(executor=ThreadPoolExecutor(max_workers=2))
+        validated = []
+
+        def validate(document, is_stale):
+            validated.append(document.version)
+            return []
+
+        scheduler = ValidationScheduler(validate, delay=0.05)
+        tasks = [scheduler.schedule(ls, document(version)) for version in range(3)]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.assertEqual([2], validated)
+        self.assertEqual([("file:///a.md", 2)], ls.published)
+
+    async def test_drop_stale_result(self):
+        ls = FakeServer(executor=ThreadPoolExecutor(max_workers=2))
+        scheduler = ValidationScheduler(lambda document, is_stale: [], delay=0)
+
+        def validate(document, is_stale):
+            # a newer version arrives while validating
+            scheduler.latest[document.uri] = None
+            return [] if not is_stale() else None
+
+        scheduler.validate = validate
+        await scheduler.schedule(ls, document(1))
+        self.assertEqual([], ls.published)
+
+
+class TestStaleValidation(unittest.TestCase):
+    def setUp(self):
+        self.slice_micros = parser_pool.MD_PARSERS.slice_micros
+        parser_pool.MD_PARSERS.slice_micros = 1
+
+    def tearDown(self):
+        parser_pool.MD_PARSERS.slice_micros = self.slice_micros
+
+    def test_parse_stops(self):
+        source = "".join(f"# {i}\n\ntext [link](#{i})\n\n" for i in range(1000))
+        stale = DocumentTree("file:///a.md", 1, source.encode(), features._parse)
+        self.assertIsNone(features._validate(stale, lambda: True))
+        self.assertIsNone(stale._tree)
+
+        document = DocumentTree("file:///a.md", 2, source.encode(), features._parse)
+        self.assertEqual([], features._validate(document, lambda: False))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+import unittest
+import asyncio
+import os
+import pathlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from tentiris import parser_pool
+from tentiris.symbol_index import SymbolIndex
+from tentiris.workspace_index import WorkspaceIndex, extract_symbols
+
+SOURCE = """---
+title: サンプル
+tags: a, b
+---
+# サンプル
+
+See [b](sub/b.md#usage), [top](#サンプル) and [site](https://example.com).
+
+[ref]: b.md
+"""
+
+
+class TestWorkspaceIndex(unittest.TestCase):
+    def test_extract_symbols(self):
+        symbols = extract_symbols("a.md", SOURCE.encode())
+        self.assertEqual({"title": "サンプル", "tags": "a, b"}, symbols.front_matter)
+        self.assertEqual(
+            [(1, "サンプル", "サンプル", (4, 0, 4, 6), (4, 2, 4, 6))],
+            [tuple(h) for h in symbols.headings],
+        )
+        self.assertEqual(
+            [
+                ("sub/b.md", "usage", (6, 8, 6, 22)),
+                ("", "サンプル", (6, 31, 6, 36)),
+                ("b.md", "", (8, 7, 8, 11)),
+            ],
+            [tuple(link) for link in symbols.links],
+        )
+        self.assertEqual(["ref"], [r.label for r in symbols.references])
+
+    def test_link_in_code_span(self):
+        source = "# Intro\n\nsee [x](#intro) and `[y](#intro)` ![z](#intro)\n"
+        symbols = extract_symbols("a.md", source.encode())
+        self.assertEqual(
+            [("", "intro", (2, 8, 2, 14))], [tuple(link) for link in symbols.links]
+        )
+
+
+class TestSymbolIndex(unittest.TestCase):
+    def test_search(self):
+        index = SymbolIndex()
+        index.put(
+            "a.md",
+            [
+                (title, title)
+                for title in (
+                    "Installation guide",
+                    "Install",
+                    "Reinstall",
+                    "Uninstalling",
+                    "Usage",
+                    "Getting-Started",
+                )
+            ],
+        )
+        index.put("b.md", [("Install", "b")])
+        index.build()
+
+        def search(query: str, limit: int = 10):
+            return [value for _, value in index.search(query, limit)]
+
+        # equal, prefix, word prefix, substring, shorter first
+        self.assertEqual(
+            ["Install", "b", "Installation guide", "Reinstall", "Uninstalling"],
+            search("install"),
+        )
+        self.assertEqual(["Install", "b"], search("install", 2))
+        # a slug matches its title
+        self.assertEqual(["Getting-Started"], search("getting started"))
+        # words in any order, a typo
+        self.assertEqual("Installation guide", search("gide instalation")[0])
+        self.assertEqual(["Usage"], search("us"))
+
+        # after the build: changed files are scanned
+        index.put("a.md", [("Usage", "a2")])
+        index.put("c.md", [("Install notes", "c")])
+        index.remove("b.md")
+        self.assertEqual(["c"], search("install"))
+        self.assertEqual(["a2"], search("usage"))
+        index.build()
+        self.assertEqual({}, index.changed)
+        self.assertEqual(["c"], search("install"))
+
+
+class TestWorkspaceScan(unittest.IsolatedAsyncioTestCase):
+    async def test_scan_with_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = pathlib.Path(tmp)
+            (root / "a.md").write_text(SOURCE, encoding="utf-8")
+            (root / ".hidden").mkdir()
+            (root / ".hidden" / "x.md").write_text("# x\n")
+            cache_path = root / "cache" / "index.pickle"
+
+            index = WorkspaceIndex()
+            index._executor = ThreadPoolExecutor()
+            reports = []
+            await index.scan([tmp], lambda *args: reports.append(args), cache_path)
+            self.assertEqual([str(root / "a.md")], list(index.files))
+            self.assertEqual([(1, 1)], reports)
+
+            # touched but not modified: reused from the cache by its digest
+            a = index.files[str(root / "a.md")]
+            os.utime(root / "a.md", ns=(0, 0))
+            restarted = WorkspaceIndex()
+            restarted._executor = ThreadPoolExecutor()
+            await restarted.scan([tmp], None, cache_path)
+            b = restarted.files[str(root / "a.md")]
+            self.assertEqual(0, b.mtime_ns)
+            self.assertEqual(a.headings, b.headings)
+
+    async def test_scan_open_document(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = pathlib.Path(tmp)
+            a = root / "a.md"
+            a.write_text("# Saved\n", encoding="utf-8")
+            cache_path = root / "cache" / "index.pickle"
+
+            index = WorkspaceIndex(lambda path: path == str(a))
+            index._executor = ThreadPoolExecutor()
+            index.put(extract_symbols(str(a), b"# Edited\n"))
+            await index.scan([tmp], None, cache_path)
+            self.assertEqual(
+                ["Edited"], [h.title for h in index.files[str(a)].headings]
+            )
+
+            # the editor contents are not cached as the file
+            restarted = WorkspaceIndex()
+            self.assertTrue(restarted.load(cache_path))
+            self.assertEqual({}, restarted.files)
+
+    async def test_watched_changes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = pathlib.Path(tmp)
+            a = root / "a.md"
+            b = root / "sub" / "b.md"
+            b.parent.mkdir()
+            a.write_text(SOURCE, encoding="utf-8")
+            b.write_text("# B\n", encoding="utf-8")
+
+            c = root / "c.md"
+            index = WorkspaceIndex(lambda path: path == str(c))
+            await index.scan([tmp])
+            self.assertEqual({str(a)}, index.backlinks[str(b)])
+
+            # one batch: c is open in the editor, a loses its links and is
+            # closed in another, b is deleted
+            c.write_text("[b](sub/b.md)\n", encoding="utf-8")
+            a.write_text("# no links\n", encoding="utf-8")
+            index.queue_changes([(str(c), False)])
+            b.unlink()
+            await index.queue_changes([(str(a), False), (str(b), True)])
+            self.assertEqual([str(a)], list(index.files))
+            self.assertNotIn(str(b), index.backlinks)
+
+    async def test_worker_language_library(self):
+        library = parser_pool._language_library
+        parser_pool.set_language_library("custom/my-languages.dll")
+        index = WorkspaceIndex()
+        index.max_processes = 1
+        try:
+            # a spawned worker, like --language-library given to the server
+            seen = await asyncio.get_running_loop().run_in_executor(
+                index.executor, parser_pool.language_library
+            )
+        finally:
+            parser_pool.set_language_library(library)
+            index.executor.shutdown()
+        self.assertEqual("custom/my-languages.dll", seen)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -22,8 +22,10 @@ function getClientOptions(): LanguageClientOptions {
         ],
         outputChannelName: "tentiris",
         synchronize: {
-            // Notify the server about file changes to '.clientrc files contain in the workspace
-            fileEvents: workspace.createFileSystemWatcher("**/.clientrc"),
+            // Notify the server about markdown files changed outside of the editor
+            fileEvents: workspace.createFileSystemWatcher("**/*.{md,markdown}"),
+            // didChangeConfiguration for the large document thresholds
+            configurationSection: "Tentiris",
         },
     };
 }